@@ -2,13 +2,15 @@ import numpy as np
 import sklearn
 from scipy.sparse import issparse
 from sklearn.ensemble import (ExtraTreesClassifier, ExtraTreesRegressor,
-                              GradientBoostingRegressor, RandomForestClassifier,
+                              GradientBoostingRegressor,
+                              HistGradientBoostingClassifier,
+                              HistGradientBoostingRegressor, RandomForestClassifier,
                               RandomForestRegressor)
 from sklearn.feature_selection import (SelectKBest, VarianceThreshold, f_classif,
                                        mutual_info_classif)
 from sklearn.gaussian_process import GaussianProcessRegressor
 from sklearn.kernel_ridge import KernelRidge
-from sklearn.linear_model import BayesianRidge
+from sklearn.linear_model import BayesianRidge, LogisticRegression, Ridge
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.svm import SVC, SVR
@@ -30,8 +32,12 @@ def get_estimator_by_name(est_name):
                          decisiontreeregressor=DecisionTreeRegressor,
                          gaussianprocessregressor=GaussianProcessRegressor,
                          gradientboostingregressor=GradientBoostingRegressor,
+                         histgradientboostingclassifier=HistGradientBoostingClassifier,
+                         histgradientboostingregressor=HistGradientBoostingRegressor,
                          kernelridge=KernelRidge,
                          bayesianridge=BayesianRidge,
+                         logisticregression=LogisticRegression,
+                         ridge=Ridge,
                          )
 
     return map_to_method.get(est_name.lower(), 'Estimator_Not_Processed_Yet')
@@ -666,6 +672,116 @@ def get_xgboostregressor(reduced_dim=None,
     return xgb, est_name, param_grid
 
 
+def _get_hist_gradient_boosting_params_ranges(grid_search_level):
+    """Parameter ranges for histogram-based gradient boosting"""
+
+    grid_search_level = grid_search_level.lower()
+    if grid_search_level in ['exhaustive']:
+        range_max_depth = [2, 6, None]
+        range_max_leaf_nodes = [15, 31, 63]
+        range_min_samples_leaf = [5, 20]
+        range_l2_regularization = [0.0, 1.0, 10.0]
+        range_learning_rate = [0.05, 0.1, 0.3]
+
+    elif grid_search_level in ['light']:
+        range_max_depth = [2, 6]
+        range_max_leaf_nodes = [31, ]
+        range_min_samples_leaf = [5, 20]
+        range_l2_regularization = [0.0, 1.0]
+        range_learning_rate = [0.1, 0.3]
+
+    elif grid_search_level in ['none']:  # single point on the hyperparameter grid
+        range_max_depth = [None, ]
+        range_max_leaf_nodes = [31, ]
+        range_min_samples_leaf = [20, ]
+        range_l2_regularization = [0.0, ]
+        range_learning_rate = [0.1, ]
+
+    else:
+        raise ValueError('Unrecognized option to set level of grid search.')
+
+    # number of iterations is not searched: it is chosen by early stopping
+    param_list_values = [('max_depth', range_max_depth),
+                         ('max_leaf_nodes', range_max_leaf_nodes),
+                         ('min_samples_leaf', range_min_samples_leaf),
+                         ('l2_regularization', range_l2_regularization),
+                         ('learning_rate', range_learning_rate),
+                         ]
+
+    return param_list_values
+
+
+def _hist_gradient_boosting_params():
+    """Early stopping on an internal validation split, common to both tasks"""
+
+    return dict(max_iter=cfg.hist_boosting_max_iter,
+                early_stopping=True,
+                validation_fraction=cfg.hist_boosting_validation_fraction,
+                n_iter_no_change=cfg.hist_boosting_n_iter_no_change)
+
+
+def get_HistGradientBoostingClassifier(reduced_dim=None,
+                                       grid_search_level=cfg.GRIDSEARCH_LEVEL_DEFAULT):
+    """
+    Returns the histogram-based gradient boosting classifier and its parameter grid.
+
+    Much faster than exact gradient boosting on large number of samplets, with the
+    number of boosting iterations chosen by early stopping.
+
+    Parameters
+    ----------
+    reduced_dim : int
+        One of the dimensionalities to be tried.
+
+    grid_search_level : str
+        If 'light', grid search resolution will be reduced to speed up optimization.
+        If 'exhaustive', most values for most parameters will be used for
+        optimization.
+
+    Returns
+    -------
+
+    """
+
+    est_name = 'hist_gb_clf'
+    param_grid = make_parameter_grid(
+            est_name, _get_hist_gradient_boosting_params_ranges(grid_search_level))
+    hgb = HistGradientBoostingClassifier(**_hist_gradient_boosting_params())
+
+    return hgb, est_name, param_grid
+
+
+def get_HistGradientBoostingRegressor(reduced_dim=None,
+                                      grid_search_level=cfg.GRIDSEARCH_LEVEL_DEFAULT):
+    """
+    Returns the histogram-based gradient boosting regressor and its parameter grid.
+
+    Much faster than exact gradient boosting on large number of samplets, with the
+    number of boosting iterations chosen by early stopping.
+
+    Parameters
+    ----------
+    reduced_dim : int
+        One of the dimensionalities to be tried.
+
+    grid_search_level : str
+        If 'light', grid search resolution will be reduced to speed up optimization.
+        If 'exhaustive', most values for most parameters will be used for
+        optimization.
+
+    Returns
+    -------
+
+    """
+
+    est_name = 'hist_gb_regr'
+    param_grid = make_parameter_grid(
+            est_name, _get_hist_gradient_boosting_params_ranges(grid_search_level))
+    hgb = HistGradientBoostingRegressor(**_hist_gradient_boosting_params())
+
+    return hgb, est_name, param_grid
+
+
 def get_estimator(est_name=cfg.default_classifier,
                   reduced_dim='all',
                   grid_search_level=cfg.GRIDSEARCH_LEVEL_DEFAULT):
@@ -709,9 +825,15 @@ def get_estimator(est_name=cfg.default_classifier,
                          decisiontreeclassifier=get_DecisionTreeClassifier,
                          svm=get_svc,
                          xgboost=get_xgboost,
+                         histgradientboostingclassifier=get_HistGradientBoostingClassifier,
+                         logisticregression=get_LogisticRegression,
                          randomforestregressor=get_RandomForestRegressor,
                          extratreesregressor=get_ExtraTreesRegressor,
                          gradientboostingregressor=get_GradientBoostingRegressor,
+                         histgradientboostingregressor=get_HistGradientBoostingRegressor,
+                         svr=get_SVR,
+                         kernelridge=get_KernelRidge,
+                         ridge=get_Ridge,
                          xgboostregressor=get_xgboostregressor)
 
     if est_name not in map_to_method:
@@ -719,6 +841,10 @@ def get_estimator(est_name=cfg.default_classifier,
                                   'Implemented estimators: {}'
                                   ''.format(est_name, list(map_to_method.keys())))
 
+    # these search the exhaustive grid, without trying every point on it
+    if grid_search_level.lower() in cfg.GRIDSEARCH_LEVELS_ON_EXHAUSTIVE_GRID:
+        grid_search_level = cfg.EXHAUSTIVE_GRID_LEVEL
+
     est_builder = map_to_method[est_name]
     est, est_name, param_grid = est_builder(reduced_dim, grid_search_level)
 
@@ -835,7 +961,8 @@ def get_pipeline(train_class_sizes, feat_sel_size, num_features,
                  preproc_name='robustscaler',
                  fsr_name=cfg.default_dim_red_method,
                  clfr_name=cfg.default_classifier,
-                 gs_level=cfg.GRIDSEARCH_LEVEL_DEFAULT):
+                 gs_level=cfg.GRIDSEARCH_LEVEL_DEFAULT,
+                 memory=None):
     """
     Constructor for pipeline (feature selection followed by a classifier).
 
@@ -867,6 +994,10 @@ def get_pipeline(train_class_sizes, feat_sel_size, num_features,
         If 'exhaustive', most values for most parameters will be user for
         optimization.
 
+    memory : str or object or None
+        If not None, caches the fitted steps preceding the estimator, as in
+        sklearn.pipeline.Pipeline.
+
     Returns
     -------
     pipeline : sklearn.pipeline.Pipeline
@@ -896,7 +1027,7 @@ def get_pipeline(train_class_sizes, feat_sel_size, num_features,
     steps = [(preproc_name, preproc),
              (fs_name, feat_selector),
              (est_name, estimator)]
-    pipeline = Pipeline(steps)
+    pipeline = Pipeline(steps, memory=memory)
 
     return pipeline, param_grid
 
@@ -922,8 +1053,13 @@ def make_pipeline(pred_model,
                   reduced_dim,
                   train_set_size,
                   preproc_name=cfg.default_preprocessing_method,
-                  gs_level=cfg.GRIDSEARCH_LEVEL_DEFAULT):
-    """Constructor for sklearn pipeline. Generic version of get_pipeline"""
+                  gs_level=cfg.GRIDSEARCH_LEVEL_DEFAULT,
+                  memory=None):
+    """Constructor for sklearn pipeline. Generic version of get_pipeline.
+
+    memory, if not None, caches the fitted steps preceding the estimator, as in
+    sklearn.pipeline.Pipeline.
+    """
 
     # preproc, preproc_name, preproc_param_grid = get_preprocessor(preproc_name)
     estimator, est_name, est_param_grid = get_estimator(pred_model, reduced_dim,
@@ -942,7 +1078,7 @@ def make_pipeline(pred_model,
         # (deconf_name, deconf),
         (dr_name, dim_reducer),
         (est_name, estimator)]
-    pipeline = Pipeline(steps)
+    pipeline = Pipeline(steps, memory=memory)
     return pipeline, param_grid
 
 
@@ -1142,6 +1278,208 @@ def get_GradientBoostingRegressor(reduced_dim=None,
     return gbr, est_name, param_grid
 
 
+def get_SVR(reduced_dim=None, grid_search_level=cfg.GRIDSEARCH_LEVEL_DEFAULT):
+    """
+    Returns the support vector regressor and its parameter grid.
+
+    Parameters
+    ----------
+    reduced_dim : int
+        One of the dimensionalities to be tried.
+
+    grid_search_level : str
+        If 'light', grid search resolution will be reduced to speed up optimization.
+        If 'exhaustive', most values for most parameters will be used for
+        optimization.
+
+    Returns
+    -------
+
+    """
+
+    grid_search_level = grid_search_level.lower()
+    if grid_search_level in ['exhaustive']:
+        range_penalty = np.power(10.0, range(-3, 6))
+        range_epsilon = [0.01, 0.1, 0.5]
+        range_kernel = ['linear', 'poly', 'rbf']
+        range_degree = [1, 2, 3]
+        range_gamma = ['auto', ]
+        range_gamma.extend(np.power(2.0, range(-5, 5)))
+        range_coef0 = np.sort(np.hstack((np.arange(-100, 101, 50),
+                                         np.arange(-1.0, 1.01, 0.25))))
+
+    elif grid_search_level in ['light']:
+        range_penalty = np.power(10.0, range(-3, 5, 1))
+        range_epsilon = [0.1, ]
+        range_kernel = ['rbf']
+        range_gamma = list(np.power(2.0, range(-5, 4, 1)))
+        range_coef0 = [0.0, ]
+        range_degree = [1, ]
+
+    elif grid_search_level in ['none']:  # single point on the hyper-parameter grid
+        range_penalty = [10.0, ]
+        range_epsilon = [0.1, ]
+        range_kernel = ['rbf']
+        range_gamma = ['auto', ]
+        range_coef0 = [0.0, ]
+        range_degree = [1, ]
+    else:
+        raise ValueError('Unrecognized option to set level of grid search.')
+
+    est_name = 'svr'
+    param_list_values = [('C', range_penalty),
+                         ('epsilon', range_epsilon),
+                         ('kernel', range_kernel),
+                         ('degree', range_degree),
+                         ('gamma', range_gamma),
+                         ('coef0', range_coef0),
+                         ]
+    param_grid = make_parameter_grid(est_name, param_list_values)
+
+    return SVR(), est_name, param_grid
+
+
+def get_KernelRidge(reduced_dim=None,
+                    grid_search_level=cfg.GRIDSEARCH_LEVEL_DEFAULT):
+    """
+    Returns the kernel ridge regressor and its parameter grid.
+
+    Parameters
+    ----------
+    reduced_dim : int
+        One of the dimensionalities to be tried.
+
+    grid_search_level : str
+        If 'light', grid search resolution will be reduced to speed up optimization.
+        If 'exhaustive', most values for most parameters will be used for
+        optimization.
+
+    Returns
+    -------
+
+    """
+
+    grid_search_level = grid_search_level.lower()
+    if grid_search_level in ['exhaustive']:
+        range_alpha = np.power(10.0, range(-4, 4))
+        range_kernel = ['linear', 'poly', 'rbf']
+        range_degree = [1, 2, 3]
+        range_gamma = list(np.power(2.0, range(-5, 5)))
+        range_coef0 = [0.0, 0.5, 1.0]
+
+    elif grid_search_level in ['light']:
+        range_alpha = np.power(10.0, range(-3, 3))
+        range_kernel = ['rbf']
+        range_gamma = list(np.power(2.0, range(-5, 4, 1)))
+        range_coef0 = [1.0, ]
+        range_degree = [3, ]
+
+    elif grid_search_level in ['none']:  # single point on the hyper-parameter grid
+        range_alpha = [1.0, ]
+        range_kernel = ['rbf']
+        range_gamma = [None, ]
+        range_coef0 = [1.0, ]
+        range_degree = [3, ]
+    else:
+        raise ValueError('Unrecognized option to set level of grid search.')
+
+    est_name = 'kernel_ridge'
+    param_list_values = [('alpha', range_alpha),
+                         ('kernel', range_kernel),
+                         ('degree', range_degree),
+                         ('gamma', range_gamma),
+                         ('coef0', range_coef0),
+                         ]
+    param_grid = make_parameter_grid(est_name, param_list_values)
+
+    return KernelRidge(), est_name, param_grid
+
+
+def get_LogisticRegression(reduced_dim=None,
+                           grid_search_level=cfg.GRIDSEARCH_LEVEL_DEFAULT):
+    """
+    Returns the regularized logistic regression and its parameter grid.
+
+    The penalty is an elastic net: l1_ratio of 0 is the L2 penalty and 1 is the
+    L1 penalty, so all three are searched on the same grid. Being linear, it is
+    suitable for use at full dimensionality.
+
+    Parameters
+    ----------
+    reduced_dim : int
+        One of the dimensionalities to be tried.
+
+    grid_search_level : str
+        If 'light', grid search resolution will be reduced to speed up optimization.
+        If 'exhaustive', most values for most parameters will be used for
+        optimization.
+
+    Returns
+    -------
+
+    """
+
+    grid_search_level = grid_search_level.lower()
+    if grid_search_level in ['exhaustive']:
+        range_penalty = np.power(10.0, range(-4, 5))
+        range_l1_ratio = [0.0, 0.1, 0.5, 0.9, 1.0]
+    elif grid_search_level in ['light']:
+        range_penalty = np.power(10.0, range(-3, 4))
+        range_l1_ratio = [0.0, 0.5, 1.0]
+    elif grid_search_level in ['none']:  # single point on the hyper-parameter grid
+        range_penalty = [1.0, ]
+        range_l1_ratio = [0.5, ]
+    else:
+        raise ValueError('Unrecognized option to set level of grid search.')
+
+    clf_name = 'logistic_regr'
+    param_list_values = [('C', range_penalty),
+                         ('l1_ratio', range_l1_ratio),
+                         ]
+    param_grid = make_parameter_grid(clf_name, param_list_values)
+
+    # saga is the only solver supporting all the penalties, and warm start
+    clf = LogisticRegression(penalty='elasticnet', solver='saga', l1_ratio=0.5,
+                             max_iter=cfg.linear_model_max_iter)
+
+    return clf, clf_name, param_grid
+
+
+def get_Ridge(reduced_dim=None, grid_search_level=cfg.GRIDSEARCH_LEVEL_DEFAULT):
+    """
+    Returns the ridge regressor and its parameter grid.
+
+    Parameters
+    ----------
+    reduced_dim : int
+        One of the dimensionalities to be tried.
+
+    grid_search_level : str
+        If 'light', grid search resolution will be reduced to speed up optimization.
+        If 'exhaustive', most values for most parameters will be used for
+        optimization.
+
+    Returns
+    -------
+
+    """
+
+    grid_search_level = grid_search_level.lower()
+    if grid_search_level in ['exhaustive']:
+        range_alpha = np.power(10.0, range(-4, 6))
+    elif grid_search_level in ['light']:
+        range_alpha = np.power(10.0, range(-3, 4))
+    elif grid_search_level in ['none']:  # single point on the hyper-parameter grid
+        range_alpha = [1.0, ]
+    else:
+        raise ValueError('Unrecognized option to set level of grid search.')
+
+    est_name = 'ridge'
+    param_grid = make_parameter_grid(est_name, [('alpha', range_alpha), ])
+
+    return Ridge(), est_name, param_grid
+
+
 def encode(train_list, test_list, dtypes):
     """
     Utility to help encode/convert data types, learning only from training set.
@@ -1,31 +1,42 @@
 from __future__ import print_function
 
 import argparse
+import json
 import pickle
-import random
 import sys
 import textwrap
 from abc import abstractmethod
+from hashlib import sha256
 from multiprocessing import Pool
-from os import getcwd, makedirs
-from os.path import abspath, exists as pexists, getsize, join as pjoin, realpath
-from warnings import catch_warnings, filterwarnings, simplefilter
+from os import getcwd, makedirs, replace
+from os.path import (abspath, dirname, exists as pexists, getsize, join as pjoin,
+                     realpath)
+from warnings import catch_warnings, filterwarnings, simplefilter, warn
 from pathlib import Path
+from time import time
+from zlib import crc32
 
 import numpy as np
 from pyradigm.multiple import BaseMultiDataset
-from sklearn.model_selection import GridSearchCV, ShuffleSplit
+from sklearn.model_selection import GridSearchCV, ParameterGrid, ShuffleSplit
 
 from neuropredict import __version__, config as cfg
 from neuropredict.algorithms import (compute_reduced_dimensionality, encode,
                                      get_deconfounder, get_preprocessor,
                                      make_pipeline)
 from neuropredict.io import (get_metadata, get_metadata_in_pyradigm)
-from neuropredict.results import ClassifyCVResults, RegressCVResults
-from neuropredict.utils import (chance_accuracy, check_covariate_options,
+from neuropredict.parallel import (ComputeBudget, SharedMultiDataset, SplitPlan,
+                                   order_tasks_by_cost)
+from neuropredict.results import (CheckpointJournal, ClassifyCVResults,
+                                  RegressCVResults)
+from neuropredict.search import (BudgetedSearchCV, KernelSearchCV, OOBSearchCV,
+                                 PathSearchCV, TransformerCache, WarmStartSearchCV)
+from neuropredict.utils import (available_cpu_count, available_memory,
+                                chance_accuracy, check_covariate_options,
                                 check_num_procs, check_paths, impute_missing_data,
-                                not_unspecified,
-                                print_options, validate_feature_selection_size,
+                                not_unspecified, peak_memory_usage,
+                                print_options, reset_peak_memory,
+                                validate_feature_selection_size,
                                 validate_impute_strategy)
 
 
@@ -49,12 +60,27 @@ class BaseWorkflow(object):
                  num_procs=cfg.DEFAULT_NUM_PROCS,
                  user_options=None,
                  checkpointing=False,
-                 workflow_type='classify'
+                 workflow_type='classify',
+                 share_datasets=cfg.default_share_datasets,
+                 seed=cfg.SEED_RANDOM,
+                 early_stop_tol=cfg.default_early_stop_tol,
+                 early_stop_min_rep=cfg.default_early_stop_min_rep,
+                 max_search_fits=cfg.default_max_search_fits,
+                 max_search_time=cfg.default_max_search_time,
+                 oob_search=cfg.default_oob_search,
+                 num_threads=None,
+                 calibrate_memory=cfg.default_calibrate_memory,
+                 extend=False
                  ):
         """Constructor"""
 
         self.datasets = datasets
+        # multiple models can be compared on the same splits & preprocessed data
         self.pred_model = pred_model
+        if isinstance(pred_model, str):
+            self._pred_models = (pred_model,)
+        else:
+            self._pred_models = tuple(pred_model)
         self.impute_strategy = impute_strategy
 
         self.covariates = covariates
@@ -67,6 +93,11 @@ class BaseWorkflow(object):
         self.num_rep_cv = num_rep_cv
         self._scoring = scoring
         self.grid_search_level = grid_search_level
+        # budget per dataset per repetition for random and bayesian searches
+        self.max_search_fits = max_search_fits
+        self.max_search_time = max_search_time
+        # forests can be optimized via their out-of-bag estimates instead
+        self.oob_search = oob_search
 
         if out_dir is None:
             out_dir = getcwd()
@@ -78,9 +109,30 @@ class BaseWorkflow(object):
         makedirs(self._tmp_dump_dir, exist_ok=True)
 
         self._parall_proc = False
+        # total number of CPUs, split between processes and threads within them
         self.num_procs = num_procs
+        # None chooses the number of threads per process automatically
+        self.num_threads = num_threads
+        self._budget = None
+        # measures the peak memory of a worker on the first rep, before the rest
+        self._calibrate_memory = calibrate_memory
         self.user_options = user_options
         self._checkpointing = checkpointing
+        # feature matrices are shared with workers via memory-mapped files
+        self._share_datasets = share_datasets
+        self._shared_datasets = None
+        # seed for the split plan: None draws fresh entropy from the OS, which is
+        #   recorded in the journal to resume an interrupted run on the same splits
+        self.seed = seed
+        # opt-in: stop adding reps once the median of every metric is stable
+        self._early_stop_tol = early_stop_tol
+        self._early_stop_min_rep = early_stop_min_rep
+        # adds more reps or modalities to the results in out_dir, instead of
+        #   merely loading them
+        self._extend = extend
+        # number of reps in the results saved earlier, and modalities added since
+        self._num_rep_saved = 0
+        self._modalities_added = tuple()
         workflow_type = workflow_type.lower()
         if workflow_type not in cfg.workflow_types:
             raise ValueError('Invalid workflow. Must be one of {}'
@@ -96,10 +148,12 @@ class BaseWorkflow(object):
 
         if self._workflow_type == 'classify':
             self.results = ClassifyCVResults(self._scoring, self.num_rep_cv,
-                                             dataset_ids)
+                                             dataset_ids,
+                                             model_ids=self._pred_models)
         else:
             self.results = RegressCVResults(self._scoring, self.num_rep_cv,
-                                            dataset_ids)
+                                            dataset_ids,
+                                            model_ids=self._pred_models)
 
 
     def _prepare(self):
@@ -115,12 +169,30 @@ class BaseWorkflow(object):
         if self.train_perc <= 0.0 or self.train_perc >= 1.0:
             raise ValueError('Train perc > 0.0 and < 1.0')
 
-        self.num_procs = check_num_procs(self.num_procs)
+        if self._early_stop_tol is not None:
+            if not np.isfinite(self._early_stop_tol) or self._early_stop_tol <= 0:
+                raise ValueError('Tolerance for early stopping must be a finite '
+                                 'number > 0')
+            self._early_stop_min_rep = int(max(2, min(self.num_rep_cv,
+                                                      self._early_stop_min_rep)))
+
+        self._avail_cpus, self._cpu_source = available_cpu_count()
+        self.num_procs = check_num_procs(self.num_procs, self._avail_cpus)
+        if self.num_threads is not None and \
+                (not np.isfinite(self.num_threads) or int(self.num_threads) < 1):
+            raise ValueError('Number of threads per process must be >= 1, '
+                             'or None to choose automatically')
 
         if self.grid_search_level.lower() not in cfg.GRIDSEARCH_LEVELS:
             raise ValueError('Unrecognized level of grid search.'
                              ' Valid choices: {}'.format(cfg.GRIDSEARCH_LEVELS))
 
+        if self.grid_search_level.lower() in ('random', 'bayesian') and \
+                self.max_search_fits is None and self.max_search_time is None:
+            raise ValueError('Budget for {} search must be specified, either via '
+                             'max_search_fits or max_search_time'
+                             ''.format(self.grid_search_level))
+
         # TODO for API use, pred_model and dim_reducer must be validated here again
         # if not isinstance(self.pred_model, BaseEstimator):
 
@@ -129,21 +201,77 @@ class BaseWorkflow(object):
         self._train_set_size = np.int64(np.floor(self._num_samples * self.train_perc))
         self._train_set_size = max(1, min(self._num_samples, self._train_set_size))
 
+        self._id_array = np.array(self._id_list, dtype=object)
+        self._draw_split_plan(self.seed)
+
         self._out_results_path = pjoin(self.out_dir, cfg.results_file_name)
+        # number of workers is capped to fit the memory available
+        self._avail_memory, self._memory_source = available_memory()
+        self._worker_memory = self._estimate_worker_memory()
+
+        # not part of the expt config, as results do not depend on it
+        self.results.add_meta(cfg.cpu_budget_name,
+                              dict(available_cpus=self._avail_cpus,
+                                   source=self._cpu_source,
+                                   num_procs=self.num_procs,
+                                   available_memory=self._avail_memory,
+                                   memory_source=self._memory_source,
+                                   worker_memory_estimate=self._worker_memory))
 
         self._summarize_expt()
 
 
+    def _draw_split_plan(self, seed):
+        """Draws the splits for all the repetitions once, to be shared with the
+        workers and recorded in the results, along with the experiment config."""
+
+        self._split_plan = SplitPlan(self._num_samples, self._train_set_size,
+                                     self.num_rep_cv, seed=seed)
+        self.results.add_meta(cfg.split_plan_name, self._split_plan.train_idx)
+        # predictions etc are stored in dense arrays of [run, dataset, samplet]
+        self.results.set_test_mask(self._split_plan.test_mask())
+        self.results.add_meta(cfg.expt_config_name, self._expt_config())
+
+
+    def _expt_config(self):
+        """Parameters defining this experiment, to check whether partial results
+        on disk (e.g. from an interrupted run) can be reused."""
+
+        ids_targets = sorted((str(sid), str(self.datasets.targets[sid]))
+                             for sid in self._id_list)
+        samplet_hash = sha256(repr(ids_targets).encode('utf-8')).hexdigest()
+        num_features = {ds_id: len(self.datasets.feature_names[ds_id])
+                        for ds_id in self.datasets.modality_ids}
+
+        return dict(workflow_type=self._workflow_type,
+                    pred_model=self._pred_models,
+                    dim_red_method=str(self.dim_red_method),
+                    reduced_dim=str(self.reduced_dim),
+                    train_perc=float(self.train_perc),
+                    grid_search_level=str(self.grid_search_level),
+                    max_search_fits=self.max_search_fits,
+                    max_search_time=self.max_search_time,
+                    oob_search=bool(self.oob_search),
+                    impute_strategy=str(self.impute_strategy),
+                    covariates=tuple(self.covariates),
+                    deconfounder=str(self.deconfounder),
+                    dataset_ids=tuple(self.datasets.modality_ids),
+                    num_features=num_features,
+                    samplets=samplet_hash,
+                    split_entropy=str(self._split_plan.entropy))
+
+
     def _summarize_expt(self):
         """Summarize the experiment for user info"""
 
         print('\nCURRENT EXPERIMENT:\n{line}'.format(line='-' * 50))
         print('Training percentage      : {:.2}'.format(self.train_perc))
         print('Number of CV repetitions : {}'.format(self.num_rep_cv))
-        print('Number of processors     : {}'.format(self.num_procs))
+        print('Number of processors     : {} (available: {}, via {})'
+              ''.format(self.num_procs, self._avail_cpus, self._cpu_source))
         print('Dim reduction method     : {}'.format(self.dim_red_method))
         print('Dim reduction size       : {}'.format(self.reduced_dim))
-        print('Predictive model chosen  : {}'.format(self.pred_model))
+        print('Predictive model chosen  : {}'.format(', '.join(self._pred_models)))
         print('Grid search level        : {}\n'.format(self.grid_search_level))
 
         if len(self.covariates) > 0:
@@ -162,12 +290,19 @@ class BaseWorkflow(object):
 
         self._prepare()
 
+        runs_done = None
         if pexists(self._out_results_path) and getsize(self._out_results_path) > 0:
-            print('Loading results from:\n {}\n'.format(self.out_dir))
-            self.load()
+            if self._extend:
+                print('Extending the results in:\n {}\n'.format(self.out_dir))
+                runs_done = self._load_to_extend()
+            else:
+                print('Loading results from:\n {}\n'.format(self.out_dir))
+                self.load()
         else:
             print('Saving results to: \n {}\n'.format(self.out_dir))
+            runs_done = list()
 
+        if runs_done is not None:
             # ignoring some not-so-critical warnings
             with catch_warnings():
                 filterwarnings(action='once', category=UserWarning, module='joblib',
@@ -182,7 +317,7 @@ class BaseWorkflow(object):
                                message='invalid value encountered in true_divide')
                 simplefilter(action='once', category=DeprecationWarning)
                 # actual CV
-                self._run_cv()
+                self._run_cv(runs_done)
 
             self.save()
 
@@ -194,59 +329,458 @@ class BaseWorkflow(object):
         return self._out_results_path
 
 
-    def _run_cv(self):
-        """Actual CV"""
+    def _load_to_extend(self):
+        """
+        Loads the results saved earlier by the same experiment, to add more
+        repetitions of CV, up to the number requested now, and/or new modalities.
+        Existing results are kept as they are. New repetitions are drawn from the
+        same split plan, and new modalities are run on the exact same splits.
+
+        Returns the runs already done, or None when there is nothing to add.
+        """
 
-        if self.num_procs > 1:
+        num_rep = self.num_rep_cv
+        expt_config = self.results.meta[cfg.expt_config_name]
+        cpu_budget = self.results.meta[cfg.cpu_budget_name]
+        # loading restores the settings of the earlier run: the results may have
+        #   been moved since, and CPUs are those of the machine running now
+        current = {var: getattr(self, var)
+                   for var in ('out_dir', 'num_procs', '_checkpointing')}
+        self.load()
+        for var, value in current.items():
+            setattr(self, var, value)
+        self.results.add_meta(cfg.cpu_budget_name, cpu_budget)
+
+        saved_config = self.results.meta[cfg.expt_config_name]
+        new_modalities = [ds_id for ds_id in self.datasets.modality_ids
+                          if ds_id not in saved_config['dataset_ids']]
+        if not _same_experiment(saved_config, expt_config, new_modalities) or \
+                cfg.split_plan_name not in self.results.meta:
+            raise ValueError('Results in {} are from a different experiment, or '
+                             'from an older version, and can not be extended. '
+                             'Match the options of the earlier run, or choose a '
+                             'different output folder.'.format(self.out_dir))
+
+        num_done = int(self.results.num_rep)
+        if num_rep <= num_done and not new_modalities:
+            print('{} repetitions of CV were done already, out of {} requested: '
+                  'nothing to add.\n'.format(num_done, num_rep))
+            self.num_rep_cv = num_done
+            return None
+
+        num_rep = max(num_rep, num_done)
+        if num_rep > num_done:
+            print('Adding {} repetitions of CV to the {} done already.\n'
+                  ''.format(num_rep - num_done, num_done))
+        if new_modalities:
+            print('Adding modalities {} to the {} repetitions of CV done already, '
+                  'on the same splits.\n'.format(', '.join(map(str, new_modalities)),
+                                                 num_done))
+            if self._early_stop_tol is not None:
+                print('Early stopping is disabled, to never drop any of the '
+                      'repetitions done already.\n')
+                self._early_stop_tol = None
+        # ordering of samplets in the saved plan, which may differ from inputs
+        self._id_array = np.array(self._id_list, dtype=object)
+        self._split_plan = SplitPlan(self._num_samples, self._train_set_size, 0,
+                                     seed=int(saved_config['split_entropy']))
+        self._split_plan.train_idx = np.asarray(
+                self.results.meta[cfg.split_plan_name], dtype=np.int32)
+        self._split_plan.extend(num_rep)
+
+        self.num_rep_cv = num_rep
+        self.results.extend(num_rep, test_mask=self._split_plan.test_mask(),
+                            dataset_ids=self.datasets.modality_ids)
+        self.results.add_meta(cfg.split_plan_name, self._split_plan.train_idx)
+        self._num_rep_saved = num_done
+        self._modalities_added = tuple(new_modalities)
+        if new_modalities:
+            # runs done already are not complete until the new modalities are
+            self.results.add_meta(cfg.expt_config_name,
+                                  dict(expt_config,
+                                       split_entropy=saved_config['split_entropy']))
+            return list()
+
+        return list(range(num_done))
+
+
+    def _pending_modalities(self, run_id):
+        """Modalities to be run for a given run: only those added since, for the
+        runs in the results saved earlier, and all of them otherwise."""
+
+        if run_id < self._num_rep_saved:
+            return self._modalities_added
+
+        return tuple(self.datasets.modality_ids)
+
+
+    def _run_cv(self, runs_done=()):
+        """Actual CV, skipping the runs already done e.g. when extending"""
+
+        # resuming from the journal of an interrupted run of the same experiment
+        self._journal = CheckpointJournal(pjoin(self._tmp_dump_dir,
+                                                cfg.journal_file_name))
+        expt_config = self.results.meta[cfg.expt_config_name]
+        journal_config = self._journal.header()
+        if journal_config is not None and journal_config != expt_config:
+            if self.seed is None and self._num_rep_saved == 0 and \
+                    len(runs_done) == 0 and \
+                    _same_experiment(journal_config, expt_config):
+                # splits were drawn from fresh entropy: those of the interrupted
+                #   run are drawn again, to resume it
+                self._draw_split_plan(int(journal_config['split_entropy']))
+                expt_config = self.results.meta[cfg.expt_config_name]
+            else:
+                warn('Journal of an interrupted run in {} is from a different '
+                     'experiment, or from different splits (a different seed), and '
+                     'will be discarded. Resuming a run requires the same options, '
+                     'and the same seed if one was given.'
+                     ''.format(self._tmp_dump_dir))
+        resumed = self.results.add_complete_runs(self._journal.resume(
+                expt_config=expt_config))
+        done_runs = list(runs_done) + [run for run in resumed
+                                       if run not in runs_done]
+        runs_to_do = [run for run in range(self.num_rep_cv) if run not in done_runs]
+        if len(resumed) > 0:
+            print('Resuming: results for {} repetitions were found in\n {}\n'
+                  ' Running only the remaining {}.'
+                  ''.format(len(resumed), self._tmp_dump_dir, len(runs_to_do)))
+
+        # runs are marked complete as soon as all their tasks are done
+        self._runs_done = list(done_runs)
+        self._start_time = time()
+        self._budget = self._get_compute_budget(len(runs_to_do))
+        if self._budget.num_procs > 1:
             self._parall_proc = True
             self._checkpointing = True
-
-            print('Parallelizing the repetitions of CV with {} processes ...'
-                  ''.format(self.num_procs))
-            with Pool(processes=self.num_procs) as pool:
-                pool.map(self._single_run_cv, list(range(self.num_rep_cv)))
+            if self._share_datasets:
+                # files are named by cfg.shared_data_prefix, among the temp dumps
+                self._shared_datasets = SharedMultiDataset(
+                        self.datasets, self._tmp_dump_dir,
+                        samplet_ids=self._id_list,
+                        common_attr_names=self.covariates)
+            task_costs = self._estimate_task_costs()
+
+            if self._calibrate_memory and len(runs_to_do) > 1:
+                # first rep runs alone in a single worker, to measure its memory
+                calib_run = runs_to_do.pop(0)
+                with Pool(processes=1) as pool:
+                    peak_memory = self._run_batch(pool, [calib_run], task_costs)
+                if peak_memory is not None:
+                    print('Peak memory needed by a task: measured {:.0f} MiB, '
+                          'estimated {:.0f} MiB'.format(peak_memory / 2 ** 20,
+                                                        self._worker_memory / 2 ** 20))
+                    self._worker_memory = peak_memory
+                    self.results.meta[cfg.cpu_budget_name].update(
+                            worker_memory_measured=peak_memory)
+                self._budget = self._get_compute_budget(len(runs_to_do))
+
+        num_procs = self._budget.num_procs
+        self.results.meta[cfg.cpu_budget_name].update(
+                num_processes=num_procs, num_threads=self._budget.num_threads)
+
+        # with adaptive stopping, reps are run in batches, checking in between
+        #   whether the estimates have converged, before scheduling any more
+        if self._early_stop_tol is not None:
+            batch_size = max(num_procs, cfg.early_stop_check_interval) \
+                if num_procs > 1 else 1
+        else:
+            batch_size = max(1, len(runs_to_do))
+        batches = [runs_to_do[start:start + batch_size]
+                   for start in range(0, len(runs_to_do), batch_size)]
+
+        if num_procs > 1:
+            print('Parallelizing the repetitions of CV with {} ...'
+                  ''.format(self._budget))
+            with Pool(processes=num_procs) as pool:
+                for batch in batches:
+                    self._run_batch(pool, batch, task_costs)
+                    if self._has_converged(self._runs_done):
+                        break
+            self._shared_datasets = None
         else:
             # switching to regular sequential for loop to avoid any parallel drama
-            for rep in range(self.num_rep_cv):
-                self._single_run_cv(rep)
+            if self._budget.num_threads > 1:
+                print('Running the repetitions of CV with {} ...'
+                      ''.format(self._budget))
+            with self._budget.limit_threads():
+                for batch in batches:
+                    for rep in batch:
+                        self._single_run_cv(rep)
+                        self._run_done(rep)
+                    if self._has_converged(self._runs_done):
+                        break
+            self._shared_datasets = None
+
+        self.results.add_meta(cfg.num_rep_run_name, len(self._runs_done))
+        if len(self._runs_done) < self.num_rep_cv:
+            print('Estimates converged: stopped after {} of {} repetitions of CV.\n'
+                  ''.format(len(self._runs_done), self.num_rep_cv))
+            self._keep_runs(sorted(self._runs_done))
+
+
+    def _run_batch(self, pool, batch, task_costs):
+        """
+        Runs all the (run, dataset) tasks for a batch of runs in the given pool,
+        merging and journaling the results of each task as soon as it is complete.
+
+        Returns the peak memory of the workers, if known.
+        """
+
+        # each (run, dataset) is a separate task, with the costliest
+        #   first, to keep all the processes busy until the very end
+        tasks = [task for task in order_tasks_by_cost(batch, task_costs)
+                 if task[1] in self._pending_modalities(task[0])]
+        num_pending = {run: len(self._pending_modalities(run)) for run in batch}
+        peak_memory = None
+        for run_id, records, task_memory in pool.imap_unordered(self._run_task,
+                                                                tasks):
+            for record in records:
+                self.results.add_record(record)
+                self._journal.append(record)
+            num_pending[run_id] -= 1
+            if num_pending[run_id] == 0:
+                self._run_done(run_id)
+            if task_memory is not None:
+                peak_memory = max(task_memory, peak_memory or 0)
+
+        return peak_memory
+
+
+    def _run_done(self, run_id):
+        """
+        Marks a run as complete, and reports the progress so far: printing a
+        summary, and saving it to disk, to follow the progress of a long run from
+        elsewhere while it is still running.
+        """
+
+        self._runs_done.append(run_id)
+        summary = self.results.partial_summary(self._runs_done)
+        progress = dict(num_rep_done=len(self._runs_done),
+                        num_rep=int(self.num_rep_cv),
+                        elapsed_seconds=time() - self._start_time,
+                        summary=summary)
+
+        # written to a temp file first, to never leave a partial file behind
+        progress_path = pjoin(self.out_dir, cfg.progress_file_name)
+        tmp_path = '{}.tmp'.format(progress_path)
+        with open(tmp_path, 'w') as pf:
+            json.dump(progress, pf, indent=2)
+        replace(tmp_path, progress_path)
+
+        metric = next(iter(summary))
+        print('\t{} of {} repetitions done - median {}: {}'
+              ''.format(len(self._runs_done), self.num_rep_cv, metric,
+                        ', '.join('{} {:.4f}'.format(res_id, stats['median'])
+                                  for res_id, stats in summary[metric].items())))
+
+
+    def _has_converged(self, completed_runs):
+        """Checks whether the width of the bootstrap CI of the median of every
+        metric, for every dataset, is within the tolerance set for early stopping"""
+
+        if self._early_stop_tol is None or \
+                len(completed_runs) < self._early_stop_min_rep:
+            return False
+
+        ci_widths = self.results.median_ci_width(sorted(completed_runs),
+                                                 seed=self.seed)
+        widest = max(ci_widths.values())
+        print('\t{} repetitions done: widest CI of median {:.4f} (tolerance {})\n'
+              ''.format(len(completed_runs), widest, self._early_stop_tol))
+
+        return widest <= self._early_stop_tol
+
+
+    def _keep_runs(self, run_ids):
+        """Retains only the given runs, in the results and the split plan alike"""
+
+        self.results.keep_runs(run_ids)
+        self._split_plan.keep_runs(run_ids)
+        self.results.add_meta(cfg.split_plan_name, self._split_plan.train_idx)
+        self.num_rep_cv = len(run_ids)
+
+
+    def __getstate__(self):
+        """Avoids pickling the full datasets and results to be sent to the worker
+        processes. Datasets can be shared via memory-mapped files, and workers
+        return their results for each task separately."""
+
+        state = self.__dict__.copy()
+        if state.get('_shared_datasets', None) is not None:
+            state['datasets'] = state['_shared_datasets']
+            state['_shared_datasets'] = None
+        if self._parall_proc:
+            state['results'] = self.results.empty_copy()
+        return state
+
+
+    def _estimate_task_costs(self):
+        """Rough relative cost of a single run for each dataset, as the product of
+        its dimensionality and the number of fits in the hyperparameter search."""
+
+        costs = dict()
+        for ds_id in self.datasets.modality_ids:
+            num_features = len(self.datasets.feature_names[ds_id])
+            reduced_dim = compute_reduced_dimensionality(
+                    self.reduced_dim, self._train_set_size, num_features)
+            costs[ds_id] = num_features * sum(
+                    self._num_search_fits(model, reduced_dim)
+                    for model in self._pred_models)
+
+        return costs
+
+
+    def _num_search_fits(self, model, reduced_dim):
+        """Number of fits in the hyperparameter search for a given model"""
+
+        _, param_grid = make_pipeline(pred_model=model,
+                                      dim_red_method=self.dim_red_method,
+                                      reduced_dim=reduced_dim,
+                                      train_set_size=self._train_set_size,
+                                      gs_level=self.grid_search_level)
+        num_fits = len(ParameterGrid(param_grid)) * cfg.INNER_CV_NUM_SPLITS
+        if self.grid_search_level.lower() in ('random', 'bayesian') and \
+                self.max_search_fits is not None:
+            num_fits = min(num_fits, self.max_search_fits)
+        elif self.oob_search and \
+                self.grid_search_level.lower() in cfg.OOB_SEARCH_LEVELS and \
+                model.lower() in cfg.oob_capable_models:
+            num_fits = len(ParameterGrid(param_grid))
+
+        return num_fits
+
+
+    def _get_compute_budget(self, num_runs):
+        """Splits the CPUs between processes and threads, for the given runs"""
+
+        num_features = max(len(self.datasets.feature_names[ds_id])
+                           for ds_id in self.datasets.modality_ids)
+        reduced_dim = compute_reduced_dimensionality(
+                self.reduced_dim, self._train_set_size, num_features)
+        num_fits = min(self._num_search_fits(model, reduced_dim)
+                       for model in self._pred_models)
+
+        max_procs = None
+        if self._avail_memory is not None:
+            max_procs = int(cfg.usable_memory_fraction * self._avail_memory
+                            // self._worker_memory)
+            if max_procs < min(self.num_procs, num_runs):
+                print('Number of processes limited to {} to fit the memory '
+                      'available ({:.1f} GiB, via {})'
+                      ''.format(max(1, max_procs), self._avail_memory / 2 ** 30,
+                                self._memory_source))
+
+        return ComputeBudget(self.num_procs,
+                             num_tasks=num_runs * len(self.datasets.modality_ids),
+                             num_samplets=self._train_set_size,
+                             num_features=num_features,
+                             num_fits=num_fits,
+                             num_threads=self.num_threads,
+                             max_procs=max_procs)
+
+
+    def _estimate_worker_memory(self):
+        """
+        Rough peak memory (in bytes) of a worker running a single (run, dataset)
+        task, based on the shape and type of the largest dataset.
+        """
+
+        # a single samplet reveals the data type of each dataset
+        data_bytes = dict()
+        for ds_id, subsets in self.datasets.get_subsets(([self._id_list[0]],)):
+            (data, _), = subsets
+            num_values = self._num_samples * len(self.datasets.feature_names[ds_id])
+            # subsets in original type, and the rest as float64
+            data_bytes[ds_id] = num_values * data.dtype.itemsize + \
+                                num_values * 8 * cfg.worker_num_data_copies + \
+                                min(cfg.transformer_cache_max_bytes,
+                                    num_values * 8 * cfg.INNER_CV_NUM_SPLITS)
+
+        worker_memory = cfg.worker_base_memory + max(data_bytes.values())
+        if not self._share_datasets:
+            # each worker receives its own copy of all the datasets
+            worker_memory += 8 * self._num_samples * sum(
+                    len(self.datasets.feature_names[ds_id])
+                    for ds_id in self.datasets.modality_ids)
+
+        return int(worker_memory)
 
 
     def _single_run_cv(self, run_id=None):
         """Implements a single run of train, optimize and predict"""
 
-        random.shuffle(self._id_list)
-        train_set = self._id_list[:self._train_set_size]
-        test_set = list(set(self._id_list) - set(train_set))
+        train_set, test_set = self._split_plan.get_split(run_id, self._id_array)
+        pending = self._pending_modalities(run_id)
+        for ds_id, subsets in self.datasets.get_subsets((train_set, test_set)):
+            if ds_id not in pending:
+                continue
+            (train_data, train_targets), (test_data, test_targets) = subsets
+            self._single_run_dataset(run_id, ds_id, train_set, test_set,
+                                     train_data, train_targets,
+                                     test_data, test_targets)
+
+        # journal results if checkpointing is requested
+        if self._checkpointing or self._parall_proc:
+            self.results.checkpoint(self._journal, run_id)
+
+
+    def _run_task(self, task):
+        """Runs a single (run, dataset) task in a worker, returning its results
+        for all the models, and the peak memory needed by the worker for it"""
 
-        for ds_id, ((train_data, train_targets), (test_data, test_targets)) \
-                in self.datasets.get_subsets((train_set, test_set)):
-            # print('Dataset {}'.format(ds_id))
+        # memory inherited from the main process is not needed by the task
+        baseline_memory = reset_peak_memory()
+        run_id, ds_id = task
+        train_set, test_set = self._split_plan.get_split(run_id, self._id_array)
+        for this_ds, subsets in self.datasets.get_subsets((train_set, test_set)):
+            # subsets are not materialized for the other datasets
+            if this_ds == ds_id:
+                (train_data, train_targets), (test_data, test_targets) = subsets
+                with self._budget.limit_threads():
+                    self._single_run_dataset(run_id, ds_id, train_set, test_set,
+                                             train_data, train_targets,
+                                             test_data, test_targets)
+                break
 
-            missing = self.datasets.get_attr(ds_id, cfg.missing_data_flag_name)
-            if missing:
-                train_data, test_data = impute_missing_data(
-                        train_data, train_targets, self.impute_strategy, test_data)
+        records = [self.results.get_record(run_id,
+                                           self.results.result_id(ds_id, model))
+                   for model in self._pred_models]
 
-            train_data, test_data = self._preprocess_data(train_data, test_data)
+        return run_id, records, peak_memory_usage(baseline_memory)
 
-            # covariate regression / deconfounding WITHOUT using target values
-            if len(self.covariates) > 0:
-                train_covar, test_covar = self._get_covariates(train_set, test_set)
-                train_data, test_data = self._deconfound_data(train_data, train_covar,
-                                                              test_data, test_covar)
-            # deconfounding targets could be added here in the future if needed
 
+    def _single_run_dataset(self, run_id, ds_id, train_set, test_set,
+                            train_data, train_targets, test_data, test_targets):
+        """Train, optimize and predict for a single dataset in a given run"""
+
+        missing = self.datasets.get_attr(ds_id, cfg.missing_data_flag_name)
+        if missing:
+            train_data, test_data = impute_missing_data(
+                    train_data, train_targets, self.impute_strategy, test_data)
+
+        train_data, test_data = self._preprocess_data(train_data, test_data)
+
+        # covariate regression / deconfounding WITHOUT using target values
+        if len(self.covariates) > 0:
+            train_covar, test_covar = self._get_covariates(train_set, test_set)
+            train_data, test_data = self._deconfound_data(train_data, train_covar,
+                                                          test_data, test_covar)
+        # deconfounding targets could be added here in the future if needed
+
+        # data preprocessed once above is shared by all the models
+        for model in self._pred_models:
+            res_id = self.results.result_id(ds_id, model)
             best_pipeline, best_params, feat_importance = \
-                self._optimize_pipeline_on_train_set(train_data, train_targets)
+                self._optimize_pipeline_on_train_set(
+                        train_data, train_targets, pred_model=model,
+                        random_state=self._search_seed(run_id, ds_id, model))
 
-            self.results.add_attr(run_id, ds_id, 'feat_importance', feat_importance)
+            self.results.add_attr(run_id, res_id, 'feat_importance',
+                                  feat_importance)
 
             self._eval_predictions(best_pipeline, test_data, test_targets,
-                                   run_id, ds_id)
-
-        # dump results if checkpointing is requested
-        if self._checkpointing or self._parall_proc:
-            self.results.dump(self._tmp_dump_dir, run_id)
+                                   run_id, res_id)
 
 
     def _get_covariates(self, train_set, test_set):
@@ -272,26 +806,68 @@ class BaseWorkflow(object):
             np.asarray(np.column_stack(test_covar))
 
 
-    def _optimize_pipeline_on_train_set(self, train_data, train_targets):
+    def _search_seed(self, run_id, ds_id, model):
+        """
+        Seed of the hyperparameter search (inner CV and sampling of candidates) for
+        a given run, dataset and model, derived from the entropy of the split plan.
+        Searches are hence as reproducible as the splits, for any number of
+        processes, and when resuming or extending results.
+        """
+
+        # keyed by names, which stay put as modalities or models are added
+        spawn_key = (int(run_id), crc32(str(ds_id).encode('utf-8')),
+                     crc32(str(model).encode('utf-8')))
+        seed_seq = np.random.SeedSequence(self._split_plan.entropy,
+                                          spawn_key=spawn_key)
+
+        return int(seed_seq.generate_state(1)[0])
+
+
+    def _optimize_pipeline_on_train_set(self, train_data, train_targets,
+                                        pred_model=None, random_state=None):
         """Optimize model on training set."""
 
+        if pred_model is None:
+            pred_model = self._pred_models[0]
+
         reduced_dim = compute_reduced_dimensionality(
                 self.reduced_dim, self._train_set_size, train_data.shape[1])
-        pipeline, param_grid = make_pipeline(pred_model=self.pred_model,
+        pipeline, param_grid = make_pipeline(pred_model=pred_model,
                                              dim_red_method=self.dim_red_method,
                                              reduced_dim=reduced_dim,
                                              train_set_size=self._train_set_size,
-                                             gs_level=self.grid_search_level)
+                                             gs_level=self.grid_search_level,
+                                             memory=self._get_transformer_cache())
 
+        n_jobs, search_n_jobs = 1, 1
+        if self._budget is not None:
+            n_jobs, search_n_jobs = self._budget.num_threads, \
+                                    self._budget.search_n_jobs
         best_pipeline, best_params = self._optimize_pipeline(
-                pipeline, train_data, train_targets, param_grid, self.train_perc)
+                pipeline, train_data, train_targets, param_grid, self.train_perc,
+                gs_level=self.grid_search_level, max_fits=self.max_search_fits,
+                max_time=self.max_search_time, oob_search=self.oob_search,
+                n_jobs=n_jobs, search_n_jobs=search_n_jobs,
+                random_state=random_state)
 
         feat_importance = self._get_feature_importance(
-                self.pred_model, best_pipeline, train_data.shape[1])
+                pred_model, best_pipeline, train_data.shape[1])
 
         return best_pipeline, best_params, feat_importance
 
 
+    def _get_transformer_cache(self):
+        """Cache of fitted dim reducers, created separately within each process"""
+
+        if cfg.transformer_cache_max_bytes <= 0:
+            return None
+
+        if getattr(self, '_transformer_cache', None) is None:
+            self._transformer_cache = TransformerCache(
+                    max_bytes=cfg.transformer_cache_max_bytes)
+        return self._transformer_cache
+
+
     @staticmethod
     def _preprocess_data(train_data, test_data,
                          preproc_name=cfg.default_preprocessing_method):
@@ -339,23 +915,45 @@ class BaseWorkflow(object):
                 index_selected_features = dim_red.get_support(indices=True)
 
                 if hasattr(est, cfg.importance_attr[est_name]):
+                    importance = getattr(est, cfg.importance_attr[est_name])
+                    if est_name in cfg.importance_coef_magnitude:
+                        # one row of coefficients per class in multi-class models
+                        importance = np.abs(np.atleast_2d(importance)).mean(axis=0)
                     feat_importance = np.full(num_features, fill_value)
-                    feat_importance[index_selected_features] = \
-                        getattr(est, cfg.importance_attr[est_name])
+                    feat_importance[index_selected_features] = importance
 
         return feat_importance
 
 
     @staticmethod
     def _optimize_pipeline(pipeline, train_data, train_targets,
-                           param_grid, train_perc_inner_cv):
-        """Optimizes a given pipeline on the given dataset"""
+                           param_grid, train_perc_inner_cv,
+                           gs_level=cfg.GRIDSEARCH_LEVEL_DEFAULT,
+                           max_fits=cfg.default_max_search_fits,
+                           max_time=cfg.default_max_search_time,
+                           oob_search=cfg.default_oob_search,
+                           n_jobs=1,
+                           search_n_jobs=1,
+                           random_state=None):
+        """Optimizes a given pipeline on the given dataset.
+
+        n_jobs threads are given to the estimator, unless the search is allowed to
+        run search_n_jobs fits in parallel, as set by the ComputeBudget.
+        random_state seeds the inner CV and the sampling of candidates."""
+
+        if oob_search and gs_level.lower() in cfg.OOB_SEARCH_LEVELS and \
+                OOBSearchCV.supports(pipeline):
+            BaseWorkflow._set_estimator_n_jobs(pipeline, n_jobs)
+            gs = OOBSearchCV(estimator=pipeline, param_grid=param_grid)
+            gs.fit(train_data, train_targets)
+            return gs.best_estimator_, gs.best_params_
 
         # TODO perhaps k-fold is a better inner CV,
         #   which guarantees full use of training set with fewer repeats?
         inner_cv = ShuffleSplit(n_splits=cfg.INNER_CV_NUM_SPLITS,
                                 train_size=train_perc_inner_cv,
-                                test_size=1.0 - train_perc_inner_cv)
+                                test_size=1.0 - train_perc_inner_cv,
+                                random_state=random_state)
         # inner_cv = RepeatedKFold(n_splits=cfg.INNER_CV_NUM_FOLDS,
         #   n_repeats=cfg.INNER_CV_NUM_REPEATS)
 
@@ -363,18 +961,99 @@ class BaseWorkflow(object):
         #                   n_jobs=cfg.GRIDSEARCH_NUM_JOBS,
         #                   pre_dispatch=cfg.GRIDSEARCH_PRE_DISPATCH)
 
-        # not specifying n_jobs to avoid any kind of parallelism (joblib) from within
-        # sklearn to avoid potentially bad interactions with outer parallelization
+        # n_jobs is set as per the ComputeBudget, to avoid bad interactions of
+        # parallelism (joblib) from within sklearn with outer parallelization
         # with builtin multiprocessing library
-        gs = GridSearchCV(estimator=pipeline,
-                          param_grid=param_grid,
-                          cv=inner_cv,  # TODO using default scoring metric?
-                          refit=cfg.refit_best_model_on_ALL_training_set)
+        if gs_level.lower() in ('halving',):
+            gs = BaseWorkflow._halving_search(pipeline, param_grid, inner_cv)
+        elif gs_level.lower() in ('random', 'bayesian'):
+            gs = BudgetedSearchCV(estimator=pipeline,
+                                  param_grid=param_grid,
+                                  cv=inner_cv,
+                                  max_fits=max_fits,
+                                  max_time=max_time,
+                                  model_based=gs_level.lower() == 'bayesian',
+                                  refit=cfg.refit_best_model_on_ALL_training_set,
+                                  random_state=random_state)
+        elif KernelSearchCV.supports(pipeline, param_grid):
+            gs = KernelSearchCV(estimator=pipeline,
+                                param_grid=param_grid,
+                                cv=inner_cv,
+                                refit=cfg.refit_best_model_on_ALL_training_set)
+        elif PathSearchCV.supports(pipeline, param_grid):
+            gs = PathSearchCV(estimator=pipeline,
+                              param_grid=param_grid,
+                              cv=inner_cv,
+                              refit=cfg.refit_best_model_on_ALL_training_set)
+        elif WarmStartSearchCV.supports(pipeline, param_grid):
+            gs = WarmStartSearchCV(estimator=pipeline,
+                                   param_grid=param_grid,
+                                   cv=inner_cv,
+                                   refit=cfg.refit_best_model_on_ALL_training_set)
+        else:
+            gs = GridSearchCV(estimator=pipeline,
+                              param_grid=param_grid,
+                              cv=inner_cv,  # TODO using default scoring metric?
+                              refit=cfg.refit_best_model_on_ALL_training_set)
+
+        # only GridSearchCV and its variants can run fits in parallel
+        if search_n_jobs > 1 and hasattr(gs, 'n_jobs'):
+            gs.set_params(n_jobs=search_n_jobs)
+        else:
+            BaseWorkflow._set_estimator_n_jobs(pipeline, n_jobs)
         gs.fit(train_data, train_targets)
 
         return gs.best_estimator_, gs.best_params_
 
 
+    @staticmethod
+    def _set_estimator_n_jobs(pipeline, n_jobs):
+        """Sets n_jobs of the final estimator in the pipeline, if it has one"""
+
+        est_name, est = pipeline.steps[-1]
+        if 'n_jobs' in est.get_params(deep=False):
+            pipeline.set_params(**{'{}__n_jobs'.format(est_name): int(n_jobs)})
+
+
+    @staticmethod
+    def _halving_search(pipeline, param_grid, inner_cv):
+        """
+        Successive halving over the given grid: number of trees is the resource
+        for ensembles (when part of the grid), and the number of samples otherwise.
+
+        The number of rounds is limited by both the number of candidates and the
+        range of the resource: floor(log(max/min) / log(factor)) + 1, so trees
+        ranging from 50 to 250 at factor 3 give at most 2 rounds, saving little
+        over a full grid search. Halving pays off from factor**2 candidates
+        onwards, with a range of the resource of factor**2 or more.
+        """
+
+        # noinspection PyUnresolvedReferences
+        from sklearn.experimental import enable_halving_search_cv
+        from sklearn.model_selection import HalvingGridSearchCV
+
+        # inner CV must yield the same splits in every round of halving
+        if inner_cv.random_state is None:
+            inner_cv.random_state = np.random.randint(np.iinfo(np.int32).max)
+
+        param_grid = dict(param_grid)
+        resource_kwargs = dict(resource='n_samples')
+        for name in list(param_grid.keys()):
+            if name.endswith('__n_estimators'):
+                num_trees = param_grid.pop(name)
+                resource_kwargs = dict(resource=name,
+                                       min_resources=int(min(num_trees)),
+                                       max_resources=int(max(num_trees)))
+                break
+
+        return HalvingGridSearchCV(estimator=pipeline,
+                                   param_grid=param_grid,
+                                   cv=inner_cv,
+                                   factor=cfg.HALVING_FACTOR,
+                                   refit=cfg.refit_best_model_on_ALL_training_set,
+                                   **resource_kwargs)
+
+
     @abstractmethod
     def _eval_predictions(self, pipeline, test_data, true_targets, run_id, ds_id):
         """
@@ -389,14 +1068,21 @@ class BaseWorkflow(object):
     def save(self):
         """Saves the results and state to disk."""
 
-        if self._parall_proc:
-            self.results.gather_dumps(self._tmp_dump_dir)
-
         out_dict = {var: getattr(self, var, None) for var in cfg.results_to_save}
 
         try:
-            with open(self._out_results_path, 'wb') as res_fid:
+            # samplet-wise results go into memory-mappable arrays, and only their
+            #   summary is pickled along with the state of the workflow
+            self.results.save_columnar(pjoin(dirname(self._out_results_path),
+                                             cfg.columnar_results_dir),
+                                       samplet_ids=self._id_list)
+            out_dict['results'] = self.results.detached_copy(
+                    cfg.columnar_results_dir)
+            # written to a temp file first, to never leave a partial file behind
+            tmp_path = '{}.tmp'.format(self._out_results_path)
+            with open(tmp_path, 'wb') as res_fid:
                 pickle.dump(out_dict, res_fid)
+            replace(tmp_path, self._out_results_path)
         except:
             raise IOError('Error saving the results to disk!\nOut path:{}'
                           ''.format(self._out_results_path))
@@ -435,6 +1121,7 @@ class BaseWorkflow(object):
 
         for var in cfg.results_to_save:
             setattr(self, var, loaded_results[var])
+        self.results.attach_columnar(dirname(self._out_results_path))
 
         # TODO need some simple validation to ensure loaded results are usable
 
@@ -462,6 +1149,23 @@ class BaseWorkflow(object):
         self.visualize()
 
 
+    def export(self, out_dir=None, to_csv=True):
+        """
+        Exports the results in a portable format, for use outside neuropredict,
+        by default into a folder within the output folder.
+        Refer to CVResults.export() for details.
+        """
+
+        if out_dir is None:
+            out_dir = pjoin(self.out_dir, cfg.EXPORT_DIR_NAME)
+
+        out_dir = self.results.export(out_dir, samplet_ids=self._id_list,
+                                      to_csv=to_csv, num_procs=self.num_procs)
+        print('Results exported to {}'.format(out_dir))
+
+        return out_dir
+
+
     def _plot_feature_importance(self):
         """Bar plot comparing feature importance"""
 
@@ -483,18 +1187,47 @@ class BaseWorkflow(object):
 
         out_feat_imp = list()
         feat_names = list()
-        for idx, ds in enumerate(self.datasets.modality_ids):
-            num_features = feat_imp[(ds, 0)].size
-            fi_arr = np.empty((self.num_rep_cv, num_features))
-            for run in range(self.num_rep_cv):
-                fi_arr[run, :] = feat_imp[(ds, run)]
-            out_feat_imp.append(fi_arr)
-            feat_names.append(self.datasets.feature_names[ds])
-
-        feature_importance_map(out_feat_imp, self.datasets.modality_ids,
+        res_ids = list()
+        for ds in self.datasets.modality_ids:
+            for model in self._pred_models:
+                res_id = self.results.result_id(ds, model)
+                if feat_imp.get((res_id, 0), None) is None:
+                    continue  # not all models compared may provide it
+                num_features = feat_imp[(res_id, 0)].size
+                fi_arr = np.empty((self.num_rep_cv, num_features))
+                for run in range(self.num_rep_cv):
+                    fi_arr[run, :] = feat_imp[(res_id, run)]
+                out_feat_imp.append(fi_arr)
+                feat_names.append(self.datasets.feature_names[ds])
+                res_ids.append(res_id)
+
+        feature_importance_map(out_feat_imp, res_ids,
                                fig_base_out_path, feature_names=feat_names)
 
 
+def _same_experiment(saved_config, expt_config, new_modalities=()):
+    """
+    Checks whether the config of an experiment matches that of saved results,
+    ignoring the seed of the split plan, which is always taken from the latter, and
+    any modalities new to the experiment. Config is compared in its JSON form, as
+    saved with the results.
+    """
+
+    def normalize(config):
+        config = {key: val for key, val in config.items() if key != 'split_entropy'}
+        return json.loads(json.dumps(config, sort_keys=True,
+                                     default=lambda obj: np.asarray(obj).tolist()))
+
+    expt_config = dict(expt_config)
+    expt_config['dataset_ids'] = [ds_id for ds_id in expt_config['dataset_ids']
+                                  if ds_id not in new_modalities]
+    expt_config['num_features'] = {ds_id: num for ds_id, num
+                                   in expt_config['num_features'].items()
+                                   if ds_id not in new_modalities}
+
+    return normalize(saved_config) == normalize(expt_config)
+
+
 def get_parser_base():
     """Parser to specify arguments and their defaults."""
 
@@ -610,9 +1343,10 @@ def get_parser_base():
     Flag to specify the level of grid search during hyper-parameter optimization 
     on the training set.
     
-    Allowed options are : 'none', 'light' and 'exhaustive', in the order of how 
-    many values/values will be optimized. More parameters and more values demand 
-    more resources and much longer time for optimization.
+    Allowed options are : 'none', 'light', 'exhaustive', 'halving', 'random' and 
+    'bayesian'. The first three are in the order of how many values/values will be 
+    optimized. More parameters and more values demand more resources and much 
+    longer time for optimization.
 
     The 'light' option tries to "folk wisdom" to try least number of values (no 
     more than one or two), for the parameters for the given classifier. (e.g. a 
@@ -620,7 +1354,76 @@ def get_parser_base():
     be the fastest and should give a "rough idea" of predictive performance. The 
     'exhaustive' option will try to most parameter values for the most parameters 
     that can be optimized.
-    """)
+
+    The 'halving' option searches the same grid as 'exhaustive' via successive 
+    halving: all the candidates are evaluated with few trees (or samples), and 
+    only the best third of them move on to the next round with three times more. 
+    This makes searches of exhaustive quality affordable for many repetitions, 
+    provided the grid has at least 9 candidates, as fewer allow only 1 or 2 rounds.
+
+    The 'random' and 'bayesian' options sample the same grid as 'exhaustive', 
+    until a budget of {} fits (trainings on a split of the inner CV) per dataset 
+    per repetition runs out. 'random' samples candidates at random, whereas 
+    'bayesian' is guided by a model of the performance over the grid.
+    """.format(cfg.default_max_search_fits))
+
+    help_text_max_search_fits = textwrap.dedent("""
+    Budget of the 'random' and 'bayesian' searches, in number of fits (trainings 
+    on a split of the inner CV) per dataset per repetition of CV.
+
+    Default: {}.
+    \n \n """.format(cfg.default_max_search_fits))
+
+    help_text_max_search_time = textwrap.dedent("""
+    Budget of the 'random' and 'bayesian' searches, in seconds per dataset per 
+    repetition of CV. The search stops when either budget runs out.
+
+    Default: no limit on time.
+    \n \n """)
+
+    help_text_seed = textwrap.dedent("""
+    Seed for the random splits of CV (and the inner CV), making the results 
+    reproducible. Use 'none' for fresh randomness in every run.
+
+    Default: {}.
+    \n \n """.format(cfg.SEED_RANDOM))
+
+    help_text_early_stop_tol = textwrap.dedent("""
+    Stops scheduling new repetitions of CV once the bootstrap CI of the median 
+    of every metric, for every dataset, is narrower than this tolerance. Only the 
+    repetitions run are kept in the results.
+
+    Default: None, running all the repetitions requested.
+    \n \n """)
+
+    help_text_early_stop_min_rep = textwrap.dedent("""
+    Minimum number of repetitions of CV to run, before stopping early.
+
+    Default: {}.
+    \n \n """.format(cfg.default_early_stop_min_rep))
+
+    help_text_extend = textwrap.dedent("""
+    Extends the results of an earlier run in the same output folder, with more 
+    repetitions of CV (as set by -n) or more datasets, running only what is new.
+    \n \n """)
+
+    help_text_oob_search = textwrap.dedent("""
+    Optimizes the bagged ensembles (random forests and extra trees) based on their 
+    out-of-bag estimate of performance, with a single fit per point on the grid, 
+    instead of the inner CV. Applies to the grid search levels: {}.
+    \n \n """.format(cfg.OOB_SEARCH_LEVELS))
+
+    help_text_num_threads = textwrap.dedent("""
+    Number of threads for each of the parallel processes (as set by -c), used by 
+    the estimator or to run the fits of the search in parallel.
+
+    Default: None, splitting the available CPUs among the processes.
+    \n \n """)
+
+    help_text_no_checkpointing = textwrap.dedent("""
+    Disables saving the results of each repetition of CV as it completes, which 
+    otherwise allows resuming an interrupted run.
+    \n \n """)
 
     help_text_make_vis = textwrap.dedent("""
     Option to make visualizations from existing results in the given path. 
@@ -760,6 +1563,37 @@ def get_parser_base():
                          default="light", help=help_text_gs_level,
                          choices=cfg.GRIDSEARCH_LEVELS, type=str.lower)
 
+    cv_args.add_argument("--max_search_fits", action="store",
+                         dest="max_search_fits", type=int,
+                         default=cfg.default_max_search_fits,
+                         help=help_text_max_search_fits)
+
+    cv_args.add_argument("--max_search_time", action="store",
+                         dest="max_search_time", type=float,
+                         default=cfg.default_max_search_time,
+                         help=help_text_max_search_time)
+
+    cv_args.add_argument("--oob_search", action="store_true",
+                         dest="oob_search", default=cfg.default_oob_search,
+                         help=help_text_oob_search)
+
+    cv_args.add_argument("--seed", action="store", dest="seed",
+                         default=str(cfg.SEED_RANDOM), type=str.lower,
+                         help=help_text_seed)
+
+    cv_args.add_argument("--early_stop_tol", action="store",
+                         dest="early_stop_tol", type=float,
+                         default=cfg.default_early_stop_tol,
+                         help=help_text_early_stop_tol)
+
+    cv_args.add_argument("--early_stop_min_rep", action="store",
+                         dest="early_stop_min_rep", type=int,
+                         default=cfg.default_early_stop_min_rep,
+                         help=help_text_early_stop_min_rep)
+
+    cv_args.add_argument("--extend", action="store_true", dest="extend",
+                         default=False, help=help_text_extend)
+
     pipeline_args = parser.add_argument_group(
             title='Predictive Model',
             description='Parameters of pipeline comprising the predictive model')
@@ -804,6 +1638,13 @@ def get_parser_base():
     comp_args.add_argument("-c", "--num_procs", action="store", dest="num_procs",
                            default=cfg.DEFAULT_NUM_PROCS, help=help_text_num_cpus)
 
+    comp_args.add_argument("--num_threads", action="store", dest="num_threads",
+                           type=int, default=None, help=help_text_num_threads)
+
+    comp_args.add_argument("--no_checkpointing", action="store_false",
+                           dest="checkpointing", default=cfg.default_checkpointing,
+                           help=help_text_no_checkpointing)
+
     comp_args.add_argument("--po", "--print_options", action="store",
                            dest="print_opt_dir",
                            default=False, help=help_text_print_options)
@@ -925,10 +1766,42 @@ def parse_common_args(parser):
 
     dim_red_method = user_args.dim_red_method.lower()
 
+    workflow_options = get_workflow_options(user_args)
+
     return user_args, user_feature_paths, user_feature_type, fs_subject_dir, \
            meta_data_path, meta_data_format, sample_ids, classes, out_dir, \
            train_perc, num_rep_cv, num_procs, reduced_dim_size, impute_strategy, \
-           covar_list, covar_method, grid_search_level, dim_red_method
+           covar_list, covar_method, grid_search_level, dim_red_method, \
+           workflow_options
+
+
+def get_workflow_options(user_args):
+    """Validates the options passed on as is to the workflow, as keyword args"""
+
+    for budget in ('max_search_fits', 'max_search_time'):
+        value = getattr(user_args, budget)
+        if value is not None and not value > 0:
+            raise ValueError('Budget for the search ({}) must be > 0'
+                             ''.format(budget))
+
+    if user_args.seed == 'none':
+        seed = None
+    else:
+        try:
+            seed = int(user_args.seed)
+        except ValueError:
+            raise ValueError('Seed must be an integer, or none. Given: {}'
+                             ''.format(user_args.seed))
+
+    return dict(seed=seed,
+                early_stop_tol=user_args.early_stop_tol,
+                early_stop_min_rep=user_args.early_stop_min_rep,
+                max_search_fits=user_args.max_search_fits,
+                max_search_time=user_args.max_search_time,
+                oob_search=user_args.oob_search,
+                num_threads=user_args.num_threads,
+                checkpointing=user_args.checkpointing,
+                extend=user_args.extend)
 
 
 def organize_inputs(user_args):
@@ -62,7 +62,17 @@ class ClassificationWorkflow(BaseWorkflow):
                  out_dir=None,
                  num_procs=cfg.DEFAULT_NUM_PROCS,
                  user_options=None,
-                 checkpointing=cfg.default_checkpointing):
+                 checkpointing=cfg.default_checkpointing,
+                 share_datasets=cfg.default_share_datasets,
+                 seed=cfg.SEED_RANDOM,
+                 early_stop_tol=cfg.default_early_stop_tol,
+                 early_stop_min_rep=cfg.default_early_stop_min_rep,
+                 max_search_fits=cfg.default_max_search_fits,
+                 max_search_time=cfg.default_max_search_time,
+                 oob_search=cfg.default_oob_search,
+                 num_threads=None,
+                 calibrate_memory=cfg.default_calibrate_memory,
+                 extend=False):
         super().__init__(datasets,
                          pred_model=pred_model,
                          impute_strategy=impute_strategy,
@@ -78,7 +88,17 @@ class ClassificationWorkflow(BaseWorkflow):
                          num_procs=num_procs,
                          user_options=user_options,
                          checkpointing=checkpointing,
-                         workflow_type='classify')
+                         workflow_type='classify',
+                         share_datasets=share_datasets,
+                         seed=seed,
+                         early_stop_tol=early_stop_tol,
+                         early_stop_min_rep=early_stop_min_rep,
+                         max_search_fits=max_search_fits,
+                         max_search_time=max_search_time,
+                         oob_search=oob_search,
+                         num_threads=num_threads,
+                         calibrate_memory=calibrate_memory,
+                         extend=extend)
 
         # order of target_set is crucial, for AUC computation as well as confusion
         # matrix row/column, hence making it a tuple to prevent accidental mutation
@@ -154,7 +174,7 @@ class ClassificationWorkflow(BaseWorkflow):
             else:
                 horiz_line_loc = None
                 horiz_line_label = None
-            compare_distributions(consolidated, self.datasets.modality_ids,
+            compare_distributions(consolidated, list(m_data.keys()),
                                   fig_out_path, y_label=metric,
                                   horiz_line_loc=horiz_line_loc,
                                   horiz_line_label=horiz_line_label,
@@ -165,7 +185,7 @@ class ClassificationWorkflow(BaseWorkflow):
         """Confusion matrices for each feature set, as plots of misclf rate"""
 
         # forcing a tuple to ensure the order, in compound array and in viz's
-        ds_id_order = tuple(self.datasets.modality_ids)
+        ds_id_order = tuple(self.results.result_ids)
         num_datasets = len(ds_id_order)
         num_classes = len(self._target_set)
         conf_mat_all = np.empty((self.num_rep_cv, num_classes, num_classes,
@@ -301,7 +321,8 @@ def parse_args():
     user_args, user_feature_paths, user_feature_type, fs_subject_dir, \
     _, meta_data_format, sample_ids, classes, out_dir, train_perc, \
     num_rep_cv, num_procs, reduced_dim_size, impute_strategy, covar_list, \
-    covar_method, grid_search_level, dim_red_method = parse_common_args(parser)
+    covar_method, grid_search_level, dim_red_method, workflow_options = \
+        parse_common_args(parser)
 
     class_set, subgroups, positive_class = validate_class_set(
             classes, user_args.sub_groups, user_args.positive_class)
@@ -320,7 +341,7 @@ def parse_args():
            positive_class, subgroups, \
            reduced_dim_size, impute_strategy, num_procs, \
            grid_search_level, classifier, dim_red_method, \
-           covar_list, covar_method
+           covar_list, covar_method, workflow_options
 
 
 def validate_class_set(classes, subgroups, positive_class=None):
@@ -553,8 +574,8 @@ def cli():
     subjects, classes, out_dir, options_path, user_feature_paths, \
     user_feature_type, fs_subject_dir, train_perc, num_rep_cv, positive_class, \
     sub_group_list, feature_selection_size, impute_strategy, num_procs, \
-    grid_search_level, classifier, feat_select_method, covar_list, covar_method = \
-        parse_args()
+    grid_search_level, classifier, feat_select_method, covar_list, covar_method, \
+    workflow_options = parse_args()
 
     feature_dir, method_list = make_method_list(fs_subject_dir, user_feature_paths,
                                                 user_feature_type)
@@ -600,7 +621,7 @@ def cli():
                                           out_dir=out_dir_sg,
                                           num_procs=num_procs,
                                           user_options=options_path,
-                                          checkpointing=cfg.default_checkpointing)
+                                          **workflow_options)
 
         result_paths[sub_group_id] = clf_expt.run()
 
@@ -63,7 +63,11 @@ importance_attr = {'randomforestclassifier'   : 'feature_importances_',
                    'decisiontreeregressor'    : 'feature_importances_',
                    'GradientBoostingRegressor': 'feature_importances_',
                    'XGBoostRegressor'         : 'feature_importances_',
+                   'logisticregression'       : 'coef_',
+                   'ridge'                    : 'coef_',
                    }
+# importance is the magnitude of coefficients, averaged over classes if needed
+importance_coef_magnitude = ('logisticregression', 'ridge')
 
 feat_imp_name = 'feat_importance'
 
@@ -73,7 +77,9 @@ __classifier_CHOICES = ('RandomForestClassifier',
                         'ExtraTreesClassifier',
                         'DecisionTreeClassifier',
                         'SVM',
-                        'XGBoost')
+                        'XGBoost',
+                        'LogisticRegression',
+                        'HistGradientBoostingClassifier')
 classifier_choices = [clf.lower() for clf in __classifier_CHOICES]
 
 __regressor_CHOICES = ('RandomForestRegressor',
@@ -84,7 +90,9 @@ __regressor_CHOICES = ('RandomForestRegressor',
                        'BayesianRidge',
                        'GaussianProcessRegressor',
                        'GradientBoostingRegressor',
-                       'XGBoostRegressor'
+                       'XGBoostRegressor',
+                       'Ridge',
+                       'HistGradientBoostingRegressor',
                        )
 regressor_choices = [clf.lower() for clf in __regressor_CHOICES]
 
@@ -110,6 +118,8 @@ __estimators_with_feature_importance = ('DecisionTreeClassifier',
                                         'ExtraTreesRegressor',
                                         'DecisionTreeRegressor',
                                         'XGBoostRegressor',
+                                        'LogisticRegression',
+                                        'Ridge',
                                         )
 estimators_with_feat_imp = [clf.lower() for clf in
                             __estimators_with_feature_importance]
@@ -136,8 +146,6 @@ results_file_name = 'results_neuropredict.pkl'
 options_file_name = 'options_neuropredict.pkl'
 best_params_file_name = 'best_params_neuropredict.pkl'
 
-prefix_dump = 'cv_results_quick_dump'
-
 results_to_save = ['_workflow_type', '_checkpointing',
                    '_id_list', '_num_samples',
                    '_scoring', '_positive_class', '_positive_class_index',
@@ -151,7 +159,7 @@ results_to_save = ['_workflow_type', '_checkpointing',
 
 ### ---------  CV results class  ------------------------------------
 
-_common_variable_set_to_load = ['_dataset_ids',
+_common_variable_set_to_load = ['_dataset_ids', '_input_ids', 'model_ids',
                                'attr', 'meta',
                                'metric_set', 'metric_val',
                                'num_rep', '_count',
@@ -162,6 +170,20 @@ clf_results_class_variables_to_load = _common_variable_set_to_load + \
 
 regr_results_class_variables_to_load = _common_variable_set_to_load + ['residuals', ]
 
+# columnar layout of results on disk: dense .npy arrays per field, memory-mapped
+#   when loaded, described by a small JSON header
+columnar_results_dir = 'results_columnar'
+columnar_header_name = 'header.json'
+columnar_format_version = 1
+# attributes with a value per test samplet, stored along the samplet axis
+samplet_attr_names = ('predict_proba',)
+# portable export of results: a folder of .npy files per table, one per column,
+#   described by a JSON manifest, optionally along with a CSV file per table
+export_manifest_name = 'manifest.json'
+export_samplet_ids_name = 'samplet_ids'
+export_format_version = 1
+export_csv_chunk_size = 100000  # rows written at a time
+
 ### ------------------------------------------------------------------------------
 
 # CV
@@ -183,13 +205,114 @@ refit_best_model_on_ALL_training_set = True
 
 # parallelization is now achieved at the repetitions level.
 DEFAULT_NUM_PROCS = 4
+
+# CPUs are split between processes (one per task) and threads within each of them:
+#   BLAS gets threads only for data with at least these many values (samplets x
+#   features), and the search over the grid only with these many fits per thread
+min_data_size_for_blas_threads = 10 ** 6
+min_fits_per_search_job = 4
+# CPUs detected (respecting affinity, cgroup quotas and HPC schedulers), their
+#   source and their split, are recorded in the meta data of results under this
+cpu_budget_name = 'cpu_budget'
+
+# number of processes is capped to fit the memory available, with an estimate of
+#   the peak memory of a worker: its base footprint, plus these many float64
+#   copies of the data of a single dataset (subsets, imputed, preprocessed and
+#   deconfounded copies, and those made by the hyperparameter search)
+worker_base_memory = 256 * 2 ** 20
+worker_num_data_copies = 6
+# fraction of the memory available to be used by all the workers together
+usable_memory_fraction = 0.8
+default_calibrate_memory = False
+
 GRIDSEARCH_PRE_DISPATCH = 1
 GRIDSEARCH_NUM_JOBS = 1
 
-GRIDSEARCH_LEVELS = ('none', 'light', 'exhaustive')
+# feature matrices are written once to disk and memory-mapped by all the workers,
+#   instead of pickling the full datasets for each of them
+default_share_datasets = True
+shared_data_prefix = 'shared_data'
+
+GRIDSEARCH_LEVELS = ('none', 'light', 'exhaustive', 'halving', 'random', 'bayesian')
 GRIDSEARCH_LEVEL_DEFAULT = GRIDSEARCH_LEVELS[0]
 
+# these levels search the exhaustive grid, without trying all its points
+GRIDSEARCH_LEVELS_ON_EXHAUSTIVE_GRID = ('halving', 'random', 'bayesian')
+EXHAUSTIVE_GRID_LEVEL = 'exhaustive'
+
+# successive halving evaluates all candidates only with few resources (trees or
+#   samples), advancing only the best 1/factor of them to the next iteration with
+#   factor times more resources. It pays off only with at least 3 rounds, i.e.
+#   factor**2 candidates and trees ranging over a ratio of factor**2 or more:
+#   light grids (50 to 250 trees) allow only 2 rounds at factor 3, hence halving
+#   runs on the exhaustive grid (50 to 500 trees, 3 rounds).
+HALVING_FACTOR = 3
+
+# random and bayesian searches sample the grid, until the budget (per dataset,
+#   per repetition of CV) in number of fits or in seconds runs out
+default_max_search_fits = 100
+default_max_search_time = None
+# bayesian search: candidates after the first few random ones are chosen via
+#   a random forest model of the CV score, maximizing its upper confidence bound
+search_num_initial_random = 10
+search_surrogate_num_trees = 50
+search_surrogate_pool_size = 1000
+search_exploration_weight = 1.0
+
+# bagged ensembles (random forests and extra trees) can be optimized based on their
+#   out-of-bag estimate of performance, with a single fit per point on the grid,
+#   for the grid search levels below
+default_oob_search = False
+OOB_SEARCH_LEVELS = ('none', 'light', 'exhaustive')
+oob_capable_models = ('randomforestclassifier', 'extratreesclassifier',
+                      'randomforestregressor', 'extratreesregressor')
+
+# faster searches over the grid, specialized for some families of models below,
+#   are opt-in: though they pick the same parameters as the regular grid search
+#   up to numerical differences (e.g. due to warm starts), results could differ
+#   slightly from those of earlier versions.
+
+# tree ensembles are grown through the sorted values of n_estimators on the grid
+#   via warm start, instead of fitting each one from scratch
+warm_start_n_estimators = False
+
+# fitted dim reducers are reused across grid points of the estimator, within
+#   this limit on memory (per process). 0 disables caching.
+transformer_cache_max_bytes = 512 * 2 ** 20
+
+# histogram-based gradient boosting stops adding trees once the score on an
+#   internal validation split stops improving for these many iterations
+hist_boosting_max_iter = 500
+hist_boosting_validation_fraction = 0.1
+hist_boosting_n_iter_no_change = 10
+
+# linear models are fit through their sorted values of regularization on the grid
+#   in a single sweep (warm start, or a single eigendecomposition for ridge),
+#   per inner CV split
+regularization_path_search = False
+linear_model_max_iter = 1000
+
+# Gram matrices of kernel machines (SVM, SVR, KernelRidge) on each split of the
+#   inner CV are precomputed and reused across the grid, when within this limit
+#   on memory (per process). 0 disables precomputing kernels.
+precomputed_kernel_search = False
+kernel_cache_max_bytes = 256 * 2 ** 20
+
 SEED_RANDOM = 652
+# training sets of all repetitions, as row indices into the list of samplet IDs
+split_plan_name = 'split_plan'
+
+# adaptive early stopping of CV: new reps are not scheduled once the bootstrap CI
+#   of the median of every metric, for every dataset, is narrower than tolerance
+default_early_stop_tol = None  # disabled by default
+default_early_stop_min_rep = 30
+early_stop_check_interval = 10  # in reps, when parallelized
+early_stop_num_bootstraps = 1000
+early_stop_ci_level = 0.95
+num_rep_run_name = 'num_rep_cv_run'
+
+# when comparing multiple models, results are identified by dataset and model
+model_id_separator = '@'
 
 PRECISION_METRICS = 2
 
@@ -237,7 +360,13 @@ CMAP_CONFMATX = 'cividis'  # 'viridis' # 'winter' # 'RdYlGn' # 'Blues' # plt.cm.
 file_name_options = 'options_neuropredict.pkl'
 file_name_best_param_values = 'best_parameter_values.pkl'
 
-quick_dump_prefix = 'cv_results_quick_dump'
+# checkpoints: results of each (run, dataset) are appended to a journal as they
+#   become available, and replayed to resume an interrupted run
+journal_file_name = 'cv_results_journal.bin'
+# summary of the repetitions completed so far, updated as each one completes
+progress_file_name = 'progress_neuropredict.json'
+# name of the meta data identifying the experiment the results belong to
+expt_config_name = 'expt_config'
 
 max_len_identifiers = 75
 
@@ -0,0 +1,351 @@
+"""
+
+Module to help parallelize the repetitions of CV across multiple processes.
+
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from os import makedirs
+from os.path import join as pjoin
+
+import numpy as np
+from joblib import parallel_backend
+from threadpoolctl import threadpool_limits
+
+from neuropredict import config as cfg
+
+
+class SharedMultiDataset(object):
+    """
+    Read-only, light-weight stand-in for a pyradigm MultiDataset to be shipped to
+    the worker processes.
+
+    Feature matrices of all the modalities are written to disk only once, as .npy
+    files, and are memory-mapped by the workers on first access. Hence, only the
+    samplet IDs, targets and few attributes are pickled and sent to each worker,
+    instead of the full MultiDataset. Only the part of the MultiDataset API needed
+    during the CV is implemented.
+    """
+
+
+    def __init__(self,
+                 multi_ds,
+                 out_dir,
+                 samplet_ids=None,
+                 attr_names=(cfg.missing_data_flag_name,),
+                 common_attr_names=()):
+        """Constructor."""
+
+        if samplet_ids is None:
+            samplet_ids = multi_ds.samplet_ids
+        self._ids = list(samplet_ids)
+        self._row_index = {sid: row for row, sid in enumerate(self._ids)}
+
+        self.targets = {sid: multi_ds.targets[sid] for sid in self._ids}
+        self._target_array = np.array([self.targets[sid] for sid in self._ids])
+
+        makedirs(out_dir, exist_ok=True)
+        self._paths = dict()
+        self._attr = dict()
+        for index, (ds_id, subsets) in enumerate(
+                multi_ds.get_subsets((self._ids,))):
+            (data, _), = subsets  # only one subset was requested
+            self._paths[ds_id] = pjoin(out_dir, '{}_{}.npy'
+                                                ''.format(cfg.shared_data_prefix,
+                                                          index))
+            np.save(self._paths[ds_id], data, allow_pickle=False)
+
+            self._attr[ds_id] = dict()
+            for name in attr_names:
+                try:
+                    self._attr[ds_id][name] = multi_ds.get_attr(ds_id, name)
+                except KeyError:
+                    # not set for this dataset, mirroring the original behaviour
+                    pass
+
+        self._common_attr, self._common_attr_dtype = dict(), dict()
+        if common_attr_names:
+            values, dtypes = multi_ds.get_common_attr(common_attr_names, self._ids)
+            for name, val, dtype in zip(common_attr_names, values, dtypes):
+                self._common_attr[name] = val
+                self._common_attr_dtype[name] = dtype
+
+        # opened lazily, separately within each process
+        self._data = None
+
+
+    def __getstate__(self):
+        """Ensures memory-mapped arrays are never pickled."""
+
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+
+    @property
+    def data(self):
+        """Feature matrices for all modalities, memory-mapped in read-only mode"""
+
+        if self._data is None:
+            self._data = {ds_id: np.load(path, mmap_mode='r')
+                          for ds_id, path in self._paths.items()}
+        return self._data
+
+
+    @property
+    def samplet_ids(self):
+        """List of samplet IDs, in the order of rows in the shared data"""
+        return list(self._ids)
+
+
+    @property
+    def modality_ids(self):
+        """List of identifiers for all modalities/datasets, sorted."""
+        return sorted(self._paths.keys())
+
+
+    def _rows(self, subset):
+        """Row indices into the shared data for a given list of samplet IDs"""
+
+        return np.array([self._row_index[sid] for sid in subset], dtype=np.int64)
+
+
+    def get_subsets(self, subset_list):
+        """
+        Returns the requested subsets of data while iterating over modalities,
+        exactly as MultiDataset.get_subsets(), without copying the full data.
+        """
+
+        row_list = [self._rows(subset) for subset in subset_list]
+        for ds_id in self._paths.keys():
+            data = self.data[ds_id]
+            # fancy indexing copies only the requested rows into memory
+            yield ds_id, ((data[rows], self._target_array[rows])
+                          for rows in row_list)
+
+
+    def get_attr(self, ds_id, attr_name, not_found_value='raise'):
+        """Method to retrieve modality-/dataset-specific attributes"""
+
+        if ds_id not in self._paths:
+            raise KeyError('Dataset {} not shared'.format(ds_id))
+
+        try:
+            return self._attr[ds_id][attr_name]
+        except KeyError:
+            if isinstance(not_found_value, str) and \
+                    not_found_value.lower() in ('raise',):
+                raise KeyError('attribute {} not set for dataset {}'
+                               ''.format(attr_name, ds_id))
+            return not_found_value
+
+
+    def get_common_attr(self, names, subset):
+        """Helper to retrieve the requested attributes common to all datasets."""
+
+        rows = self._rows(subset)
+        data, dtypes = list(), list()
+        for name in names:
+            if name not in self._common_attr:
+                raise AttributeError('Attr {} not shared'.format(name))
+            data.append(self._common_attr[name][rows])
+            dtypes.append(self._common_attr_dtype[name])
+
+        return data, dtypes
+
+
+class SplitPlan(object):
+    """
+    Training sets for all the repetitions of CV, drawn once upfront.
+
+    Stored as a compact int32 array of shape (num_rep, train_set_size) of row
+    indices into the list of samplet IDs, which is shared with the workers and
+    with the results. Each repetition draws from its own stream spawned from a
+    single numpy SeedSequence, so the splits are reproducible, independent of the
+    number of processes, and the splits for the first N repetitions do not change
+    when more repetitions are requested.
+    """
+
+
+    def __init__(self, num_samplets, train_set_size, num_rep, seed=None):
+        """Constructor."""
+
+        self.num_samplets = int(num_samplets)
+        self.train_set_size = int(train_set_size)
+        if not 0 < self.train_set_size < self.num_samplets:
+            raise ValueError('Size of training set must be > 0 and < number of '
+                             'samplets ({})'.format(self.num_samplets))
+
+        seed_seq = np.random.SeedSequence(seed)
+        # recording the entropy lets the exact same plan be regenerated later
+        self.entropy = seed_seq.entropy
+        self.train_idx = np.empty((int(num_rep), self.train_set_size),
+                                  dtype=np.int32)
+        for run_id, run_seq in enumerate(seed_seq.spawn(int(num_rep))):
+            self.train_idx[run_id] = self._draw(run_seq)
+
+
+    def _draw(self, run_seq):
+        """Training set of a single run, drawn from its own stream"""
+
+        perm = np.random.default_rng(run_seq).permutation(self.num_samplets)
+        # sorted rows make for a friendlier access pattern on shared data
+        return np.sort(perm[:self.train_set_size])
+
+
+    @property
+    def num_rep(self):
+        """Number of repetitions of CV in the plan"""
+        return self.train_idx.shape[0]
+
+
+    def keep_runs(self, run_ids):
+        """Retains only the given runs in the plan, in the given order"""
+
+        self.train_idx = self.train_idx[np.array(run_ids, dtype=np.int64), :]
+
+
+    def extend(self, num_rep):
+        """
+        Adds more runs to the plan, for a total of num_rep, drawn from the same
+        entropy. Runs already in the plan keep their splits, which are not drawn
+        again, even when only some of the runs were retained via keep_runs().
+        """
+
+        if num_rep < self.num_rep:
+            raise ValueError('Plan already has {} runs, more than {} requested'
+                             ''.format(self.num_rep, num_rep))
+
+        # each run in the plan accounts for exactly one stream, in order
+        unclaimed = Counter(row.tobytes() for row in self.train_idx)
+        new_rows = list()
+        seed_seq = np.random.SeedSequence(self.entropy)
+        while self.num_rep + len(new_rows) < num_rep:
+            row = self._draw(seed_seq.spawn(1)[0]).astype(np.int32)
+            if unclaimed[row.tobytes()] > 0:
+                unclaimed[row.tobytes()] -= 1
+            else:
+                new_rows.append(row)
+
+        if new_rows:
+            self.train_idx = np.vstack([self.train_idx] + new_rows)
+
+
+    def get_indices(self, run_id):
+        """Returns the row indices of the training and test sets of a given run"""
+
+        train_idx = self.train_idx[run_id]
+        in_test = np.ones(self.num_samplets, dtype=bool)
+        in_test[train_idx] = False
+
+        return train_idx, np.flatnonzero(in_test).astype(np.int32)
+
+
+    def test_mask(self):
+        """Boolean array of [run, samplet], True for samplets in the test set"""
+
+        mask = np.ones((self.num_rep, self.num_samplets), dtype=bool)
+        mask[np.arange(self.num_rep)[:, np.newaxis], self.train_idx] = False
+
+        return mask
+
+
+    def get_split(self, run_id, samplet_ids):
+        """Returns the training and test sets of samplet IDs for a given run"""
+
+        samplet_ids = np.asarray(samplet_ids, dtype=object)
+        if len(samplet_ids) != self.num_samplets:
+            raise ValueError('Number of samplet IDs ({}) does not match the plan '
+                             '({})'.format(len(samplet_ids), self.num_samplets))
+        train_idx, test_idx = self.get_indices(run_id)
+
+        return list(samplet_ids[train_idx]), list(samplet_ids[test_idx])
+
+
+def order_tasks_by_cost(run_ids, costs):
+    """
+    Returns the list of (run, dataset) tasks, ordered longest-first by the
+    estimated cost for each dataset, and then by run.
+
+    Starting the costliest tasks first avoids waiting on few stragglers at the end.
+    """
+
+    tasks = [(run, ds_id) for run in run_ids for ds_id in costs.keys()]
+
+    return sorted(tasks, key=lambda task: (-costs[task[1]], task[0]))
+
+
+class ComputeBudget(object):
+    """
+    Split of the total number of CPUs between the worker processes running the
+    (run, dataset) tasks, and the threads within each of them: BLAS and OpenMP
+    (via threadpoolctl), and n_jobs of the estimator or of the hyperparameter search.
+
+    Tasks are independent, so processes are preferred as long as there are enough
+    tasks to keep them busy, and the CPUs left over go to threads within each
+    process, never exceeding the total. The threads go to the search over the grid
+    only when running in the main process (workers of a multiprocessing pool can not
+    spawn their own) and the grid is large enough, and to the estimator otherwise
+    (e.g. trees of a forest). BLAS gets threads only when the data are large enough
+    for them to pay off.
+
+    Number of processes can be capped further e.g. to fit the memory available, in
+    which case threads make use of the CPUs left over.
+    """
+
+
+    def __init__(self,
+                 total_cpus,
+                 num_tasks,
+                 num_samplets,
+                 num_features,
+                 num_fits,
+                 num_threads=None,
+                 max_procs=None):
+        """Constructor."""
+
+        self.total_cpus = max(1, int(total_cpus))
+        num_tasks = max(1, int(num_tasks))
+        if max_procs is not None:
+            num_tasks = min(num_tasks, max(1, int(max_procs)))
+        if num_threads is None:
+            self.num_procs = min(self.total_cpus, num_tasks)
+            self.num_threads = max(1, self.total_cpus // self.num_procs)
+        else:
+            self.num_threads = max(1, min(int(num_threads), self.total_cpus))
+            self.num_procs = max(1, min(num_tasks,
+                                        self.total_cpus // self.num_threads))
+
+        if self.num_procs == 1 and \
+                num_fits >= cfg.min_fits_per_search_job * self.num_threads:
+            self.search_n_jobs = self.num_threads
+        else:
+            self.search_n_jobs = 1
+
+        if num_samplets * num_features >= cfg.min_data_size_for_blas_threads:
+            self.blas_threads = self.num_threads
+        else:
+            self.blas_threads = 1
+
+
+    def __str__(self):
+        """Human-readable summary"""
+
+        return '{} processes x {} threads (BLAS: {}, search: {})' \
+               ''.format(self.num_procs, self.num_threads, self.blas_threads,
+                         self.search_n_jobs)
+
+
+    @contextmanager
+    def limit_threads(self):
+        """Context limiting the threads of BLAS and OpenMP in current process"""
+
+        with threadpool_limits(limits={'blas'  : self.blas_threads,
+                                       'openmp': self.num_threads}):
+            if self.num_procs > 1:
+                # workers of a pool can not spawn processes for joblib, only threads
+                with parallel_backend('threading'):
+                    yield
+            else:
+                yield
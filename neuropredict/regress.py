@@ -45,8 +45,8 @@ def parse_args():
     user_args, user_feature_paths, user_feature_type, fs_subject_dir, \
     meta_data_path, meta_data_format, sample_ids, classes, out_dir, train_perc, \
     num_rep_cv, num_procs, reduced_dim_size, impute_strategy, covar_list, \
-    covar_method, grid_search_level, dim_red_method = parse_common_args(
-            parser)
+    covar_method, grid_search_level, dim_red_method, workflow_options = \
+        parse_common_args(parser)
 
     regressor = check_regressor(user_args.regressor)
 
@@ -63,7 +63,7 @@ def parse_args():
            train_perc, num_rep_cv, \
            reduced_dim_size, impute_strategy, num_procs, \
            grid_search_level, regressor, dim_red_method, \
-           covar_list, covar_method
+           covar_list, covar_method, workflow_options
 
 
 def cli():
@@ -77,7 +77,7 @@ def cli():
     subjects, classes, out_dir, user_options, user_feature_paths, \
     user_feature_type, train_perc, num_rep_cv, reduced_dim_size, impute_strategy, \
     num_procs, grid_search_level, regressor, dim_red_method, covar_list, \
-    covar_method = parse_args()
+    covar_method, workflow_options = parse_args()
 
     multi_ds = load_datasets(user_feature_paths, task_type='regress')
     covariates, deconfounder = check_covariates(multi_ds, covar_list, covar_method)
@@ -100,7 +100,7 @@ def cli():
                                    out_dir=out_dir,
                                    num_procs=num_procs,
                                    user_options=user_options,
-                                   checkpointing=True)
+                                   **workflow_options)
 
     out_results_path = regr_expt.run()
     timedelta = datetime.now() - init_time
@@ -135,7 +135,17 @@ class RegressionWorkflow(BaseWorkflow):
                  num_procs=cfg.DEFAULT_NUM_PROCS,
                  show_predicted_in_residuals_plot=False,
                  user_options=None,
-                 checkpointing=cfg.default_checkpointing):
+                 checkpointing=cfg.default_checkpointing,
+                 share_datasets=cfg.default_share_datasets,
+                 seed=cfg.SEED_RANDOM,
+                 early_stop_tol=cfg.default_early_stop_tol,
+                 early_stop_min_rep=cfg.default_early_stop_min_rep,
+                 max_search_fits=cfg.default_max_search_fits,
+                 max_search_time=cfg.default_max_search_time,
+                 oob_search=cfg.default_oob_search,
+                 num_threads=None,
+                 calibrate_memory=cfg.default_calibrate_memory,
+                 extend=False):
         super().__init__(datasets,
                          pred_model=pred_model,
                          impute_strategy=impute_strategy,
@@ -151,7 +161,17 @@ class RegressionWorkflow(BaseWorkflow):
                          num_procs=num_procs,
                          user_options=user_options,
                          checkpointing=checkpointing,
-                         workflow_type='regress')
+                         workflow_type='regress',
+                         share_datasets=share_datasets,
+                         seed=seed,
+                         early_stop_tol=early_stop_tol,
+                         early_stop_min_rep=early_stop_min_rep,
+                         max_search_fits=max_search_fits,
+                         max_search_time=max_search_time,
+                         oob_search=oob_search,
+                         num_threads=num_threads,
+                         calibrate_memory=calibrate_memory,
+                         extend=extend)
 
         # offering a choice of true vs. predicted target in the residuals plot
         self._show_predicted_in_residuals_plot = show_predicted_in_residuals_plot
@@ -190,11 +210,11 @@ class RegressionWorkflow(BaseWorkflow):
 
         for metric, m_data in self.results.metric_val.items():
             consolidated = np.empty((self.num_rep_cv, len(m_data)))
-            for index, ds_id in enumerate(self.datasets.modality_ids):
+            for index, ds_id in enumerate(self.results.result_ids):
                 consolidated[:, index] = m_data[ds_id]
 
             fig_out_path = pjoin(self._fig_out_dir, 'compare_{}'.format(metric))
-            compare_distributions(consolidated, self.datasets.modality_ids,
+            compare_distributions(consolidated, self.results.result_ids,
                                   fig_out_path, y_label=metric,
                                   horiz_line_loc=median_of_medians(consolidated),
                                   horiz_line_label='median of medians',
@@ -211,10 +231,10 @@ class RegressionWorkflow(BaseWorkflow):
 
         target_medians = list()
         residuals, true_targets, predicted = dict(), dict(), dict()
-        for index, ds_id in enumerate(self.datasets.modality_ids):
-            residuals[ds_id] = self._unroll(self.results.residuals, ds_id)
-            predicted[ds_id] = self._unroll(self.results.predicted_targets, ds_id)
-            true_targets[ds_id] = self._unroll(self.results.true_targets, ds_id)
+        for index, ds_id in enumerate(self.results.result_ids):
+            residuals[ds_id] = self.results.unroll('residuals', ds_id)
+            predicted[ds_id] = self.results.unroll('predicted_targets', ds_id)
+            true_targets[ds_id] = self.results.unroll('true_targets', ds_id)
             target_medians.append(np.median(true_targets[ds_id]))
 
             # residuals[ds_id], predicted[ds_id], true_targets[ds_id] = \
@@ -272,15 +292,5 @@ class RegressionWorkflow(BaseWorkflow):
     #     return [ np.array(lst) for lst in out_list ]
 
 
-    def _unroll(self, in_dict, ds_id):
-        """structure reformat"""
-
-        out_list = list()
-        for rep in range(self.num_rep_cv):
-            out_list.extend(in_dict[(ds_id, rep)])
-
-        return np.array(out_list)
-
-
 if __name__ == '__main__':
     cli()
@@ -4,27 +4,53 @@ Module defining methods and classes needed to manage results produced.
 
 """
 
+import csv
+import json
+import os
 import pickle
+import struct
+import zlib
 from abc import abstractmethod
-from os import remove
-from os.path import exists as pexists, join as pjoin
+from collections.abc import Mapping, MutableMapping
+from copy import copy
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from os import replace
+from os.path import dirname, join as pjoin
 from pathlib import Path
+from shutil import rmtree
 
 import numpy as np
+from numpy.lib.format import open_memmap
 
 from neuropredict import config as cfg
 from neuropredict.utils import is_iterable_but_not_str
 
+try:
+    import fcntl
+except ImportError:  # e.g. on Windows
+    fcntl = None
+
 
 class CVResults(object):
     """Class to store and organize the results for a CV run."""
 
+    # defaults for results saved before models were compared in a single run
+    model_ids = tuple()
+    _input_ids = None
+    # folder holding the fields below in columnar layout, when saved that way
+    _columnar_dir = None
+    _columnar_fields = ('predicted_targets', 'true_targets', 'attr')
+    # fields with a value per test samplet, in dense arrays once test_mask is set
+    _samplet_fields = ('predicted_targets', 'true_targets')
+    test_mask = None
 
     def __init__(self,
                  metric_set=(cfg.default_scoring_metric,),
                  num_rep=cfg.default_num_repetitions,
                  dataset_ids='dataset1',
-                 vars_to_load=cfg.clf_results_class_variables_to_load):
+                 vars_to_load=cfg.clf_results_class_variables_to_load,
+                 model_ids=None):
         "Constructor."
 
         if num_rep < 1 or not np.isfinite(num_rep):
@@ -40,6 +66,13 @@ class CVResults(object):
             # assuming only one feature/dataset
             self._dataset_ids = ('dataset1',)
 
+        # with multiple models, results are identified by (dataset, model) combos
+        self.model_ids = tuple(model_ids) if model_ids is not None else tuple()
+        self._input_ids = self._dataset_ids
+        self._dataset_ids = tuple(self.result_id(ds_id, model)
+                                  for ds_id in self._input_ids
+                                  for model in (self.model_ids or (None,)))
+
         if is_iterable_but_not_str(metric_set):
             self.metric_set = {func.__name__: func for func in metric_set}
             self.metric_val = dict()
@@ -64,6 +97,25 @@ class CVResults(object):
         self._max_width_ds_ids = max([len(str(ds)) for ds in self._dataset_ids]) + 1
 
 
+    def result_id(self, dataset_id, model=None):
+        """
+        Identifier of the results for a given dataset and model. Same as the
+        dataset id, unless multiple models are being compared.
+        """
+
+        if len(self.model_ids) < 2:
+            return dataset_id
+
+        return '{}{}{}'.format(dataset_id, cfg.model_id_separator, model)
+
+
+    @property
+    def result_ids(self):
+        """Identifiers of all the (dataset, model) combinations in the results"""
+
+        return self._dataset_ids
+
+
     def _init_new_metric(self, name):
         """Initializes a new metric with an array for all datasets"""
 
@@ -113,11 +165,255 @@ class CVResults(object):
         """
 
         if name not in self.attr:
-            self.attr[name] = dict()
+            if self.test_mask is not None and name in cfg.samplet_attr_names:
+                self.attr[name] = SampletField(self._dataset_ids, self.test_mask)
+            else:
+                self.attr[name] = dict()
 
         self.attr[name][(dataset_id, run_id)] = value
 
 
+    def set_test_mask(self, test_mask):
+        """
+        Switches the storage of fields with a value per test samplet (predictions,
+        true targets etc) to dense arrays of [run, dataset, samplet], given the
+        test set of each run as a boolean array of [run, samplet], in the order of
+        samplets in the predictions e.g. from the split plan.
+
+        Refer to SampletField for details.
+        """
+
+        self.test_mask = np.asarray(test_mask, dtype=bool)
+        if self.test_mask.shape[0] != self.num_rep:
+            raise ValueError('Test mask must have a row for each of {} runs'
+                             ''.format(self.num_rep))
+
+        # class labels are coded identically in predictions and true targets
+        codes = dict()
+        for name in self._samplet_fields:
+            dense = SampletField(self._dataset_ids, self.test_mask, codes=codes)
+            dense.update(getattr(self, name))
+            setattr(self, name, dense)
+
+        for name in cfg.samplet_attr_names:
+            if name in self.attr:
+                dense = SampletField(self._dataset_ids, self.test_mask)
+                dense.update(self.attr[name])
+                self.attr[name] = dense
+
+
+    def unroll(self, name, result_id):
+        """
+        Values of a field with a value per test samplet e.g. predicted_targets, for
+        a given result, concatenated over all the runs in their order.
+        """
+
+        field = getattr(self, name)
+        if isinstance(field, SampletField):
+            return field.unroll(result_id)
+
+        # results stored in dicts
+        return np.concatenate([field[(result_id, run)]
+                               for run in range(self.num_rep)
+                               if (result_id, run) in field])
+
+
+    def get_record(self, run_id, dataset_id):
+        """
+        Returns all the results for a single pair of (run, dataset), as a dict that
+        can be merged into another instance via add_record(). This is useful to
+        gather results produced in different processes.
+        """
+
+        key = (dataset_id, run_id)
+        record = dict(run_id=run_id,
+                      dataset_id=dataset_id,
+                      predicted=self.predicted_targets[key],
+                      true=self.true_targets[key],
+                      metrics={name: m_val[dataset_id][run_id]
+                               for name, m_val in self.metric_val.items()},
+                      attr={name: at_val[key]
+                            for name, at_val in self.attr.items() if key in at_val})
+        record.update(self._get_diagnostics(key))
+
+        return record
+
+
+    def add_record(self, record):
+        """Merges the results for a single (run, dataset) from get_record()"""
+
+        run_id, dataset_id = record['run_id'], record['dataset_id']
+        key = (dataset_id, run_id)
+        self.true_targets[key] = record['true']
+        self.predicted_targets[key] = record['predicted']
+
+        for name, value in record['metrics'].items():
+            self.add_metric(run_id, dataset_id, name, value)
+
+        for name, value in record['attr'].items():
+            self.add_attr(run_id, dataset_id, name, value)
+
+        self._add_diagnostics(key, record)
+
+        self._count += 1
+
+
+    def empty_copy(self, num_rep=None, dataset_ids=None):
+        """Returns an empty instance for the same metrics, repetitions & datasets"""
+
+        if num_rep is None:
+            num_rep = self.num_rep
+        if dataset_ids is None:
+            dataset_ids = self._input_ids
+        new = self.__class__(metric_set=list(self.metric_set.values()),
+                             num_rep=num_rep,
+                             dataset_ids=dataset_ids,
+                             model_ids=self.model_ids)
+        new.meta = dict(self.meta)
+
+        return new
+
+
+    def keep_runs(self, run_ids):
+        """
+        Retains the results only for the given runs, renumbering them in the given
+        order as 0, 1, 2 etc. e.g. when CV was stopped before all the repetitions.
+        """
+
+        kept = self.empty_copy(num_rep=len(run_ids))
+        if self.test_mask is not None:
+            kept.set_test_mask(self.test_mask[np.array(run_ids, dtype=np.int64)])
+        for new_id, run_id in enumerate(run_ids):
+            for res_id in self._dataset_ids:
+                record = self.get_record(run_id, res_id)
+                record['run_id'] = new_id
+                kept.add_record(record)
+
+        self.__dict__.update(kept.__dict__)
+
+
+    def extend(self, num_rep, test_mask=None, dataset_ids=None):
+        """
+        Grows the results to a larger number of repetitions and/or datasets,
+        keeping the existing ones as they are, e.g. to add more repetitions of CV,
+        or new datasets, to a completed run.
+
+        Parameters
+        ----------
+        num_rep : int
+            Total number of repetitions, existing ones included
+
+        test_mask : ndarray or None
+            Boolean array of [run, samplet] for all the repetitions, to store the
+            fields with a value per test samplet in dense arrays.
+            Refer to set_test_mask().
+
+        dataset_ids : Iterable or None
+            All the datasets, existing ones included. None keeps them as they are.
+
+        """
+
+        if num_rep < self.num_rep:
+            raise ValueError('Results can not shrink from {} to {} repetitions: '
+                             'use keep_runs() instead.'.format(self.num_rep,
+                                                                num_rep))
+        if dataset_ids is not None and \
+                not set(self._input_ids).issubset(dataset_ids):
+            raise ValueError('Datasets can only be added, and not removed: {} '
+                             'are missing'.format(set(self._input_ids)
+                                                  .difference(dataset_ids)))
+
+        grown = self.empty_copy(num_rep=num_rep, dataset_ids=dataset_ids)
+        if test_mask is not None:
+            grown.set_test_mask(test_mask)
+        for run_id in range(self.num_rep):
+            for res_id in self._dataset_ids:
+                if (res_id, run_id) in self.predicted_targets:
+                    grown.add_record(self.get_record(run_id, res_id))
+
+        self.__dict__.update(grown.__dict__)
+
+
+    def partial_summary(self, run_ids):
+        """
+        Summary of each metric over the given runs e.g. those completed so far, as
+        a dict keyed by metric and then result, with the median, SD and the number
+        of runs with a finite value. Results with no such runs are skipped.
+        """
+
+        run_ids = np.array(sorted(run_ids), dtype=np.int64)
+        summary = dict()
+        for metric, mdict in self.metric_val.items():
+            summary[metric] = dict()
+            for res_id, distr in mdict.items():
+                values = distr[run_ids]
+                values = values[np.isfinite(values)]
+                if len(values) < 1:
+                    continue
+                summary[metric][res_id] = dict(median=float(np.median(values)),
+                                               SD=float(np.std(values)),
+                                               num_runs=len(values))
+
+        return summary
+
+
+    def median_ci_width(self, run_ids,
+                        num_boot=cfg.early_stop_num_bootstraps,
+                        ci_level=cfg.early_stop_ci_level,
+                        seed=None):
+        """
+        Width of the bootstrap confidence interval of the median of each metric,
+        over the given runs, for each dataset.
+
+        Parameters
+        ----------
+        run_ids : Iterable
+            List of runs to be included
+
+        num_boot : int
+            Number of bootstrap samples
+
+        ci_level : float
+            Confidence level of the interval, between 0 and 1
+
+        seed : int or None
+            Seed for the bootstrap, for reproducibility
+
+        Returns
+        -------
+        ci_width : dict
+            Width of the CI, keyed in by (metric, dataset). Metrics not computed
+            for any of the runs (all NaN) are skipped.
+        """
+
+        run_ids = np.array(run_ids, dtype=np.int64)
+        rng = np.random.default_rng(seed)
+        boot_idx = rng.integers(0, len(run_ids), size=(num_boot, len(run_ids)))
+        tail = 50 * (1.0 - ci_level)
+
+        ci_width = dict()
+        for metric, mdict in self.metric_val.items():
+            for ds_id, distr in mdict.items():
+                values = distr[run_ids]
+                if np.all(np.isnan(values)):
+                    continue
+                boot_medians = np.nanmedian(values[boot_idx], axis=1)
+                low, high = np.nanpercentile(boot_medians, [tail, 100 - tail])
+                ci_width[(metric, ds_id)] = high - low
+
+        return ci_width
+
+
+    @abstractmethod
+    def _get_diagnostics(self, key):
+        """Returns the task-specific diagnostics for a (dataset, run) as a dict"""
+
+
+    @abstractmethod
+    def _add_diagnostics(self, key, record):
+        """Adds the task-specific diagnostics for a (dataset, run) from record"""
+
+
     def add_meta(self, name, value):
         """
         Method to store experiment-wise meta data (for all runs and datasets).
@@ -171,6 +467,9 @@ class CVResults(object):
     def load(self, path):
         """Method to load previously saved results e.g. to redo visualizations"""
 
+        if Path(path).is_dir():
+            return self.load_columnar(path)
+
         try:
             with open(path, 'rb') as res_fid:
                 full_results = pickle.load(res_fid)
@@ -180,16 +479,183 @@ class CVResults(object):
             results = full_results['results']
             for var in self.variables_to_load:
                 setattr(self, var, getattr(results, var))
+            if self._input_ids is None:
+                self._input_ids = self._dataset_ids
+
+            # samplet-wise fields are saved separately, next to the pickle
+            self._columnar_dir = results._columnar_dir
+            self.attach_columnar(dirname(path))
 
             # dynamically computing what is needed
-            self._max_width_metric = max(
-                    [len(mt) for mt in self.metric_set.keys()]) + 1
-            self._max_width_ds_ids = max(
-                    [len(str(ds)) for ds in self._dataset_ids]) + 1
+            self._set_print_widths()
 
         return self
 
 
+    def _set_print_widths(self):
+        """Widths of identifiers for pretty printing"""
+
+        self._max_width_metric = max([len(mt) for mt in self.metric_val.keys()]) + 1
+        self._max_width_ds_ids = max([len(str(ds)) for ds in self._dataset_ids]) + 1
+
+
+    def save_columnar(self, out_dir, samplet_ids=None):
+        """
+        Saves the results in a columnar layout on disk, whose arrays are
+        memory-mapped and read lazily when loaded back with load_columnar().
+        Refer to ColumnarStore for details of the layout.
+
+        Parameters
+        ----------
+        out_dir : str or Path
+            Folder to save the results to
+
+        samplet_ids : Iterable or None
+            IDs of all the samplets, in the order of rows in the split plan
+
+        Returns
+        -------
+        out_dir : Path
+            Folder containing the results
+        """
+
+        # written to a new folder, and swapped in only when complete, to never lose
+        #   the results saved earlier, which may even be in use (memory-mapped)
+        out_dir = Path(out_dir)
+        tmp_dir = out_dir.with_name('{}.tmp'.format(out_dir.name))
+        rmtree(tmp_dir, ignore_errors=True)
+
+        test_mask, by_samplet = self._columnar_test_mask()
+        store = ColumnarStore.create(tmp_dir, self._dataset_ids, self.num_rep,
+                                     test_mask, by_samplet, samplet_ids)
+        store.write_metrics(self.metric_val)
+        store.write_meta(self.meta)
+        store.write_samplet_field('predicted_targets', self.predicted_targets)
+        store.write_samplet_field('true_targets', self.true_targets)
+        for name, values in self.attr.items():
+            if name in cfg.samplet_attr_names:
+                store.write_samplet_field(_attr_field(name), values)
+            else:
+                store.write_dense_field(_attr_field(name), values)
+        self._save_columnar_diagnostics(store)
+
+        store.finalize(results_class=self.__class__.__name__,
+                       count=int(self._count),
+                       input_ids=list(self._input_ids),
+                       model_ids=list(self.model_ids),
+                       metric_set=list(self.metric_set.keys()),
+                       attr_names=list(self.attr.keys()))
+
+        if out_dir.exists():
+            old_dir = out_dir.with_name('{}.old'.format(out_dir.name))
+            rmtree(old_dir, ignore_errors=True)
+            out_dir.rename(old_dir)
+            tmp_dir.rename(out_dir)
+            rmtree(old_dir, ignore_errors=True)
+        else:
+            tmp_dir.rename(out_dir)
+
+        return out_dir
+
+
+    def load_columnar(self, in_dir):
+        """
+        Loads the results saved with save_columnar(). Metrics and meta data are
+        read in full, whereas the samplet-wise fields are memory-mapped, and values
+        for a given (dataset, run) are read from disk only when accessed.
+        """
+
+        store = ColumnarStore(in_dir)
+        header = store.header
+
+        self.num_rep = np.int64(header['num_rep'])
+        self._count = header['count']
+        self._dataset_ids = store.result_ids
+        self._input_ids = tuple(header['input_ids'])
+        self.model_ids = tuple(header['model_ids'])
+        self.metric_val = store.read_metrics()
+        self.metric_set = dict()
+        for name in header['metric_set']:
+            func = _metric_func(name)
+            if func is not None:
+                self.metric_set[name] = func
+        self.meta = store.read_meta()
+
+        # memory-mapped, as is, to keep opening even large results quick
+        self.test_mask = store.test_mask if store.header['by_samplet'] else None
+        self.predicted_targets = store.field('predicted_targets')
+        self.true_targets = store.field('true_targets')
+        self.attr = {name: store.field(_attr_field(name))
+                     for name in header['attr_names']}
+        self._load_columnar_diagnostics(store)
+
+        self._set_print_widths()
+
+        return self
+
+
+    def attach_columnar(self, base_dir):
+        """Loads the samplet-wise fields saved in columnar layout, if any, from the
+        folder the summary of these results was saved to."""
+
+        if self._columnar_dir is not None:
+            self.load_columnar(pjoin(base_dir, self._columnar_dir))
+
+
+    def detached_copy(self, columnar_dir):
+        """
+        Shallow copy of these results without the samplet-wise fields, which are
+        to be saved separately in columnar layout in a given (relative) folder.
+        Useful to pickle the summary along with other state, while keeping it small.
+        """
+
+        detached = copy(self)
+        for name in self._columnar_fields:
+            setattr(detached, name, dict())
+        detached._columnar_dir = columnar_dir
+
+        return detached
+
+
+    def _columnar_test_mask(self):
+        """
+        Mask of the test samplets in each run, as an array of [run, samplet], with
+        test samplets in the order of predictions. The samplet axis follows the rows
+        of the split plan when available and consistent with the predictions, and
+        positions within the test set otherwise.
+        """
+
+        if self.test_mask is not None:
+            return self.test_mask, True
+
+        sizes = np.zeros(self.num_rep, dtype=np.int64)
+        for (_, run), predicted in self.predicted_targets.items():
+            sizes[run] = len(predicted)
+
+        train_idx = self.meta.get(cfg.split_plan_name, None)
+        if train_idx is not None and sizes.max() > 0 and \
+                np.shape(train_idx)[0] == self.num_rep:
+            train_idx = np.asarray(train_idx)
+            mask = np.ones((self.num_rep, train_idx.shape[1] + sizes.max()),
+                           dtype=bool)
+            mask[np.arange(self.num_rep)[:, np.newaxis], train_idx] = False
+            done = sizes > 0
+            if np.array_equal(mask[done].sum(axis=1), sizes[done]):
+                return mask, True
+
+        return np.arange(sizes.max()) < sizes[:, np.newaxis], False
+
+
+    @abstractmethod
+    def _save_columnar_diagnostics(self, store):
+        """Saves the task-specific diagnostics to a ColumnarStore"""
+
+
+    @abstractmethod
+    def _load_columnar_diagnostics(self, store):
+        """Loads the task-specific diagnostics from a ColumnarStore"""
+
+
     def to_array(self, metric, ds_ids=None):
         """
         Consolidates a given metric into a flat array
@@ -238,47 +704,272 @@ class CVResults(object):
         return consolidated, ds_ids
 
 
-    @abstractmethod
-    def _to_save(self):
-        """Returns a list of variables to be persisted to disk"""
+    def to_model_array(self, metric):
+        """
+        Consolidates a given metric into an array with separate axes for datasets
+        and models, e.g. for paired comparisons of models on the same splits.
 
+        Returns
+        --------
+        result : ndarray
+            An array of dimensions num_rep_CV X num_datasets X num_models
 
-    @staticmethod
-    def _dump_file_name(run_id):
-        return '{}_{}.pkl'.format(cfg.quick_dump_prefix, run_id)
+        ds_ids, model_ids : tuple
+            Identifiers of datasets and models, in the order of the axes
+        """
+
+        metric = metric.lower()
+        if metric not in self.metric_val:
+            raise ValueError('Unrecognized metric: {}\n\tMust be one of {}'
+                             ''.format(metric, tuple(self.metric_val.keys())))
 
+        model_ids = self.model_ids or (None,)
+        consolidated = np.empty((self.num_rep, len(self._input_ids), len(model_ids)))
+        for ds_index, ds_id in enumerate(self._input_ids):
+            for model_index, model in enumerate(model_ids):
+                consolidated[:, ds_index, model_index] = \
+                    self.metric_val[metric][self.result_id(ds_id, model)]
 
-    def dump(self, out_dir, run_id):
-        """Method for quick dump, for checkpointing purposes"""
+        return consolidated, self._input_ids, model_ids
 
-        out_path = pjoin(out_dir, self._dump_file_name(run_id))
-        if pexists(out_path):
-            remove(out_path)
-        with open(out_path, 'wb') as df:
-            pickle.dump(self._to_save(), df)
 
-        print()
+    def checkpoint(self, journal, run_id):
+        """Appends the results of a given run, for all datasets, to a journal"""
 
+        for res_id in self._dataset_ids:
+            journal.append(self.get_record(run_id, res_id))
 
-    @abstractmethod
-    def gather_dumps(self, dump_dir):
-        """Gather results from various 'quick dumps' in a directory"""
+
+    def add_complete_runs(self, records):
+        """
+        Adds the results only for the runs complete for all datasets, from a list
+        of records e.g. replayed from a CheckpointJournal, to resume an interrupted
+        run. Later records for the same (run, dataset) replace earlier ones.
+        Datasets already in these results for a run (e.g. when datasets were
+        added to completed results) count towards its completion.
+
+        Returns
+        -------
+        added_runs : list
+            List of runs whose results were added.
+        """
+
+        latest = dict()
+        for record in records:
+            if 0 <= record['run_id'] < self.num_rep:
+                latest[(record['run_id'], record['dataset_id'])] = record
+
+        added_runs = list()
+        for run in sorted(set(run for run, _ in latest)):
+            if all((run, res_id) in latest or
+                   (res_id, run) in self.predicted_targets
+                   for res_id in self._dataset_ids):
+                for res_id in self._dataset_ids:
+                    if (run, res_id) in latest:
+                        self.add_record(latest[(run, res_id)])
+                added_runs.append(run)
+
+        return added_runs
+
+
+    def export(self, out_dir, samplet_ids=None, to_csv=False, num_procs=1):
+        """
+        Exports the results in bulk, in a portable columnar layout, for use outside
+        this library e.g. in dashboards.
+
+        Each table is a folder of .npy files, one per column, described along with
+        the results in manifest.json. Categorical columns (class labels, samplet
+        IDs etc) are stored as integer codes into their list of categories in the
+        manifest, except samplet IDs, which are listed only once in the manifest.
+        Tables are:
+
+            metrics : a row per (result, run), with a column per metric
+            predictions : a row per (run, test samplet) for each result, with the
+                true and predicted targets, and predicted probabilities per class
+                or residuals, if available
+            feature importance : a row per (run, feature) for each result
+            confusion_matrix : a row per (run, true, predicted class) for each
+                result, with their count, for classification
+
+        Tables of each result are written one result at a time, to keep the memory
+        usage flat regardless of the size of the results.
+
+        Parameters
+        ----------
+        out_dir : str or Path
+            Folder to export the results to
+
+        samplet_ids : Iterable or None
+            IDs of all the samplets, in the order of the test mask. Samplets are
+            identified by their position otherwise.
+
+        to_csv : bool
+            Whether to write a CSV file for each table as well
+
+        num_procs : int
+            Number of results to be exported in parallel
+
+        Returns
+        -------
+        out_dir : Path
+            Folder containing the exported results
+        """
+
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        num_procs = max(1, int(num_procs))
+
+        test_mask, by_samplet = self._columnar_test_mask()
+        if not by_samplet or samplet_ids is None or \
+                len(samplet_ids) != test_mask.shape[1]:
+            samplet_ids = None
+        else:
+            samplet_ids = [str(sid) for sid in samplet_ids]
+
+        def export_result(res_index):
+            res_id = self._dataset_ids[res_index]
+            tables = self._export_tables(res_id, test_mask, by_samplet, samplet_ids)
+            return dict(result_id=res_id,
+                        tables={name: _write_table(out_dir, 'result{}/{}'
+                                                   ''.format(res_index, name),
+                                                   columns)
+                                for name, columns in tables.items()})
+
+        tables = dict(metrics=_write_table(out_dir, 'metrics',
+                                           self._export_metrics()))
+        # threads suffice, as it is mostly reading and writing arrays
+        with ThreadPool(processes=num_procs) as pool:
+            results = pool.map(export_result, range(len(self._dataset_ids)))
+
+        if to_csv:
+            all_tables = list(tables.values()) + [spec for res in results
+                                                  for spec in res['tables'].values()]
+            shared = {cfg.export_samplet_ids_name: samplet_ids}
+            jobs = [(out_dir, spec, shared) for spec in all_tables]
+            if num_procs > 1:
+                with Pool(processes=num_procs) as pool:
+                    pool.map(_table_to_csv, jobs)
+            else:
+                for job in jobs:
+                    _table_to_csv(job)
+
+        manifest = dict(format=cfg.export_format_version,
+                        results_class=self.__class__.__name__,
+                        num_rep=int(self.num_rep),
+                        result_ids=list(self._dataset_ids),
+                        input_ids=list(self._input_ids),
+                        model_ids=list(self.model_ids),
+                        tables=tables,
+                        results=results)
+        # referred to by the samplet columns
+        manifest[cfg.export_samplet_ids_name] = samplet_ids
+        manifest_path = out_dir / cfg.export_manifest_name
+        tmp_path = out_dir / '{}.tmp'.format(cfg.export_manifest_name)
+        with open(tmp_path, 'w') as mf:
+            json.dump(manifest, mf, indent=1, default=_to_json)
+        replace(tmp_path, manifest_path)
+
+        return out_dir
+
+
+    def _export_metrics(self):
+        """Columns of the table of metrics, with a row per (result, run)"""
+
+        res_codes = np.repeat(np.arange(len(self._dataset_ids), dtype=np.int32),
+                              self.num_rep)
+        runs = np.tile(np.arange(self.num_rep, dtype=np.int32),
+                       len(self._dataset_ids))
+        columns = [('result', res_codes, list(self._dataset_ids)),
+                   ('run', runs, None)]
+        for name, m_val in self.metric_val.items():
+            values = np.concatenate([np.asarray(m_val[res_id], dtype=np.float64)
+                                     for res_id in self._dataset_ids])
+            columns.append((name, values, None))
+
+        return columns
+
+
+    def _export_tables(self, res_id, test_mask, by_samplet, samplet_ids):
+        """Tables of the results for a single (dataset, model), as lists of columns
+        of (name, values, categories)"""
+
+        tables = dict()
+
+        fields = [(name, getattr(self, name)) for name in self._samplet_fields]
+        fields.extend((name, self.attr[name])
+                      for name in cfg.samplet_attr_names if name in self.attr)
+        columns, class_labels = list(), None
+        for name, field in fields:
+            runs, samplets, values, categories = _samplet_rows(
+                    field, res_id, self.num_rep, test_mask, by_samplet)
+            if not columns:
+                if len(runs) < 1:
+                    break
+                # IDs are listed once in the manifest, instead of in every table
+                columns = [('run', runs, None),
+                           ('samplet', samplets,
+                            cfg.export_samplet_ids_name if samplet_ids else None)]
+            elif len(runs) != len(columns[0][1]):
+                continue  # e.g. probabilities not available for every run
+
+            if name == 'true_targets' and categories is not None:
+                # classes are sorted in the predicted probabilities
+                class_labels = sorted(categories)
+            if values.ndim > 1:
+                labels = class_labels if class_labels is not None and \
+                                         len(class_labels) == values.shape[1] \
+                    else range(values.shape[1])
+                columns.extend(('{}_{}'.format(name, label), values[:, index], None)
+                               for index, label in enumerate(labels))
+            else:
+                columns.append((name, values, categories))
+        if columns:
+            tables['predictions'] = columns
+
+        # attributes with a vector of values per run e.g. feature importance
+        for name, field in self.attr.items():
+            if name in cfg.samplet_attr_names:
+                continue
+            runs, values = list(), list()
+            for run in range(self.num_rep):
+                value = field.get((res_id, run), None)
+                if value is not None:
+                    runs.append(run)
+                    values.append(np.asarray(value))
+            if not values or any(val.ndim != 1 or val.dtype.kind not in 'biuf'
+                                 for val in values) or \
+                    len(set(len(val) for val in values)) > 1:
+                continue
+            num_values = len(values[0])
+            tables[name] = [
+                ('run', np.repeat(np.array(runs, dtype=np.int32), num_values), None),
+                ('feature', np.tile(np.arange(num_values, dtype=np.int32),
+                                    len(runs)), None),
+                (name, np.concatenate(values), None)]
+
+        tables.update(self._export_diagnostics(res_id))
+
+        return tables
 
 
     @abstractmethod
-    def export(self):
-        "Method to export the results to different formats (e.g. pyradigm or CSV)"
+    def _export_diagnostics(self, res_id):
+        """Tables of the task-specific diagnostics for a single result"""
 
 
 class ClassifyCVResults(CVResults):
     """Custom CVResults class to accommodate classification-specific evaluation."""
 
+    _columnar_fields = CVResults._columnar_fields + ('confusion_mat',
+                                                     'misclfd_samplets')
+
 
     def __init__(self,
                  metric_set=cfg.default_metric_set_classification,
                  num_rep=cfg.default_num_repetitions,
                  dataset_ids=None,
-                 path=None):
+                 path=None,
+                 model_ids=None):
         """Constructor."""
 
         if path is not None:
@@ -292,10 +983,11 @@ class ClassifyCVResults(CVResults):
             super().__init__(metric_set=metric_set,
                              num_rep=num_rep,
                              dataset_ids=dataset_ids,
-                             vars_to_load=cfg.clf_results_class_variables_to_load)
+                             vars_to_load=cfg.clf_results_class_variables_to_load,
+                             model_ids=model_ids)
 
-        self.confusion_mat = dict()  # confusion matrix
-        self.misclfd_samplets = dict()  # list of misclassified samplets
+            self.confusion_mat = dict()  # confusion matrix
+            self.misclfd_samplets = dict()  # list of misclassified samplets
 
 
     def add_diagnostics(self, run_id, dataset_id, conf_mat, misclfd_ids):
@@ -305,61 +997,112 @@ class ClassifyCVResults(CVResults):
         self.misclfd_samplets[(dataset_id, run_id)] = misclfd_ids
 
 
-    def export(self):
-        """To export results in portable format reusable outside this library"""
+    def misclassification_rate(self):
+        """
+        Fraction of the runs each samplet was misclassified in, out of the runs it
+        was tested in, for all the results.
 
-        raise NotImplementedError()
+        Returns
+        -------
+        rate : ndarray
+            Array of [dataset, samplet], with NaN for samplets never tested. The
+            samplet axis follows the test mask set via set_test_mask().
 
+        Raises
+        ------
+        ValueError
+            If predictions are not stored in dense arrays
+        """
 
-    def _to_save(self):
-        """Returns a list of variables to be persisted to disk"""
+        predicted, true_tgts = self.predicted_targets, self.true_targets
+        if not isinstance(predicted, SampletField) or \
+                not isinstance(true_tgts, SampletField):
+            raise ValueError('Predictions are not stored in dense arrays: '
+                             'set the test mask first!')
 
-        return [self.predicted_targets, self.true_targets, self.metric_val,
-                self.attr, self.meta,
-                self.confusion_mat, self.misclfd_samplets]
+        pred_values = predicted.values
+        if predicted.classes is not None:
+            # codes of predictions in terms of the codes of true targets, with the
+            #   sentinel -1 picking the last element, which maps it to -1 again
+            lookup = np.array([true_tgts.codes.get(label, -2)
+                               for label in predicted.classes] + [-1])
+            pred_values = lookup[pred_values]
 
+        tested = predicted.tested & true_tgts.tested
+        num_misclfd = np.sum((pred_values != true_tgts.values) & tested, axis=0)
+        num_tested = np.sum(tested, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return num_misclfd / num_tested
 
-    def gather_dumps(self, dump_dir):
-        """Gather results from various 'quick dumps' in a directory"""
 
-        print('Gathering results from disk for {} reps ...'.format(self.num_rep))
+    def _get_diagnostics(self, key):
+        """Returns the classification diagnostics for a (dataset, run)"""
 
-        self._count = 0
+        return dict(confusion_mat=self.confusion_mat[key],
+                    misclfd_samplets=self.misclfd_samplets[key])
+
+
+    def _add_diagnostics(self, key, record):
+        """Adds the classification diagnostics for a (dataset, run) from record"""
+
+        self.confusion_mat[key] = record['confusion_mat']
+        self.misclfd_samplets[key] = record['misclfd_samplets']
+
+
+    def _export_diagnostics(self, res_id):
+        """Confusion matrices of a single result, with a row per (run, true class,
+        predicted class), in the order of the target set"""
+
+        runs, matrices = list(), list()
         for run in range(self.num_rep):
-            with open(pjoin(dump_dir, self._dump_file_name(run)), 'rb') as df:
-                res = pickle.load(df)
+            conf_mat = self.confusion_mat.get((res_id, run), None)
+            if conf_mat is not None:
+                runs.append(run)
+                matrices.append(np.asarray(conf_mat))
+        if not matrices:
+            return dict()
 
-            # unpacking results : order must match that returned by self._to_save()
-            pred_tgts, true_tgts, metr_val, attrs, meta, conf_mat, misclfd = res
+        matrices = np.stack(matrices)
+        labels = self.meta.get('target_set', None)
+        if labels is not None and len(labels) != matrices.shape[1]:
+            labels = None
+        run_index, true_index, pred_index = np.indices(matrices.shape)
+        return dict(confusion_matrix=[
+            ('run', np.array(runs, dtype=np.int32)[run_index.ravel()], None),
+            ('true', true_index.ravel().astype(np.int32), labels),
+            ('predicted', pred_index.ravel().astype(np.int32), labels),
+            ('count', matrices.ravel(), None)])
 
-            for ds in self._dataset_ids:
-                self.true_targets[(ds, run)] = true_tgts[(ds, run)]
-                self.predicted_targets[(ds, run)] = pred_tgts[(ds, run)]
 
-                for m_name in self.metric_val.keys():
-                    self.add_metric(run, ds, m_name, metr_val[m_name][ds][run])
+    def _save_columnar_diagnostics(self, store):
+        """Saves the classification diagnostics to a ColumnarStore"""
 
-                for at_name in attrs.keys():
-                    self.add_attr(run, ds, at_name, attrs[at_name][(ds, run)])
+        store.write_dense_field('confusion_mat', self.confusion_mat)
+        # misclassified samplets are derived from the predictions when loading
 
-                # classify specific
-                self.add_diagnostics(run, ds, conf_mat[(ds, run)],
-                                     misclfd[(ds, run)])
 
-                self._count += 1
+    def _load_columnar_diagnostics(self, store):
+        """Loads the classification diagnostics from a ColumnarStore"""
 
-        print('  Done.')
+        self.confusion_mat = store.field('confusion_mat')
+        self.misclfd_samplets = DerivedField(_misclassified,
+                                             self.predicted_targets,
+                                             self.true_targets)
 
 
 class RegressCVResults(CVResults):
     """Custom CVResults class to accommodate classification-specific evaluation."""
 
+    _columnar_fields = CVResults._columnar_fields + ('residuals',)
+    _samplet_fields = CVResults._samplet_fields + ('residuals',)
+
 
     def __init__(self,
                  metric_set=cfg.default_metric_set_regression,
                  num_rep=cfg.default_num_repetitions,
                  dataset_ids=None,
-                 path=None):
+                 path=None,
+                 model_ids=None):
         "Constructor."
 
         if path is not None:
@@ -373,9 +1116,10 @@ class RegressCVResults(CVResults):
             super().__init__(metric_set=metric_set,
                              num_rep=num_rep,
                              dataset_ids=dataset_ids,
-                             vars_to_load=cfg.regr_results_class_variables_to_load)
+                             vars_to_load=cfg.regr_results_class_variables_to_load,
+                             model_ids=model_ids)
 
-        self.residuals = dict()
+            self.residuals = dict()
 
 
     def add_diagnostics(self, run_id, dataset_id, true_targets, predicted):
@@ -385,47 +1129,900 @@ class RegressCVResults(CVResults):
         self.residuals[(dataset_id, run_id)] = residuals
 
 
-    def _to_save(self):
-        """Returns a list of variables to be persisted to disk"""
+    def _get_diagnostics(self, key):
+        """Returns the regression diagnostics for a (dataset, run)"""
 
-        return [self.predicted_targets, self.true_targets, self.metric_val,
-                self.attr, self.meta,
-                self.residuals]
+        return dict(residuals=self.residuals[key])
 
 
-    def gather_dumps(self, dump_dir):
-        """Gather results from various 'quick dumps' in a directory"""
+    def _add_diagnostics(self, key, record):
+        """Adds the regression diagnostics for a (dataset, run) from record"""
 
-        print('Gathering results from disk for {} reps ...'.format(self.num_rep))
+        self.residuals[key] = record['residuals']
 
-        self._count = 0
-        for run in range(self.num_rep):
-            with open(pjoin(dump_dir, self._dump_file_name(run)), 'rb') as df:
-                res = pickle.load(df)
 
-            # unpacking results : order must match that returned by self._to_save()
-            pred_tgts, true_tgts, metr_val, attrs, meta, resids = res
+    def _save_columnar_diagnostics(self, store):
+        """Saves the regression diagnostics to a ColumnarStore"""
+
+        store.write_samplet_field('residuals', self.residuals)
+
+
+    def _load_columnar_diagnostics(self, store):
+        """Loads the regression diagnostics from a ColumnarStore"""
+
+        self.residuals = store.field('residuals')
+
+
+    def _export_diagnostics(self, res_id):
+        """Residuals are exported along with the predictions"""
+
+        return dict()
+
+
+class CheckpointJournal(object):
+    """
+    Append-only journal of the results of each (run, dataset), written as soon as
+    they are available, to checkpoint and resume interrupted runs.
+
+    Each entry is a pickled record framed by its length and CRC32 checksum, and is
+    written in a single call while holding an exclusive lock on the file, so that
+    entries from multiple processes never interleave. Entries are replayed in the
+    order they were written, until the first incomplete or corrupt entry e.g. from
+    a process killed while writing it. First entry identifies the experiment, so
+    results from different experiments are never mixed.
+    """
 
-            for ds in self._dataset_ids:
-                self.true_targets[(ds, run)] = true_tgts[(ds, run)]
-                self.predicted_targets[(ds, run)] = pred_tgts[(ds, run)]
+    _frame = struct.Struct('<QI')  # length and checksum of the entry
 
-                for m_name in self.metric_val.keys():
-                    self.add_metric(run, ds, m_name, metr_val[m_name][ds][run])
 
-                for at_name in attrs.keys():
-                    self.add_attr(run, ds, at_name, attrs[at_name][(ds, run)])
+    def __init__(self, path):
+        """Constructor."""
+
+        self.path = Path(path)
+
+
+    def start(self, expt_config=None):
+        """Starts a new journal for a given experiment, discarding any existing"""
+
+        with open(self.path, 'wb'):
+            pass
+        self.append({cfg.expt_config_name: expt_config})
+
+
+    def header(self):
+        """Config of the experiment that started the journal, if it exists"""
+
+        if not self.path.exists():
+            return None
+
+        entries, _ = self.replay(max_entries=1)
+        if len(entries) < 1:
+            return None
+
+        return entries[0].get(cfg.expt_config_name, None)
+
+
+    def resume(self, expt_config=None):
+        """
+        Returns the records in the journal when it was started by the same
+        experiment, discarding any incomplete entry at its end, so that new records
+        can be appended. Otherwise, starts a new journal.
+        """
+
+        entries, valid_size = list(), 0
+        if self.path.exists():
+            entries, valid_size = self.replay()
+
+        if len(entries) < 1 or \
+                entries[0].get(cfg.expt_config_name, None) != expt_config:
+            self.start(expt_config)
+            return list()
+
+        os.truncate(self.path, valid_size)
+        return entries[1:]
+
+
+    def append(self, entry):
+        """Appends an entry to the journal"""
+
+        payload = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        data = self._frame.pack(len(payload), zlib.crc32(payload)) + payload
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            view = memoryview(data)
+            while len(view) > 0:
+                view = view[os.write(fd, view):]
+        finally:
+            # closing the file releases the lock too
+            os.close(fd)
+
+
+    def replay(self, max_entries=None):
+        """
+        Reads the entries in the order they were written, stopping at the first
+        incomplete or corrupt entry, or after max_entries if given.
+
+        Returns
+        -------
+        entries : list
+            Entries read from the journal
+
+        valid_size : int
+            Size of the journal up to the end of the last valid entry
+        """
+
+        entries, valid_size = list(), 0
+        with open(self.path, 'rb') as jf:
+            while max_entries is None or len(entries) < max_entries:
+                frame = jf.read(self._frame.size)
+                if len(frame) < self._frame.size:
+                    break
+                length, checksum = self._frame.unpack(frame)
+                payload = jf.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                try:
+                    entries.append(pickle.loads(payload))
+                except Exception:
+                    break
+                valid_size = jf.tell()
+
+        return entries, valid_size
+
+
+class ColumnarStore(object):
+    """
+    Columnar layout of the results on disk: a folder with one .npy file per field,
+    holding its values for all the (run, dataset) pairs in a dense array, and a
+    small JSON header describing them.
+
+    Fields with a value per test samplet (e.g. predictions) are indexed by
+    [run, dataset, samplet], with samplets not in the test set filled with NaN, or
+    with -1 for categorical values (e.g. class labels) stored as codes. The samplet
+    axis follows the list of samplet IDs when the split plan is known. Other fields
+    (e.g. confusion matrices) are indexed by [run, ...], separately for each
+    dataset, as their shapes can differ across datasets. Which (run, dataset) pairs
+    have a value is recorded in a boolean array for each field.
+
+    Arrays are memory-mapped when loaded, and only the slices accessed are read.
+    """
+
+
+    def __init__(self, path):
+        """Opens an existing store for reading."""
+
+        self.path = Path(path)
+        try:
+            with open(self.path / cfg.columnar_header_name) as hdr_fid:
+                header = json.load(hdr_fid)
+        except Exception:
+            raise IOError('Unable to read the header of results in {}'
+                          ''.format(self.path))
+
+        if header.get('format', None) != cfg.columnar_format_version:
+            raise IOError('Unsupported format of results in {}'.format(self.path))
+
+        self._init_state(header)
+
+
+    def _init_state(self, header):
+        """Sets up the state common to reading and writing"""
+
+        self.header = header
+        self.result_ids = tuple(header['result_ids'])
+        self.index = {res_id: ix for ix, res_id in enumerate(self.result_ids)}
+        self._arrays = dict()
+
+
+    @classmethod
+    def create(cls, path, result_ids, num_rep, test_mask, by_samplet=True,
+               samplet_ids=None):
+        """
+        Creates an empty store, to be populated via the write_*() methods, and
+        then finalized.
+
+        Parameters
+        ----------
+        path : str or Path
+            Folder to create the store in
+
+        result_ids : Iterable
+            Identifiers of the results, in the order of the dataset axis
+
+        num_rep : int
+            Number of repetitions of CV
+
+        test_mask : ndarray
+            Boolean array of [run, samplet] identifying the test set of each run
+
+        by_samplet : bool
+            Whether the samplet axis follows the list of samplets (given the split
+            plan), or merely positions within the test set
+
+        samplet_ids : Iterable or None
+            IDs of all the samplets, stored only when by_samplet is True
+
+        """
+
+        store = cls.__new__(cls)
+        store.path = Path(path)
+        store.path.mkdir(parents=True, exist_ok=True)
+
+        test_mask = np.asarray(test_mask, dtype=bool)
+        if not by_samplet or samplet_ids is None or \
+                len(samplet_ids) != test_mask.shape[1]:
+            samplet_ids = None
+        else:
+            samplet_ids = list(samplet_ids)
+
+        store._init_state(dict(format=cfg.columnar_format_version,
+                               result_ids=list(result_ids),
+                               num_rep=int(num_rep),
+                               num_samplets=int(test_mask.shape[1]),
+                               by_samplet=bool(by_samplet),
+                               samplet_ids=samplet_ids,
+                               fields=dict(),
+                               meta=dict(),
+                               meta_arrays=dict()))
+        store.header['test_mask'] = store._save(test_mask)
+
+        return store
+
+
+    def _save(self, array, allow_pickle=False):
+        """Saves an array to a new file in the store, returning its name"""
+
+        file_name = 'array{}.npy'.format(self._num_files())
+        np.save(self.path / file_name, array, allow_pickle=allow_pickle)
+        return file_name
+
+
+    def _new_memmap(self, dtype, shape, fill):
+        """Creates a new array on disk, to be filled in place"""
+
+        file_name = 'array{}.npy'.format(self._num_files())
+        array = open_memmap(self.path / file_name, mode='w+',
+                            dtype=dtype, shape=shape)
+        array[...] = fill
+        return file_name, array
+
+
+    def _num_files(self):
+        """Counter of files in the store, to name the next one"""
+
+        self._file_count = getattr(self, '_file_count', 0) + 1
+        return self._file_count - 1
+
+
+    def write_metrics(self, metric_val):
+        """Writes all the metrics as a single array of [metric, run, dataset]"""
+
+        names = list(metric_val.keys())
+        metrics = np.full((len(names), self.header['num_rep'],
+                           len(self.result_ids)), np.nan)
+        for m_index, name in enumerate(names):
+            for res_id, values in metric_val[name].items():
+                metrics[m_index, :, self.index[res_id]] = values
+
+        self.header['metrics'] = names
+        self.header['metric_values'] = self._save(metrics)
+
+
+    def write_meta(self, meta):
+        """Writes the meta data: arrays to separate files, rest into the header"""
+
+        for name, value in meta.items():
+            if isinstance(value, np.ndarray):
+                self.header['meta_arrays'][name] = self._save(value)
+            else:
+                try:
+                    self.header['meta'][name] = json.loads(
+                            json.dumps(value, default=_to_json))
+                except (TypeError, ValueError):
+                    self.header['meta'][name] = str(value)
+
+
+    def write_samplet_field(self, name, values):
+        """Writes a field with a value per test samplet, keyed by (result, run)"""
+
+        if isinstance(values, SampletField) and values.values is not None and \
+                values.result_ids == self.result_ids and \
+                np.array_equal(values.test_mask, self.test_mask):
+            # already in the same layout
+            self.header['fields'][name] = dict(
+                    kind='samplet', file=self._save(values.values),
+                    present=self._save(values.present),
+                    value_dtype=values.value_dtype.str,
+                    classes=values.classes)
+            return
+
+        values = {key: np.asarray(val) for key, val in values.items()
+                  if val is not None}
+        if not values:
+            return
+
+        value_dtype = np.result_type(*values.values())
+        if value_dtype.kind in 'biuf':
+            classes, dtype, fill = None, np.float64, np.nan
+        else:
+            classes = np.unique(np.concatenate([np.ravel(val)
+                                                for val in values.values()]))
+            dtype, fill = np.int32, -1
+
+        test_mask = self.test_mask
+        value_shape = next(iter(values.values())).shape[1:]
+        shape = (self.header['num_rep'], len(self.result_ids),
+                 test_mask.shape[1]) + value_shape
+        file_name, array = self._new_memmap(dtype, shape, fill)
+        present = np.zeros(shape[:2], dtype=bool)
+        for (res_id, run), val in values.items():
+            ds_index = self.index[res_id]
+            if classes is not None:
+                val = np.searchsorted(classes, val)
+            array[run, ds_index, test_mask[run]] = val
+            present[run, ds_index] = True
+        array.flush()
+        del array
+
+        self.header['fields'][name] = dict(
+                kind='samplet', file=file_name,
+                present=self._save(present),
+                value_dtype=value_dtype.str,
+                classes=classes.tolist() if classes is not None else None)
+
+
+    def write_dense_field(self, name, values):
+        """Writes a field with values of any shape, keyed by (result, run),
+        separately for each dataset"""
+
+        num_rep = self.header['num_rep']
+        present = np.zeros((num_rep, len(self.result_ids)), dtype=bool)
+        files, pickled = list(), list()
+        for ds_index, res_id in enumerate(self.result_ids):
+            ds_values = {run: np.asarray(val) for (rid, run), val in values.items()
+                         if rid == res_id and val is not None}
+            if not ds_values:
+                files.append(None)
+                pickled.append(False)
+                continue
+
+            present[list(ds_values.keys()), ds_index] = True
+            dtype = np.result_type(*ds_values.values())
+            shapes = set(val.shape for val in ds_values.values())
+            if len(shapes) > 1 or dtype.kind == 'O':
+                # ragged values can not be stacked: read in full, when needed
+                array = np.empty(num_rep, dtype=object)
+                for run, val in ds_values.items():
+                    array[run] = val
+                files.append(self._save(array, allow_pickle=True))
+                pickled.append(True)
+            else:
+                fill = np.nan if dtype.kind in 'fc' else 0
+                file_name, array = self._new_memmap(dtype,
+                                                    (num_rep,) + shapes.pop(),
+                                                    fill)
+                for run, val in ds_values.items():
+                    array[run] = val
+                array.flush()
+                del array
+                files.append(file_name)
+                pickled.append(False)
+
+        self.header['fields'][name] = dict(kind='dense', files=files,
+                                           pickled=pickled,
+                                           present=self._save(present))
+
+
+    def finalize(self, **info):
+        """Writes the header, along with any other info given, to complete the
+        store. Header is written last, and atomically, to never leave behind a
+        store that looks complete but is not."""
+
+        self.header.update(info)
+        header_path = self.path / cfg.columnar_header_name
+        tmp_path = self.path / '{}.tmp'.format(cfg.columnar_header_name)
+        with open(tmp_path, 'w') as hdr_fid:
+            json.dump(self.header, hdr_fid, default=_to_json)
+        replace(tmp_path, header_path)
+
+
+    def array(self, file_name, pickled=False):
+        """Array stored in a given file, memory-mapped on first access"""
+
+        if file_name not in self._arrays:
+            if pickled:
+                self._arrays[file_name] = np.load(self.path / file_name,
+                                                  allow_pickle=True)
+            else:
+                self._arrays[file_name] = np.load(self.path / file_name,
+                                                  mmap_mode='r')
+        return self._arrays[file_name]
+
+
+    @property
+    def test_mask(self):
+        """Boolean array of [run, samplet] identifying the test set of each run"""
+
+        return self.array(self.header['test_mask'])
+
+
+    def read_metrics(self):
+        """Reads all the metrics in full, as dict of dicts keyed by name, result"""
+
+        metrics = self.array(self.header['metric_values'])
+        return {name: {res_id: np.array(metrics[m_index, :, ds_index])
+                       for ds_index, res_id in enumerate(self.result_ids)}
+                for m_index, name in enumerate(self.header['metrics'])}
+
+
+    def read_meta(self):
+        """Reads the meta data, with arrays (e.g. split plan) memory-mapped"""
+
+        meta = dict(self.header['meta'])
+        for name, file_name in self.header['meta_arrays'].items():
+            meta[name] = self.array(file_name)
+
+        return meta
+
+
+    def field(self, name):
+        """Lazy, read-only view of a field, keyed by (result, run) as in CVResults.
+        Empty if the field was not saved."""
+
+        if name not in self.header['fields']:
+            return dict()
+
+        spec = self.header['fields'][name]
+        if spec['kind'] == 'samplet':
+            codes = None
+            if spec['classes'] is not None:
+                codes = {label: code for code, label in enumerate(spec['classes'])}
+            return SampletField(self.result_ids, self.test_mask,
+                                values=self.array(spec['file']),
+                                present=self.array(spec['present']),
+                                codes=codes,
+                                value_dtype=spec['value_dtype'])
+
+        return LazyField(self, name)
+
+
+    def read_value(self, name, run, ds_index):
+        """Reads the value of a field stored separately for each dataset"""
+
+        spec = self.header['fields'][name]
+        file_name = spec['files'][ds_index]
+        if spec['pickled'][ds_index]:
+            return self.array(file_name, pickled=True)[run]
+
+        return np.array(self.array(file_name)[run])
+
+
+class SampletField(MutableMapping):
+    """
+    Values of a field with a value per test samplet (e.g. predictions) for all the
+    (result, run) pairs, in a dense array of [run, result, samplet, ...], keyed by
+    (result, run) just like the dicts in CVResults.
+
+    Samplets not in the test set of a run hold NaN, or -1 for categorical values
+    (e.g. class labels), which are stored as codes. Test samplets of each run are
+    identified by a boolean array of [run, samplet], and whether a (result, run)
+    pair has values at all, by another array of [run, result]. Aggregates over
+    samplets are then simple reductions over the arrays, masked by ``tested``.
+
+    The array is allocated when the first value is set, given its shape and type.
+    """
+
+
+    def __init__(self, result_ids, test_mask, values=None, present=None,
+                 codes=None, value_dtype=None):
+        """Constructor."""
+
+        self.result_ids = tuple(result_ids)
+        self._index = {res_id: ix for ix, res_id in enumerate(self.result_ids)}
+        self.test_mask = test_mask
+        self.values = values
+        if present is None:
+            present = np.zeros((test_mask.shape[0], len(self.result_ids)),
+                               dtype=bool)
+        self.present = present
+        # code of each class label, in order, shared by related fields
+        self.codes = codes if codes is not None else dict()
+        self.value_dtype = np.dtype(value_dtype) if value_dtype is not None \
+            else None
 
-                # TODO find ways to refactor, to reduce reuse of above common code
-                # regression specific
-                self.residuals[(ds, run)] = resids[(ds, run)]
 
-                self._count += 1
+    @property
+    def classes(self):
+        """Labels of categorical values, in the order of their codes"""
+
+        if self.values is None or self.values.dtype.kind == 'f':
+            return None
+
+        return list(self.codes.keys())
+
+
+    @property
+    def tested(self):
+        """Boolean array of [run, result, samplet], True where a value exists"""
+
+        return self.present[:, :, np.newaxis] & self.test_mask[:, np.newaxis, :]
+
+
+    def _locate(self, key):
+        """Run and index of the result for a given key"""
+
+        try:
+            res_id, run = key
+            ds_index = self._index[res_id]
+            if not 0 <= run < self.present.shape[0]:
+                raise IndexError()
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise KeyError(key)
+
+        return run, ds_index
+
+
+    def _decode(self, values):
+        """Values in their original form, from the stored ones"""
+
+        if self.classes is not None:
+            values = np.asarray(self.classes)[values]
+
+        return values.astype(self.value_dtype)
+
+
+    def __getitem__(self, key):
+
+        run, ds_index = self._locate(key)
+        if not self.present[run, ds_index]:
+            raise KeyError(key)
+
+        return self._decode(np.array(self.values[run, ds_index][self.test_mask[run]]))
+
+
+    def __setitem__(self, key, value):
+
+        run, ds_index = self._locate(key)
+        value = np.asarray(value)
+        num_tested = np.count_nonzero(self.test_mask[run])
+        if value.ndim < 1 or len(value) != num_tested:
+            raise ValueError('Expecting {} values for run {} - got {}'
+                             ''.format(num_tested, run, value.shape))
+
+        if self.values is None:
+            self._allocate(value)
+        self.value_dtype = np.result_type(self.value_dtype, value.dtype)
+        if self.classes is not None:
+            value = self._encode(value)
+
+        self.values[run, ds_index, self.test_mask[run]] = value
+        self.present[run, ds_index] = True
+
+
+    def __delitem__(self, key):
+
+        run, ds_index = self._locate(key)
+        if not self.present[run, ds_index]:
+            raise KeyError(key)
+        self.values[run, ds_index] = -1 if self.classes is not None else np.nan
+        self.present[run, ds_index] = False
+
+
+    def __iter__(self):
+
+        for run, ds_index in zip(*np.nonzero(self.present)):
+            yield self.result_ids[ds_index], int(run)
+
+
+    def __len__(self):
+
+        return int(np.count_nonzero(self.present))
+
+
+    def _allocate(self, value):
+        """Allocates the array, given the shape and type of the first value"""
+
+        shape = self.present.shape + self.test_mask.shape[1:] + value.shape[1:]
+        if value.dtype.kind in 'biuf':
+            self.values = np.full(shape, np.nan)
+        else:
+            self.values = np.full(shape, -1, dtype=np.int32)
+        self.value_dtype = value.dtype
+
+
+    def _encode(self, value):
+        """Codes for categorical values, adding new labels as they appear"""
+
+        labels, inverse = np.unique(value, return_inverse=True)
+        label_codes = np.empty(len(labels), dtype=np.int32)
+        for index, label in enumerate(labels.tolist()):
+            if label not in self.codes:
+                self.codes[label] = len(self.codes)
+            label_codes[index] = self.codes[label]
+
+        return label_codes[inverse].reshape(value.shape)
+
+
+    def rows(self, result_id):
+        """
+        Values for a given result as rows of (run, samplet) in the order of runs,
+        along with the run and samplet of each row. Values of categorical fields
+        are the codes into their classes.
+        """
+
+        ds_index = self._index[result_id]
+        if self.values is None:
+            empty = np.array([], dtype=np.int32)
+            return empty, empty, np.array([])
+
+        tested = self.present[:, ds_index, np.newaxis] & self.test_mask
+        runs, samplets = np.nonzero(tested)
+        values = np.asarray(self.values[:, ds_index][tested])
+        if self.classes is None:
+            values = values.astype(self.value_dtype)
+
+        return runs.astype(np.int32), samplets.astype(np.int32), values
+
+
+    def unroll(self, result_id):
+        """Values for a given result, concatenated over all runs in their order"""
+
+        ds_index = self._index[result_id]
+        if self.values is None:
+            return np.array([])
+
+        return self._decode(np.asarray(
+                self.values[:, ds_index][self.tested[:, ds_index]]))
+
+
+class LazyField(Mapping):
+    """
+    Read-only view of a field in a ColumnarStore, stored separately for each result
+    and keyed by (result, run) just like the dicts in CVResults, reading the value
+    from disk only when accessed.
+
+    It turns into a regular dict when pickled, e.g. when sent to another process.
+    """
+
+
+    def __init__(self, store, name):
+        """Constructor."""
+
+        self._store = store
+        self._name = name
+        self._present = store.array(store.header['fields'][name]['present'])
+
+
+    def __getitem__(self, key):
+
+        try:
+            res_id, run = key
+            ds_index = self._store.index[res_id]
+            found = run >= 0 and self._present[run, ds_index]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise KeyError(key)
+        if not found:
+            raise KeyError(key)
+
+        return self._store.read_value(self._name, run, ds_index)
+
+
+    def __iter__(self):
+
+        for run, ds_index in zip(*np.nonzero(self._present)):
+            yield self._store.result_ids[ds_index], int(run)
+
+
+    def __len__(self):
+
+        return int(np.count_nonzero(self._present))
+
+
+    def __reduce__(self):
+
+        return dict, (dict(self.items()),)
+
+
+class DerivedField(Mapping):
+    """
+    Read-only view of values derived, when accessed, from the values for the same
+    key in other fields e.g. misclassified samplets from the predictions.
+    """
+
+
+    def __init__(self, func, *fields):
+        """Constructor."""
+
+        self._func = func
+        self._fields = fields
+
+
+    def __getitem__(self, key):
+
+        return self._func(*(field[key] for field in self._fields))
+
+
+    def __iter__(self):
+
+        return iter(self._fields[0])
+
+
+    def __len__(self):
+
+        return len(self._fields[0])
+
+
+    def __reduce__(self):
+
+        return dict, (dict(self.items()),)
+
+
+def open_results(path):
+    """
+    Opens previously saved results, without having to know their type in advance.
+
+    Only the metrics and meta data are read in full. Results saved in columnar
+    layout (refer to ColumnarStore) are memory-mapped, and the heavier fields
+    (predictions, predicted probabilities, feature importance, confusion matrices
+    etc) are read from disk only for the (dataset, run) accessed. Results saved
+    entirely in a pickle, before the columnar layout, are read in full.
+
+    Parameters
+    ----------
+    path : str or Path
+        Output folder of a run of neuropredict, the results file within it, or the
+        folder of results in columnar layout.
+
+    Returns
+    -------
+    results : CVResults
+        Results of the appropriate type, e.g. ClassifyCVResults
+
+    """
+
+    path = Path(path)
+    if path.is_dir() and not (path / cfg.columnar_header_name).exists():
+        path = path / cfg.results_file_name
+
+    columnar_dir = path if path.is_dir() else path.parent / cfg.columnar_results_dir
+    if (columnar_dir / cfg.columnar_header_name).exists():
+        header = ColumnarStore(columnar_dir).header
+        results_class = {cls.__name__: cls
+                         for cls in (ClassifyCVResults, RegressCVResults)}
+        try:
+            return results_class[header['results_class']](path=columnar_dir)
+        except KeyError:
+            raise IOError('Unrecognized type of results in {}: {}'
+                          ''.format(columnar_dir, header.get('results_class')))
+
+    try:
+        with open(path, 'rb') as res_fid:
+            return pickle.load(res_fid)['results']
+    except Exception:
+        raise IOError('Unable to open the results from {}'.format(path))
+
+
+def _samplet_rows(field, res_id, num_rep, test_mask, by_samplet):
+    """
+    Values of a field with a value per test samplet for a single result, as rows
+    of (run, samplet) in the order of runs, along with the run and samplet of each
+    row. Values of categorical fields are codes into the categories returned, which
+    are None otherwise. Samplets are identified by their position in the test set,
+    when the test mask is not by samplet.
+    """
+
+    if isinstance(field, SampletField):
+        runs, samplets, values = field.rows(res_id)
+        return runs, samplets, values, field.classes
+
+    keys = [(res_id, run) for run in range(num_rep) if (res_id, run) in field]
+    if not keys:
+        empty = np.array([], dtype=np.int32)
+        return empty, empty, np.array([]), None
+
+    values = [np.asarray(field[key]) for key in keys]
+    runs = np.concatenate([np.full(len(val), run, dtype=np.int32)
+                           for (_, run), val in zip(keys, values)])
+    samplets = np.concatenate([np.flatnonzero(test_mask[run]) if by_samplet
+                               else np.arange(len(val))
+                               for (_, run), val in zip(keys, values)])
+    values = np.concatenate(values)
+    categories = None
+    if values.dtype.kind not in 'biuf':
+        categories, values = np.unique(values, return_inverse=True)
+        categories, values = categories.tolist(), values.astype(np.int32)
+
+    return runs, samplets.astype(np.int32), values, categories
+
+
+def _write_table(out_dir, table_path, columns):
+    """
+    Writes a table of columns of (name, values, categories) into a folder, each
+    column to a separate .npy file, and returns its spec for the manifest.
+    Categories are either a list, or the name of a list shared in the manifest.
+    """
+
+    table_dir = Path(out_dir) / table_path
+    table_dir.mkdir(parents=True, exist_ok=True)
+    spec = list()
+    for index, (name, values, categories) in enumerate(columns):
+        values = np.ascontiguousarray(values)
+        file_name = 'column{}.npy'.format(index)
+        np.save(table_dir / file_name, values, allow_pickle=False)
+        if categories is not None and not isinstance(categories, str):
+            categories = list(categories)
+        spec.append(dict(name=name, file=file_name, dtype=values.dtype.str,
+                         categories=categories))
+
+    return dict(path=table_path, num_rows=len(columns[0][1]), columns=spec)
+
+
+def _table_to_csv(job):
+    """Writes a table exported in columnar layout to a CSV file next to it, a
+    chunk of rows at a time, reading the columns via memory-mapping."""
+
+    out_dir, spec, shared = job
+    table_dir = Path(out_dir) / spec['path']
+    columns, categories = list(), list()
+    for col in spec['columns']:
+        columns.append(np.load(table_dir / col['file'], mmap_mode='r'))
+        cats = col['categories']
+        if isinstance(cats, str):
+            cats = shared[cats]
+        categories.append(np.array(cats, dtype=object) if cats is not None
+                          else None)
+
+    csv_path = table_dir.with_name('{}.csv'.format(table_dir.name))
+    with open(csv_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file, delimiter=cfg.DELIMITER)
+        writer.writerow([col['name'] for col in spec['columns']])
+        for start in range(0, spec['num_rows'], cfg.export_csv_chunk_size):
+            chunk = list()
+            for values, cats in zip(columns, categories):
+                values = np.asarray(values[start:start + cfg.export_csv_chunk_size])
+                chunk.append(cats[values].tolist() if cats is not None
+                             else values.tolist())
+            writer.writerows(zip(*chunk))
+
+    return csv_path
+
+
+def _attr_field(name):
+    """Name of the field in a ColumnarStore for a given attribute"""
+
+    return 'attr:{}'.format(name)
+
+
+def _misclassified(predicted, true_targets):
+    """Targets of the misclassified samplets, as in ClassifyCVResults"""
+
+    return true_targets[predicted != true_targets]
+
+
+def _metric_func(name):
+    """Function to compute a given metric, from its name, if known"""
+
+    from sklearn import metrics
+
+    for func in cfg.default_metric_set_classification + \
+                cfg.default_metric_set_regression:
+        if func.__name__ == name:
+            return func
 
-        print('  Done.')
+    return getattr(metrics, name, None)
 
 
-    def export(self):
-        """To export results in portable format reusable outside this library"""
+def _to_json(obj):
+    """Converts numpy types and such into their JSON-serializable equivalents"""
+
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=str)
 
-        raise NotImplementedError()
+    raise TypeError('{} is not serializable'.format(type(obj)))
@@ -0,0 +1,787 @@
+"""
+
+Module to speed up hyper-parameter searches: searches within a fixed budget of fits
+or time, reuse of computations across points on the grid (warm-started ensembles,
+regularization paths, precomputed kernels), and caching of the pipeline steps preceding the estimator.
+
+"""
+
+import pickle
+from collections import OrderedDict
+from copy import deepcopy
+from time import perf_counter
+
+import joblib
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid
+
+from neuropredict import config as cfg
+
+
+class BudgetedSearchCV(object):
+    """
+    Searches a parameter grid by sampling candidates from it, until a budget of
+    the number of fits or of wall-clock time runs out. Each fit is one training on
+    one split of the inner CV.
+
+    Candidates are sampled at random, or after the first few random candidates,
+    guided by a surrogate model (a random forest) of the CV score over the grid.
+    The surrogate picks the candidate maximizing an upper confidence bound on the
+    score, balancing exploration of the grid and exploitation of good regions.
+
+    Mimics the part of GridSearchCV interface needed by neuropredict:
+    fit(), best_estimator_, best_params_ and best_score_.
+    """
+
+
+    def __init__(self,
+                 estimator,
+                 param_grid,
+                 cv,
+                 max_fits=cfg.default_max_search_fits,
+                 max_time=cfg.default_max_search_time,
+                 model_based=False,
+                 refit=True,
+                 random_state=None):
+        """Constructor."""
+
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.max_fits = max_fits
+        self.max_time = max_time
+        self.model_based = model_based
+        self.refit = refit
+        self.random_state = random_state
+
+        if self.max_fits is None and self.max_time is None:
+            raise ValueError('Budget for the search must be specified, '
+                             'either in terms of number of fits or time.')
+
+
+    def fit(self, data, targets):
+        """Runs the search for the best parameters on the given data"""
+
+        start_time = perf_counter()
+        rng = np.random.default_rng(self.random_state)
+        splits = list(self.cv.split(data, targets))
+
+        candidates = list(ParameterGrid(self.param_grid))
+        max_candidates = len(candidates)
+        if self.max_fits is not None:
+            max_candidates = max(1, min(max_candidates,
+                                        int(self.max_fits) // len(splits)))
+        encoded = self._encode(candidates) if self.model_based else None
+        # surrogate must get to guide at least half of a small budget
+        num_initial = min(cfg.search_num_initial_random,
+                          max(2, max_candidates // 2))
+
+        untried = list(rng.permutation(len(candidates)))
+        tried, scores = list(), list()
+        self.n_suggested_ = 0
+        while len(tried) < max_candidates:
+            if self.max_time is not None and len(tried) > 0 and \
+                    perf_counter() - start_time > self.max_time:
+                break
+
+            if self.model_based and len(tried) >= num_initial:
+                pick = self._suggest(encoded, tried, scores, untried, rng)
+                self.n_suggested_ += 1
+            else:
+                pick = 0
+            index = untried.pop(pick)
+            tried.append(index)
+            scores.append(self._cv_score(candidates[index], data, targets, splits))
+
+        # failed candidates score NaN, to be ignored unless all of them failed
+        scores = np.array(scores, dtype=float)
+        best = int(np.nanargmax(scores)) if np.any(np.isfinite(scores)) else 0
+
+        self.best_params_ = candidates[tried[best]]
+        self.best_score_ = scores[best]
+        self.n_candidates_ = len(tried)
+        self.n_fits_ = len(tried) * len(splits)
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(
+                    **self.best_params_).fit(data, targets)
+
+        return self
+
+
+    def _cv_score(self, params, data, targets, splits):
+        """Mean score of a candidate over the inner CV splits"""
+
+        fold_scores = list()
+        for train_idx, test_idx in splits:
+            est = clone(self.estimator).set_params(**params)
+            try:
+                est.fit(data[train_idx], targets[train_idx])
+                fold_scores.append(est.score(data[test_idx], targets[test_idx]))
+            except Exception:
+                # invalid combinations of parameters are not unusual in grids
+                return np.nan
+
+        return np.mean(fold_scores)
+
+
+    def _encode(self, candidates):
+        """Encodes the candidates numerically as the index of each parameter value
+        in its range, to be usable as features of the surrogate model."""
+
+        grids = self.param_grid if isinstance(self.param_grid, (list, tuple)) \
+            else [self.param_grid, ]
+        names = sorted(set(name for grid in grids for name in grid))
+        value_lists = dict()
+        for name in names:
+            value_lists[name] = list()
+            for grid in grids:
+                value_lists[name].extend(grid.get(name, []))
+
+        def position(name, value):
+            for pos, val in enumerate(value_lists[name]):
+                if val is value or (type(val) == type(value) and val == value):
+                    return pos
+            return -1
+
+        return np.array([[position(name, cand[name]) if name in cand else -1
+                          for name in names] for cand in candidates], dtype=float)
+
+
+    def _suggest(self, encoded, tried, scores, untried, rng):
+        """Position in untried of the candidate with the highest upper bound on the
+        score predicted by the surrogate, among a random sample of the untried."""
+
+        from sklearn.ensemble import RandomForestRegressor
+
+        scores = np.array(scores, dtype=float)
+        valid = np.isfinite(scores)
+        if valid.sum() < 2:
+            return 0
+
+        surrogate = RandomForestRegressor(n_estimators=cfg.search_surrogate_num_trees,
+                                          min_samples_leaf=2,
+                                          random_state=self.random_state)
+        surrogate.fit(encoded[np.array(tried)[valid]], scores[valid])
+
+        pool = rng.permutation(len(untried))[:cfg.search_surrogate_pool_size]
+        pool_features = encoded[np.array(untried)[pool]]
+        per_tree = np.array([tree.predict(pool_features)
+                             for tree in surrogate.estimators_])
+        upper_bound = per_tree.mean(axis=0) + \
+                      cfg.search_exploration_weight * per_tree.std(axis=0)
+
+        return int(pool[np.argmax(upper_bound)])
+
+
+def _num_trees_path(pipeline, param_grid):
+    """
+    Returns the name of the n_estimators parameter and its sorted values, if the
+    final estimator of the pipeline can be grown through them via warm start, and
+    None otherwise.
+    """
+
+    if not cfg.warm_start_n_estimators or not isinstance(param_grid, dict):
+        return None
+
+    est_name, est = pipeline.steps[-1]
+    name = '{}__n_estimators'.format(est_name)
+    if 'warm_start' not in est.get_params(deep=False) or \
+            len(param_grid.get(name, [])) < 2:
+        return None
+
+    return name, sorted(set(param_grid[name]))
+
+
+class WarmStartSearchCV(object):
+    """
+    Grid search for tree ensembles (forests and gradient boosting), growing a
+    single warm-started ensemble through the sorted values of n_estimators on the
+    grid, scoring it at each of them, instead of fitting each one from scratch.
+    The steps preceding the estimator are fit only once for all the values.
+
+    Mimics the part of GridSearchCV interface needed by neuropredict:
+    fit(), best_estimator_, best_params_ and best_score_.
+    """
+
+
+    def __init__(self, estimator, param_grid, cv, refit=True):
+        """Constructor."""
+
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.refit = refit
+
+
+    @staticmethod
+    def supports(pipeline, param_grid):
+        """Checks whether the pipeline can be grown through the values on the grid"""
+
+        return _num_trees_path(pipeline, param_grid) is not None
+
+
+    def fit(self, data, targets):
+        """Runs the search for the best parameters on the given data"""
+
+        path = _num_trees_path(self.estimator, self.param_grid)
+        if path is None:
+            raise ValueError('Grid does not have multiple values of n_estimators, '
+                             'or the estimator does not support warm start.')
+        trees_name, num_trees = path
+        est_name = self.estimator.steps[-1][0]
+
+        grid = dict(self.param_grid)
+        grid.pop(trees_name)
+        candidates = list(ParameterGrid(grid))
+        splits = list(self.cv.split(data, targets))
+
+        # failed fits score NaN, as in GridSearchCV
+        scores = np.full((len(candidates), len(num_trees), len(splits)), np.nan)
+        for split_idx, (train_idx, test_idx) in enumerate(splits):
+            transformed = dict()
+            for cand_idx, params in enumerate(candidates):
+                pipeline = clone(self.estimator).set_params(**params)
+                # steps preceding the estimator may have their own parameters
+                xfm_params = repr(sorted((key, val) for key, val in params.items()
+                                         if not key.startswith(est_name + '__')))
+                try:
+                    if xfm_params not in transformed:
+                        xfm = pipeline[:-1]
+                        transformed[xfm_params] = (
+                            xfm.fit_transform(data[train_idx], targets[train_idx]),
+                            xfm.transform(data[test_idx]))
+                    train_xfm, test_xfm = transformed[xfm_params]
+
+                    est = pipeline.steps[-1][1].set_params(warm_start=True)
+                    for trees_idx, num in enumerate(num_trees):
+                        est.set_params(n_estimators=num)
+                        est.fit(train_xfm, targets[train_idx])
+                        scores[cand_idx, trees_idx, split_idx] = \
+                            est.score(test_xfm, targets[test_idx])
+                except Exception:
+                    continue
+
+        mean_scores = scores.mean(axis=2)
+        if np.any(np.isfinite(mean_scores)):
+            cand_idx, trees_idx = np.unravel_index(np.nanargmax(mean_scores),
+                                                   mean_scores.shape)
+        else:
+            cand_idx, trees_idx = 0, 0
+
+        self.best_params_ = dict(candidates[cand_idx])
+        self.best_params_[trees_name] = num_trees[trees_idx]
+        self.best_score_ = mean_scores[cand_idx, trees_idx]
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(
+                    **self.best_params_).fit(data, targets)
+
+        return self
+
+
+# parameter controlling regularization, and whether larger values regularize more
+_penalty_params = dict(LogisticRegression=('C', False),
+                       Ridge=('alpha', True))
+
+
+def _penalty_path(pipeline, param_grid):
+    """
+    Returns the name of the regularization parameter and its values on the grid,
+    ordered from the strongest to the weakest regularization, if the final
+    estimator of the pipeline can be fit through them in a single sweep, and None
+    otherwise.
+    """
+
+    if not cfg.regularization_path_search or not isinstance(param_grid, dict):
+        return None
+
+    est_name, est = pipeline.steps[-1]
+    if type(est).__name__ not in _penalty_params:
+        return None
+
+    param, larger_is_stronger = _penalty_params[type(est).__name__]
+    name = '{}__{}'.format(est_name, param)
+    if len(param_grid.get(name, [])) < 2:
+        return None
+
+    return name, sorted(set(param_grid[name]), reverse=larger_is_stronger)
+
+
+def _ridge_path_scores(train_data, train_targets, test_data, test_targets, alphas,
+                       fit_intercept=True):
+    """
+    R^2 on the test set of ridge regression for each of the given alphas, all
+    obtained from a single eigendecomposition of the Gram matrix of the training
+    data (or of its covariance matrix, whichever is smaller).
+    """
+
+    from sklearn.metrics import r2_score
+
+    train_data = np.asarray(train_data, dtype=np.float64)
+    train_targets = np.asarray(train_targets, dtype=np.float64)
+    data_mean, target_mean = np.zeros(train_data.shape[1]), 0.0
+    if fit_intercept:
+        data_mean, target_mean = train_data.mean(axis=0), train_targets.mean()
+    train_data = train_data - data_mean
+    test_data = np.asarray(test_data, dtype=np.float64) - data_mean
+    train_targets = train_targets - target_mean
+
+    num_samplets, num_features = train_data.shape
+    if num_samplets <= num_features:
+        # dual form: predictions are test-vs-train kernel times the dual coefs
+        eig_val, eig_vec = np.linalg.eigh(train_data @ train_data.T)
+        proj_test = test_data @ train_data.T @ eig_vec
+    else:
+        eig_val, eig_vec = np.linalg.eigh(train_data.T @ train_data)
+        proj_test = test_data @ eig_vec
+        train_targets = train_data.T @ train_targets
+    proj_targets = eig_vec.T @ train_targets
+
+    scores = list()
+    for alpha in alphas:
+        predicted = proj_test @ (proj_targets / (eig_val + alpha)) + target_mean
+        scores.append(r2_score(test_targets, predicted))
+
+    return scores
+
+
+class PathSearchCV(object):
+    """
+    Grid search for regularized linear models, fitting each of them through the
+    values of regularization on the grid in a single sweep, from the strongest to
+    the weakest, instead of fitting each value from scratch: logistic regression
+    is warm-started from the solution for the previous value, and ridge regression
+    solutions for all values are obtained from a single eigendecomposition.
+    The steps preceding the estimator are fit only once for all the values.
+
+    Mimics the part of GridSearchCV interface needed by neuropredict:
+    fit(), best_estimator_, best_params_ and best_score_.
+    """
+
+
+    def __init__(self, estimator, param_grid, cv, refit=True):
+        """Constructor."""
+
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.refit = refit
+
+
+    @staticmethod
+    def supports(pipeline, param_grid):
+        """Checks whether the pipeline can be fit through the penalties on grid"""
+
+        return _penalty_path(pipeline, param_grid) is not None
+
+
+    def fit(self, data, targets):
+        """Runs the search for the best parameters on the given data"""
+
+        path = _penalty_path(self.estimator, self.param_grid)
+        if path is None:
+            raise ValueError('Grid does not have multiple values of regularization, '
+                             'or the estimator does not support a path.')
+        penalty_name, penalties = path
+        est_name = self.estimator.steps[-1][0]
+        param = penalty_name[len(est_name) + 2:]
+
+        grid = dict(self.param_grid)
+        grid.pop(penalty_name)
+        candidates = list(ParameterGrid(grid))
+        splits = list(self.cv.split(data, targets))
+
+        # failed fits score NaN, as in GridSearchCV
+        scores = np.full((len(candidates), len(penalties), len(splits)), np.nan)
+        for split_idx, (train_idx, test_idx) in enumerate(splits):
+            transformed = dict()
+            for cand_idx, params in enumerate(candidates):
+                pipeline = clone(self.estimator).set_params(**params)
+                # steps preceding the estimator may have their own parameters
+                xfm_params = repr(sorted((key, val) for key, val in params.items()
+                                         if not key.startswith(est_name + '__')))
+                try:
+                    if xfm_params not in transformed:
+                        xfm = pipeline[:-1]
+                        transformed[xfm_params] = (
+                            xfm.fit_transform(data[train_idx], targets[train_idx]),
+                            xfm.transform(data[test_idx]))
+                    train_xfm, test_xfm = transformed[xfm_params]
+
+                    est = pipeline.steps[-1][1]
+                    if 'warm_start' not in est.get_params(deep=False):
+                        scores[cand_idx, :, split_idx] = _ridge_path_scores(
+                                train_xfm, targets[train_idx],
+                                test_xfm, targets[test_idx], penalties,
+                                fit_intercept=est.fit_intercept)
+                        continue
+
+                    est.set_params(warm_start=True)
+                    for penalty_idx, value in enumerate(penalties):
+                        est.set_params(**{param: value})
+                        est.fit(train_xfm, targets[train_idx])
+                        scores[cand_idx, penalty_idx, split_idx] = \
+                            est.score(test_xfm, targets[test_idx])
+                except Exception:
+                    continue
+
+        mean_scores = scores.mean(axis=2)
+        if np.any(np.isfinite(mean_scores)):
+            cand_idx, penalty_idx = np.unravel_index(np.nanargmax(mean_scores),
+                                                     mean_scores.shape)
+        else:
+            cand_idx, penalty_idx = 0, 0
+
+        self.best_params_ = dict(candidates[cand_idx])
+        self.best_params_[penalty_name] = penalties[penalty_idx]
+        self.best_score_ = mean_scores[cand_idx, penalty_idx]
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(
+                    **self.best_params_).fit(data, targets)
+
+        return self
+
+
+# parameters of the kernel, for each kernel supported by the search
+_kernel_param_names = dict(linear=(),
+                           rbf=('gamma',),
+                           poly=('gamma', 'degree', 'coef0'),
+                           sigmoid=('gamma', 'coef0'))
+
+
+def _gram_matrices(kernel, kernel_params, train_data, test_data):
+    """Kernel between the training samples, and between test and training samples"""
+
+    from sklearn.metrics.pairwise import pairwise_kernels
+
+    kernel_params = dict(kernel_params)
+    gamma = kernel_params.get('gamma', None)
+    # resolved exactly as in SVC and SVR; None defaults to 1 / num_features
+    if isinstance(gamma, str):
+        num_features = train_data.shape[1]
+        if gamma == 'scale':
+            data_var = train_data.var()
+            gamma = 1.0 / (num_features * data_var) if data_var != 0 else 1.0
+        else:
+            gamma = 1.0 / num_features
+        kernel_params['gamma'] = gamma
+
+    train_data = np.asarray(train_data, dtype=np.float64)
+    test_data = np.asarray(test_data, dtype=np.float64)
+    return (pairwise_kernels(train_data, metric=kernel, **kernel_params),
+            pairwise_kernels(test_data, train_data, metric=kernel, **kernel_params))
+
+
+class KernelSearchCV(object):
+    """
+    Grid search for kernel machines (SVM, SVR and KernelRidge) on precomputed
+    kernels: Gram matrix of each split of the inner CV is computed once for each
+    distinct kernel (e.g. value of gamma), and is reused for all values of the
+    other parameters (e.g. C), slicing its test-vs-train block for scoring.
+
+    Points on the grid differing only in parameters irrelevant to their kernel
+    (e.g. gamma for a linear kernel) are identical, and are fit only once. Platt
+    scaling for probability estimates is skipped within the search, as it does not
+    affect the default score (accuracy). Only the Gram matrices for a single kernel
+    are held in memory at a time, and the regular GridSearchCV is used when they
+    would exceed cfg.kernel_cache_max_bytes.
+
+    Mimics the part of GridSearchCV interface needed by neuropredict:
+    fit(), best_estimator_, best_params_ and best_score_.
+    """
+
+
+    def __init__(self, estimator, param_grid, cv, refit=True,
+                 max_bytes=cfg.kernel_cache_max_bytes):
+        """Constructor."""
+
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.refit = refit
+        self.max_bytes = max_bytes
+
+
+    @staticmethod
+    def supports(pipeline, param_grid):
+        """Checks whether the final estimator accepts the supported kernels"""
+
+        if not cfg.precomputed_kernel_search or not cfg.kernel_cache_max_bytes or \
+                not isinstance(param_grid, dict):
+            return False
+
+        est_name, est = pipeline.steps[-1]
+        est_params = est.get_params(deep=False)
+        if 'kernel' not in est_params or 'kernel_params' in est_params and \
+                est_params['kernel_params'] is not None:
+            return False
+
+        kernels = param_grid.get('{}__kernel'.format(est_name),
+                                 [est_params['kernel'], ])
+        return all(isinstance(kernel, str) and kernel in _kernel_param_names
+                   for kernel in kernels)
+
+
+    def _group_candidates(self, candidates):
+        """
+        Identifies the steps preceding the estimator, the kernel and the remaining
+        parameters of the estimator that are effective for each candidate.
+        """
+
+        est_name, est = self.estimator.steps[-1]
+        prefix = est_name + '__'
+
+        keys = list()
+        for params in candidates:
+            est_params = est.get_params(deep=False)
+            est_params.update({key[len(prefix):]: val for key, val in params.items()
+                               if key.startswith(prefix)})
+            xfm_key = repr(sorted((key, val) for key, val in params.items()
+                                  if not key.startswith(prefix)))
+            kernel = est_params.pop('kernel')
+            kernel_params = tuple((name, est_params[name])
+                                  for name in _kernel_param_names[kernel])
+            for name in ('gamma', 'degree', 'coef0'):
+                est_params.pop(name, None)
+            keys.append((xfm_key, (kernel, kernel_params),
+                         repr(sorted(est_params.items()))))
+
+        return keys
+
+
+    def fit(self, data, targets):
+        """Runs the search for the best parameters on the given data"""
+
+        from sklearn.model_selection import GridSearchCV
+
+        splits = list(self.cv.split(data, targets))
+        num_bytes = max(8 * len(train_idx) * (len(train_idx) + len(test_idx))
+                        for train_idx, test_idx in splits)
+        if self.max_bytes is not None and num_bytes > self.max_bytes:
+            gs = GridSearchCV(estimator=self.estimator, param_grid=self.param_grid,
+                              cv=splits, refit=self.refit)
+            gs.fit(data, targets)
+            self.best_params_, self.best_score_ = gs.best_params_, gs.best_score_
+            if self.refit:
+                self.best_estimator_ = gs.best_estimator_
+            return self
+
+        est_name = self.estimator.steps[-1][0]
+        candidates = list(ParameterGrid(self.param_grid))
+        keys = self._group_candidates(candidates)
+
+        # distinct fits, grouped by the transformer and the kernel they share
+        groups = OrderedDict()
+        for cand_idx, (xfm_key, kernel_key, est_key) in enumerate(keys):
+            groups.setdefault((xfm_key, kernel_key), OrderedDict()). \
+                setdefault(est_key, cand_idx)
+
+        # failed fits score NaN, as in GridSearchCV
+        scores = dict()
+        self.n_fits_, self.n_gram_ = 0, 0
+        for split_idx, (train_idx, test_idx) in enumerate(splits):
+            transformed = dict()
+            for (xfm_key, (kernel, kernel_params)), fits in groups.items():
+                try:
+                    if xfm_key not in transformed:
+                        xfm = clone(self.estimator).set_params(
+                                **candidates[next(iter(fits.values()))])[:-1]
+                        transformed[xfm_key] = (
+                            xfm.fit_transform(data[train_idx], targets[train_idx]),
+                            xfm.transform(data[test_idx]))
+                    gram_train, gram_test = _gram_matrices(
+                            kernel, kernel_params, *transformed[xfm_key])
+                    self.n_gram_ += 1
+                except Exception:
+                    continue
+
+                for est_key, cand_idx in fits.items():
+                    params = {key[len(est_name) + 2:]: val
+                              for key, val in candidates[cand_idx].items()
+                              if key.startswith(est_name + '__')}
+                    est = clone(self.estimator.steps[-1][1]).set_params(**params)
+                    est.set_params(kernel='precomputed')
+                    if 'probability' in est.get_params(deep=False):
+                        est.set_params(probability=False)
+                    try:
+                        est.fit(gram_train, targets[train_idx])
+                        score = est.score(gram_test, targets[test_idx])
+                    except Exception:
+                        score = np.nan
+                    self.n_fits_ += 1
+                    scores.setdefault((xfm_key, kernel, kernel_params, est_key),
+                                      np.full(len(splits), np.nan))[split_idx] = score
+
+        no_scores = np.full(len(splits), np.nan)
+        mean_scores = np.array([scores.get((xfm_key, ) + kernel_key + (est_key, ),
+                                           no_scores).mean()
+                                for xfm_key, kernel_key, est_key in keys])
+        best_idx = int(np.nanargmax(mean_scores)) \
+            if np.any(np.isfinite(mean_scores)) else 0
+
+        self.best_params_ = dict(candidates[best_idx])
+        self.best_score_ = mean_scores[best_idx]
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(
+                    **self.best_params_).fit(data, targets)
+
+        return self
+
+
+class OOBSearchCV(object):
+    """
+    Searches a parameter grid for bagged ensembles (random forests, extra trees)
+    using their out-of-bag (OOB) estimate of performance, from a single fit of
+    each candidate on the full training set, instead of a fit on each split of an
+    inner CV. The OOB score is accuracy for classifiers and R^2 for regressors,
+    same as their default score() used in other searches.
+
+    Bootstrapping is enabled for all candidates, as OOB samples exist only then.
+    Note the steps preceding the estimator in the pipeline (e.g. supervised feature
+    selection) are fit on all the training samples, including the OOB samples.
+
+    Mimics the part of GridSearchCV interface needed by neuropredict:
+    fit(), best_estimator_, best_params_ and best_score_.
+    """
+
+
+    def __init__(self, estimator, param_grid):
+        """Constructor."""
+
+        self.estimator = estimator
+        self.param_grid = param_grid
+
+
+    @staticmethod
+    def supports(pipeline):
+        """Checks whether the final estimator of a pipeline provides OOB scores"""
+
+        return 'oob_score' in pipeline.steps[-1][1].get_params(deep=False)
+
+
+    def fit(self, data, targets):
+        """Runs the search for the best parameters on the given data"""
+
+        if not self.supports(self.estimator):
+            raise ValueError('Estimator {} does not provide OOB scores!'
+                             ''.format(self.estimator.steps[-1][0]))
+
+        est_name = self.estimator.steps[-1][0]
+        oob_params = {'{}__oob_score'.format(est_name): True,
+                      '{}__bootstrap'.format(est_name): True}
+
+        # forests are grown through the values of n_estimators via warm start
+        grid = dict(self.param_grid)
+        path = _num_trees_path(self.estimator, grid)
+        if path is not None:
+            trees_name, num_trees = path
+            grid.pop(trees_name)
+        else:
+            trees_name, num_trees = None, [None, ]
+
+        self.best_score_ = -np.inf
+        self.best_params_, self.best_estimator_ = None, None
+        self.n_fits_ = 0
+        for params in ParameterGrid(grid):
+            pipeline = clone(self.estimator).set_params(**oob_params, **params)
+            # steps preceding the estimator are fit only once for all the values
+            xfm = pipeline[:-1]
+            train_xfm = xfm.fit_transform(data, targets)
+            pipeline.steps[:-1] = xfm.steps
+            est = pipeline.steps[-1][1]
+            if trees_name is not None:
+                est.set_params(warm_start=True)
+            for num in num_trees:
+                if trees_name is not None:
+                    est.set_params(n_estimators=num)
+                est.fit(train_xfm, targets)
+                self.n_fits_ += 1
+                score = est.oob_score_
+                # best candidate is already fit on the full training set
+                if self.best_estimator_ is None or score > self.best_score_:
+                    self.best_score_ = score
+                    self.best_params_ = dict(params)
+                    if trees_name is not None:
+                        self.best_params_[trees_name] = num
+                    # copy, as the same ensemble continues to grow
+                    self.best_estimator_ = deepcopy(pipeline) \
+                        if trees_name is not None else pipeline
+
+        if self.best_estimator_ is not None and trees_name is not None:
+            self.best_estimator_.steps[-1][1].set_params(warm_start=False)
+
+        return self
+
+
+class TransformerCache(object):
+    """
+    In-memory cache of fitted transformers (e.g. dim reducers) and their outputs,
+    to be passed as the memory to an sklearn Pipeline.
+
+    During the hyperparameter search, the transformer is otherwise fit again
+    identically for every point on the grid of the estimator following it. Entries
+    are keyed by the transformer parameters and a fingerprint of the data (hence
+    the fold of inner CV), and the least recently used are evicted once their total
+    size exceeds the limit.
+    """
+
+
+    def __init__(self, max_bytes=cfg.transformer_cache_max_bytes):
+        """Constructor."""
+
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = dict()
+        self._total_bytes = 0
+        self.hits, self.misses = 0, 0
+
+
+    def __deepcopy__(self, memo):
+        """Same instance must be shared by all the clones of a pipeline"""
+        return self
+
+
+    def __getstate__(self):
+        """Cached entries are never pickled e.g. when sent to other processes"""
+
+        state = self.__dict__.copy()
+        state['_entries'], state['_sizes'], state['_total_bytes'] = \
+            OrderedDict(), dict(), 0
+        return state
+
+
+    def cache(self, func):
+        """Wraps the function fitting a transformer in a pipeline, as
+        joblib.Memory.cache() does."""
+
+        def cached_func(transformer, data, targets, *args, **kwargs):
+            # logging messages are irrelevant to the results
+            key = joblib.hash((func.__name__, transformer, data, targets, args,
+                               kwargs.get('params', None)))
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+            self.misses += 1
+            result = func(transformer, data, targets, *args, **kwargs)
+            self._add(key, result)
+            return result
+
+        return cached_func
+
+
+    def _add(self, key, result):
+        """Adds an entry, evicting the least recently used ones as necessary"""
+
+        size = sum(len(pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL))
+                   for item in result)
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = result
+        self._sizes[key] = size
+        self._total_bytes += size
+        while self._total_bytes > self.max_bytes:
+            old_key, _ = self._entries.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(old_key)
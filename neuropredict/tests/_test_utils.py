@@ -1,9 +1,15 @@
 from pathlib import Path
 
 import numpy as np
+from pyradigm import ClassificationDataset
+from pyradigm.multiple import MultiDatasetClassify
+
 from neuropredict import config as cfg
 from neuropredict.utils import chance_accuracy
 
+iris_path = Path(__file__).resolve().parents[2].joinpath(
+        'example_datasets', 'pyradigm', 'iris.MLDataset.pkl')
+
 
 def raise_if_mean_differs_from(accuracy_balanced,
                                class_sizes,
@@ -43,3 +49,18 @@ def remove_neuropredict_results(out_dir):
             rf.unlink()
         except:
             print('Unable to delete {}'.format(rf))
+
+
+def make_multi_dataset(num_modalities=2):
+    """Few copies of the iris dataset with differing features"""
+
+    multi_ds = MultiDatasetClassify()
+    for index in range(num_modalities):
+        ds = ClassificationDataset(dataset_path=iris_path)
+        ds.description = 'iris{}'.format(index)
+        for sid in ds.samplet_ids:
+            ds[sid] = ds[sid] * (index + 1)
+        multi_ds.append(ds, index)
+        multi_ds.set_attr(ds.description, cfg.missing_data_flag_name, False)
+
+    return multi_ds
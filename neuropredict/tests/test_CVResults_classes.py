@@ -1,9 +1,11 @@
+import json
 import pickle
 import numpy as np
 from pathlib import Path
 from os import makedirs
 from neuropredict import config as cfg
-from neuropredict.results import ClassifyCVResults, RegressCVResults
+from neuropredict.results import (CheckpointJournal, ClassifyCVResults,
+                                  RegressCVResults, open_results)
 from neuropredict.visualize import compare_distributions
 from neuropredict.classify import ClassificationWorkflow as ClfWorkflow
 
@@ -85,4 +87,326 @@ def test_regress():
     print()
 
 
+def test_early_stop_ci_and_keep_runs():
+
+    num_rep, ds_ids = 40, ('ds1', 'ds2')
+    results = RegressCVResults(num_rep=num_rep, dataset_ids=ds_ids)
+    rng = np.random.default_rng(cfg.SEED_RANDOM)
+    true_tgts = rng.random(20)
+    for run in range(num_rep):
+        for ds_id, noise in zip(ds_ids, (0.01, 0.5)):
+            predicted = true_tgts + noise * rng.standard_normal(20)
+            results.add(run, ds_id, predicted, true_tgts)
+            results.add_diagnostics(run, ds_id, true_tgts, predicted)
+
+    ci_width = results.median_ci_width(range(num_rep), seed=cfg.SEED_RANDOM)
+    for metric in results.metric_val:
+        if ci_width[(metric, 'ds1')] >= ci_width[(metric, 'ds2')]:
+            raise ValueError('CI of median is not narrower for less noisy data!')
+
+    summary = results.partial_summary([0, 3, 7])
+    if summary['mean_absolute_error']['ds1']['num_runs'] != 3 or \
+            not np.isclose(summary['r2_score']['ds2']['median'],
+                           np.median(results.metric_val['r2_score']['ds2'][[0, 3, 7]])):
+        raise ValueError('partial summary is not over the runs given')
+
+    kept = [5, 1, 30]
+    mae = results.metric_val['mean_absolute_error']['ds2'][kept]
+    results.keep_runs(kept)
+    if results.num_rep != len(kept) or \
+            not np.allclose(results.metric_val['mean_absolute_error']['ds2'], mae) \
+            or set(run for _, run in results.residuals) != set(range(len(kept))):
+        raise ValueError('runs were not retained properly!')
+
+
+
+def test_model_axis():
+
+    num_rep, ds_ids, models = 5, ('ds1', 'ds2'), ('svm', 'randomforestclassifier')
+    results = ClassifyCVResults(num_rep=num_rep, dataset_ids=ds_ids,
+                                model_ids=models)
+    if len(results.result_ids) != len(ds_ids) * len(models):
+        raise ValueError('results not identified by (dataset, model) combos!')
+
+    true_tgts = np.array([0, 1] * 10)
+    for run in range(num_rep):
+        for ds_index, ds_id in enumerate(ds_ids):
+            for model_index, model in enumerate(models):
+                predicted = true_tgts.copy()
+                predicted[:ds_index + 2 * model_index] = 2  # distinct accuracies
+                results.add(run, results.result_id(ds_id, model),
+                            predicted, true_tgts)
+
+    arr, out_ds_ids, out_models = results.to_model_array('accuracy_score')
+    if arr.shape != (num_rep, len(ds_ids), len(models)) or \
+            out_ds_ids != ds_ids or out_models != models:
+        raise ValueError('invalid shape or order of axes for the model array')
+    expected = np.array([[1.0, 0.9], [0.95, 0.85]])
+    if not np.allclose(arr, expected[np.newaxis, :, :]):
+        raise ValueError('values misplaced in the array with a model axis')
+
+
+def test_columnar_round_trip():
+
+    from neuropredict.parallel import SplitPlan
+
+    num_samplets, train_size, num_rep = 30, 20, 6
+    ds_ids, labels = ('ds1', 'ds2'), np.array(['CN', 'AD', 'MCI'])
+    ids = ['sub{}'.format(ix) for ix in range(num_samplets)]
+    plan = SplitPlan(num_samplets, train_size, num_rep, seed=cfg.SEED_RANDOM)
+    rng = np.random.default_rng(cfg.SEED_RANDOM)
+    targets = labels[rng.integers(0, len(labels), num_samplets)]
+
+    clf_res = ClassifyCVResults(num_rep=num_rep, dataset_ids=ds_ids)
+    regr_res = RegressCVResults(num_rep=num_rep, dataset_ids=ds_ids)
+    for res in (clf_res, regr_res):
+        res.add_meta(cfg.split_plan_name, plan.train_idx)
+    # one in dense arrays, other in dicts
+    clf_res.set_test_mask(plan.test_mask())
+    for run in range(num_rep - 1):  # last run missing, as if interrupted
+        _, test_idx = plan.get_indices(run)
+        for ds_index, ds_id in enumerate(ds_ids):
+            true_tgts = targets[test_idx]
+            predicted = labels[rng.integers(0, len(labels), len(test_idx))]
+            clf_res.add(run, ds_id, predicted, true_tgts)
+            clf_res.add_diagnostics(run, ds_id,
+                                    rng.integers(0, 9, (len(labels), len(labels))),
+                                    true_tgts[predicted != true_tgts])
+            clf_res.add_attr(run, ds_id, 'predict_proba',
+                             rng.random((len(test_idx), len(labels))))
+            clf_res.add_attr(run, ds_id, cfg.feat_imp_name,
+                             rng.random(4 + ds_index))
+
+            true_num = rng.random(len(test_idx))
+            predicted_num = true_num + rng.standard_normal(len(test_idx))
+            regr_res.add(run, ds_id, predicted_num, true_num)
+            regr_res.add_diagnostics(run, ds_id, true_num, predicted_num)
+
+    for res, cls, name in ((clf_res, ClassifyCVResults, 'clf'),
+                           (regr_res, RegressCVResults, 'regr')):
+        out_dir = this_dir / 'scratch_columnar' / name
+        res.save_columnar(out_dir, samplet_ids=ids)
+        loaded = cls(path=out_dir)
+        if loaded.predicted_targets[('ds1', 0)].__class__ is not np.ndarray or \
+                not isinstance(np.load(out_dir / 'array0.npy', mmap_mode='r'),
+                               np.memmap):
+            raise ValueError('arrays of results are not memory-mapped')
+
+        fields = ['predicted_targets', 'true_targets'] + \
+                 (['confusion_mat', 'misclfd_samplets'] if name == 'clf'
+                  else ['residuals'])
+        for field in fields:
+            orig, new = getattr(res, field), getattr(loaded, field)
+            if set(orig.keys()) != set(new.keys()):
+                raise ValueError('keys of {} differ after loading'.format(field))
+            for key, val in orig.items():
+                if not np.array_equal(val, new[key]) or \
+                        np.asarray(val).dtype != new[key].dtype:
+                    raise ValueError('{} differ after loading'.format(field))
+        for attr_name, values in res.attr.items():
+            for key, val in values.items():
+                if not np.allclose(val, loaded.attr[attr_name][key]):
+                    raise ValueError('attr {} differ after loading'.format(attr_name))
+
+        for metric, m_val in res.metric_val.items():
+            for ds_id in ds_ids:
+                if not np.allclose(m_val[ds_id], loaded.metric_val[metric][ds_id],
+                                   equal_nan=True):
+                    raise ValueError('metrics differ after loading')
+        if not np.array_equal(loaded.meta[cfg.split_plan_name], plan.train_idx) \
+                or set(loaded.metric_set) != set(res.metric_set):
+            raise ValueError('meta data or metric set differ after loading')
+
+        # e.g. when sent to another process
+        dumped = pickle.loads(pickle.dumps(loaded.true_targets))
+        if len(dumped) != len(res.true_targets) or \
+                not all(np.array_equal(val, dumped[key])
+                        for key, val in res.true_targets.items()):
+            raise ValueError('loaded results can not be pickled')
+
+        opened = open_results(out_dir)
+        metric = 'r2_score' if name == 'regr' else 'balanced_accuracy_score'
+        if not isinstance(opened, cls) or \
+                not isinstance(opened.meta[cfg.split_plan_name], np.memmap) or \
+                not np.allclose(opened.to_array(metric)[0],
+                                loaded.to_array(metric)[0], equal_nan=True):
+            raise ValueError('results not opened lazily with the right type')
+
+        exported = opened.export(out_dir.with_name(name + '_exported'),
+                                 samplet_ids=ids, to_csv=True, num_procs=2)
+        with open(exported / cfg.export_manifest_name) as mf:
+            manifest = json.load(mf)
+        tables = manifest['results'][1]['tables']
+        pred_dir = exported / tables['predictions']['path']
+        columns = {col['name']: np.load(pred_dir / col['file'])
+                   for col in tables['predictions']['columns']}
+        true_col = [col for col in tables['predictions']['columns']
+                    if col['name'] == 'true_targets'][0]
+        if manifest['result_ids'][1] != 'ds2' or \
+                len(columns['run']) != (num_rep - 1) * (num_samplets - train_size) or \
+                not np.array_equal(columns['run'], np.sort(columns['run'])):
+            raise ValueError('predictions not exported properly')
+        true_tgts = columns['true_targets']
+        if name == 'clf':
+            true_tgts = np.array(true_col['categories'])[true_tgts]
+        if not np.array_equal(true_tgts, res.unroll('true_targets', 'ds2')) or \
+                np.array(manifest['samplet_ids'])[columns['samplet'][0]] != \
+                ids[plan.get_indices(0)[1][0]]:
+            raise ValueError('exported predictions differ from the results')
+        csv_lines = (pred_dir.with_name('predictions.csv')).read_text().splitlines()
+        if len(csv_lines) != len(columns['run']) + 1 or \
+                ('residuals' if name == 'regr' else 'predict_proba_AD') \
+                not in csv_lines[0].split(cfg.DELIMITER):
+            raise ValueError('predictions not exported properly to CSV')
+
+
+def test_dense_samplet_arrays():
+
+    from neuropredict.parallel import SplitPlan
+    from neuropredict.results import SampletField
+
+    num_samplets, train_size, num_rep = 40, 25, 8
+    ds_ids, labels = ('ds1', 'ds2'), np.array(['CN', 'AD'])
+    plan = SplitPlan(num_samplets, train_size, num_rep, seed=cfg.SEED_RANDOM)
+    rng = np.random.default_rng(cfg.SEED_RANDOM)
+    targets = labels[rng.integers(0, len(labels), num_samplets)]
+
+    results = ClassifyCVResults(num_rep=num_rep, dataset_ids=ds_ids)
+    results.set_test_mask(plan.test_mask())
+    num_misclfd = np.zeros((len(ds_ids), num_samplets))
+    num_tested = np.zeros((len(ds_ids), num_samplets))
+    for run in range(num_rep):
+        _, test_idx = plan.get_indices(run)
+        for ds_index, ds_id in enumerate(ds_ids):
+            predicted = labels[rng.integers(0, len(labels), len(test_idx))]
+            results.add(run, ds_id, predicted, targets[test_idx])
+            results.add_diagnostics(run, ds_id, None, None)
+            if not np.array_equal(results.predicted_targets[(ds_id, run)],
+                                  predicted):
+                raise ValueError('predictions differ once stored in dense arrays')
+            num_misclfd[ds_index, test_idx] += predicted != targets[test_idx]
+            num_tested[ds_index, test_idx] += 1
+
+    if not isinstance(results.predicted_targets, SampletField) or \
+            results.predicted_targets.values.shape != \
+            (num_rep, len(ds_ids), num_samplets):
+        raise ValueError('predictions are not stored in dense arrays')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = num_misclfd / num_tested
+    if not np.allclose(results.misclassification_rate(), expected,
+                       equal_nan=True):
+        raise ValueError('misclassification rate per samplet is incorrect')
+
+    ds_targets = results.unroll('true_targets', 'ds2')
+    if not np.array_equal(ds_targets, np.concatenate(
+            [targets[plan.get_indices(run)[1]] for run in range(num_rep)])):
+        raise ValueError('values not unrolled in order of runs')
+
+    kept = [6, 2]
+    results.keep_runs(kept)
+    if results.predicted_targets.values.shape[0] != len(kept) or \
+            not np.array_equal(results.true_targets[('ds1', 1)],
+                               targets[plan.get_indices(2)[1]]):
+        raise ValueError('runs were not retained properly in dense arrays')
+
+    plan.keep_runs(kept)
+    plan.extend(num_rep)
+    results.extend(num_rep, test_mask=plan.test_mask())
+    accuracy = results.metric_val['accuracy_score']['ds1']
+    if results.predicted_targets.values.shape[0] != num_rep or \
+            len(results.predicted_targets) != len(kept) * len(ds_ids) or \
+            not np.array_equal(results.true_targets[('ds1', 1)],
+                               targets[plan.get_indices(1)[1]]) or \
+            not np.all(np.isfinite(accuracy[:len(kept)])) or \
+            not np.all(np.isnan(accuracy[len(kept):])):
+        raise ValueError('existing runs were not retained when extending')
+
+    # new datasets, on the same splits
+    results.extend(num_rep, test_mask=plan.test_mask(),
+                   dataset_ids=ds_ids + ('ds3',))
+    record = results.get_record(0, 'ds1')
+    record['dataset_id'] = 'ds3'
+    if results.add_complete_runs([record]) != [0] or \
+            results.add_complete_runs([dict(record, run_id=4)]) != [] or \
+            not np.array_equal(results.predicted_targets[('ds3', 0)],
+                               results.predicted_targets[('ds1', 0)]) or \
+            not np.isnan(results.metric_val['accuracy_score']['ds3'][1]):
+        raise ValueError('datasets were not added properly to existing results')
+
+
+def _append_records(args):
+    """Appends few records to a journal, from a separate process"""
+
+    journal_path, worker = args
+    journal = CheckpointJournal(journal_path)
+    for index in range(20):
+        journal.append(dict(worker=worker, index=index, data=np.ones(500) * worker))
+
+
+def test_checkpoint_journal():
+
+    from multiprocessing import Pool
+
+    out_dir = this_dir / 'scratch_journal'
+    makedirs(out_dir, exist_ok=True)
+    journal = CheckpointJournal(out_dir / cfg.journal_file_name)
+    journal.start(expt_config=dict(name='expt1'))
+
+    num_workers = 4
+    with Pool(processes=num_workers) as pool:
+        pool.map(_append_records, [(journal.path, wk) for wk in range(num_workers)])
+
+    records = journal.resume(expt_config=dict(name='expt1'))
+    if len(records) != 20 * num_workers or \
+            any(not np.all(rec['data'] == rec['worker']) for rec in records):
+        raise ValueError('entries from multiple processes are lost or mixed up')
+    for worker in range(num_workers):
+        indices = [rec['index'] for rec in records if rec['worker'] == worker]
+        if indices != list(range(20)):
+            raise ValueError('entries of a process are not in order written')
+
+    # entry torn by a process killed in the middle of writing it
+    full_size = journal.path.stat().st_size
+    with open(journal.path, 'ab') as jf:
+        jf.write(b'\x10\x00\x00')
+    if len(journal.resume(expt_config=dict(name='expt1'))) != len(records) or \
+            journal.path.stat().st_size != full_size:
+        raise ValueError('incomplete entry at the end is not discarded')
+
+    # corrupt entry: replay stops there
+    with open(journal.path, 'r+b') as jf:
+        jf.seek(full_size - 10)
+        jf.write(b'corrupted!')
+    if len(journal.resume(expt_config=dict(name='expt1'))) != len(records) - 1:
+        raise ValueError('corrupt entry is not detected')
+
+    if journal.resume(expt_config=dict(name='expt2')) or \
+            journal.resume(expt_config=dict(name='expt2')):
+        raise ValueError('records from another experiment must not be replayed')
+
+    # only complete runs are resumed, with the latest record
+    num_rep, ds_ids = 4, ('ds1', 'ds2')
+    results = RegressCVResults(num_rep=num_rep, dataset_ids=ds_ids)
+    true_tgts = np.arange(10.0)
+    for run in range(num_rep):
+        for ds_id in ds_ids:
+            results.add(run, ds_id, true_tgts + run, true_tgts)
+            results.add_diagnostics(run, ds_id, true_tgts, true_tgts + run)
+    journal.start(expt_config=dict(name='expt3'))
+    for run in range(num_rep - 1):
+        results.checkpoint(journal, run)
+    journal.append(results.get_record(num_rep - 1, 'ds1'))  # incomplete run
+    record = results.get_record(0, 'ds2')
+    record['predicted'] = true_tgts
+    journal.append(record)
+
+    resumed = RegressCVResults(num_rep=num_rep, dataset_ids=ds_ids)
+    runs = resumed.add_complete_runs(journal.resume(expt_config=dict(name='expt3')))
+    if runs != list(range(num_rep - 1)) or \
+            not np.array_equal(resumed.predicted_targets[('ds2', 0)], true_tgts) or \
+            not np.array_equal(resumed.residuals[('ds1', 2)], true_tgts * 0 + 2):
+        raise ValueError('runs were not resumed properly from the journal')
+
+
 test_classify()
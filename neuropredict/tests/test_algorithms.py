@@ -0,0 +1,75 @@
+import numpy as np
+from sklearn.datasets import make_classification, make_regression
+from sklearn.feature_selection import VarianceThreshold
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import ParameterGrid
+from sklearn.pipeline import Pipeline
+from sklearn.svm import SVC
+
+from neuropredict import config as cfg
+from neuropredict.algorithms import get_estimator
+from neuropredict.base import BaseWorkflow
+
+hgb_params = ('max_depth', 'max_leaf_nodes', 'min_samples_leaf',
+              'l2_regularization', 'learning_rate')
+
+
+def test_hist_gradient_boosting():
+
+    for est_name, expected_step, make_data in (
+            ('histgradientboostingclassifier', 'hist_gb_clf', make_classification),
+            ('histgradientboostingregressor', 'hist_gb_regr', make_regression)):
+        grid_sizes = dict()
+        for level in ('none', 'light', 'exhaustive'):
+            est, step_name, param_grid = get_estimator(est_name,
+                                                       grid_search_level=level)
+            if step_name != expected_step:
+                raise ValueError('unexpected name for the pipeline step: {}'
+                                 ''.format(step_name))
+            expected_keys = {'{}__{}'.format(step_name, param)
+                             for param in hgb_params}
+            if set(param_grid) != expected_keys:
+                raise ValueError('unexpected parameters in the {} grid: {}'
+                                 ''.format(level, sorted(param_grid)))
+            # number of iterations must be left to early stopping
+            if not est.early_stopping or \
+                    est.max_iter != cfg.hist_boosting_max_iter or \
+                    est.validation_fraction != cfg.hist_boosting_validation_fraction or \
+                    est.n_iter_no_change != cfg.hist_boosting_n_iter_no_change:
+                raise ValueError('early stopping is not set up as configured!')
+            grid_sizes[level] = len(ParameterGrid(param_grid))
+
+        if not grid_sizes['none'] == 1 < grid_sizes['light'] < \
+                grid_sizes['exhaustive']:
+            raise ValueError('grids do not grow with the level of search: {}'
+                             ''.format(grid_sizes))
+
+        data, targets = make_data(n_samples=200, n_features=10, random_state=0)
+        est.fit(data, targets)
+        if not 0 < est.n_iter_ < cfg.hist_boosting_max_iter:
+            raise ValueError('boosting did not stop early: {} iterations'
+                             ''.format(est.n_iter_))
+
+
+def test_feature_importance_of_linear_models():
+
+    data, targets = make_classification(n_samples=200, n_features=10,
+                                        n_informative=5, n_classes=3,
+                                        random_state=0)
+    # signed coefficients of the svm are kept as they were, for binary problems
+    for est_name, est, labels in (('svm', SVC(kernel='linear'), targets > 0),
+                                  ('logisticregression', LogisticRegression(),
+                                   targets > 0),
+                                  ('logisticregression', LogisticRegression(),
+                                   targets)):
+        pipeline = Pipeline([('dim_red', VarianceThreshold()), ('est', est)])
+        pipeline.fit(data, labels)
+        importance = BaseWorkflow._get_feature_importance(est_name, pipeline,
+                                                          data.shape[1])
+        if est_name in cfg.importance_coef_magnitude:
+            expected = np.abs(np.atleast_2d(est.coef_)).mean(axis=0)
+        else:
+            expected = est.coef_[0]
+        if not np.allclose(importance, expected):
+            raise ValueError('unexpected feature importance for {} with {} classes'
+                             ''.format(est_name, len(np.unique(labels))))
@@ -0,0 +1,210 @@
+import os
+import pickle
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from neuropredict import config as cfg
+from neuropredict.parallel import (ComputeBudget, SharedMultiDataset, SplitPlan,
+                                   order_tasks_by_cost)
+from neuropredict.utils import (available_cpu_count, available_memory,
+                                cgroup_cpu_limit, check_num_procs,
+                                peak_memory_usage, reset_peak_memory)
+from neuropredict.tests._test_utils import make_multi_dataset
+
+test_dir = Path(__file__).resolve().parent
+out_dir = test_dir / 'scratch_parallel'
+out_dir.mkdir(exist_ok=True)
+
+
+def test_shared_datasets_match_original():
+
+    multi_ds = make_multi_dataset()
+    ids = multi_ds.samplet_ids
+    shared = SharedMultiDataset(multi_ds, out_dir, samplet_ids=ids)
+    # must survive the trip to a worker process
+    shared = pickle.loads(pickle.dumps(shared))
+
+    train_set, test_set = ids[:50], ids[50:]
+    for (ds_orig, orig), (ds_shr, shr) in zip(
+            multi_ds.get_subsets((train_set, test_set)),
+            shared.get_subsets((train_set, test_set))):
+        if ds_orig != ds_shr:
+            raise ValueError('order of modalities differs!')
+        for (data_orig, tgt_orig), (data_shr, tgt_shr) in zip(orig, shr):
+            if not np.array_equal(data_orig, data_shr) or \
+                    not np.array_equal(tgt_orig, tgt_shr):
+                raise ValueError('shared data differs from the original!')
+
+        if shared.get_attr(ds_shr, cfg.missing_data_flag_name):
+            raise ValueError('dataset attributes were not shared properly')
+
+
+def test_costliest_tasks_first():
+
+    costs = {'small': 10, 'large': 500, 'medium': 100}
+    num_rep = 4
+    tasks = order_tasks_by_cost(range(num_rep), costs)
+
+    if len(tasks) != num_rep * len(costs) or len(set(tasks)) != len(tasks):
+        raise ValueError('some tasks are either missing or repeated!')
+
+    task_costs = [costs[ds_id] for _, ds_id in tasks]
+    if task_costs != sorted(task_costs, reverse=True):
+        raise ValueError('tasks are not in order of decreasing cost!')
+
+    if [run for run, ds_id in tasks if ds_id == 'large'] != list(range(num_rep)):
+        raise ValueError('tasks with same cost are not in order of runs!')
+
+
+def test_split_plan_reproducible():
+
+    num_samplets, train_size, num_rep = 150, 100, 5
+    plan = SplitPlan(num_samplets, train_size, num_rep, seed=cfg.SEED_RANDOM)
+    if plan.train_idx.shape != (num_rep, train_size) or \
+            plan.train_idx.dtype != np.int32:
+        raise ValueError('split plan is not of expected shape and type!')
+
+    # more reps must not alter the existing splits
+    longer = SplitPlan(num_samplets, train_size, 2 * num_rep, seed=cfg.SEED_RANDOM)
+    if not np.array_equal(plan.train_idx, longer.train_idx[:num_rep]):
+        raise ValueError('split plan with the same seed is not reproducible!')
+
+    plan.extend(2 * num_rep)
+    if not np.array_equal(plan.train_idx, longer.train_idx):
+        raise ValueError('extended plan differs from a longer one')
+    # runs retained need not be the first ones e.g. after early stopping
+    plan.keep_runs([7, 2, 4])
+    plan.extend(2 * num_rep)
+    if len({row.tobytes() for row in plan.train_idx}) != 2 * num_rep or \
+            not np.array_equal(plan.train_idx[:3], longer.train_idx[[7, 2, 4]]):
+        raise ValueError('splits were changed or repeated when extending')
+
+    ids = ['id{}'.format(ix) for ix in range(num_samplets)]
+    for run in range(num_rep):
+        train_set, test_set = plan.get_split(run, ids)
+        if len(set(train_set)) != train_size or \
+                set(train_set).intersection(test_set) or \
+                set(train_set).union(test_set) != set(ids):
+            raise ValueError('training and test sets are not complementary!')
+
+
+def test_compute_budget_never_oversubscribes():
+
+    total = 64
+    for num_tasks in (1, 3, 10, 64, 500):
+        for num_threads in (None, 1, 4, 100):
+            budget = ComputeBudget(total, num_tasks, num_samplets=1000,
+                                   num_features=10000, num_fits=500,
+                                   num_threads=num_threads)
+            if budget.num_procs * budget.num_threads > total or \
+                    budget.num_procs > num_tasks:
+                raise ValueError('CPUs are oversubscribed: {}'.format(budget))
+            if budget.num_procs > 1 and budget.search_n_jobs > 1:
+                raise ValueError('workers can not run nested parallel searches')
+
+    # plenty of tasks: one process per CPU, as before
+    budget = ComputeBudget(total, 500, 100, 100, 100)
+    if (budget.num_procs, budget.num_threads) != (total, 1):
+        raise ValueError('processes must be preferred with plenty of tasks')
+
+    # few tasks: the CPUs left over are not left idle
+    budget = ComputeBudget(total, 8, 100, 100, 100)
+    if (budget.num_procs, budget.num_threads) != (8, 8) or \
+            budget.blas_threads != 1:
+        raise ValueError('CPUs left over must go to threads, except for BLAS on '
+                         'small data')
+
+    # processes capped to fit the memory
+    budget = ComputeBudget(total, 500, 100, 100, 100, max_procs=16)
+    if (budget.num_procs, budget.num_threads) != (16, 4):
+        raise ValueError('processes not capped properly')
+
+
+def test_cgroup_cpu_quota():
+
+    def fake_cgroup(name, proc_lines, files):
+        root = out_dir / name
+        for rel_path, contents in files.items():
+            (root / rel_path).parent.mkdir(parents=True, exist_ok=True)
+            (root / rel_path).write_text(contents)
+        proc_cgroup = root / 'proc_self_cgroup'
+        proc_cgroup.write_text('\n'.join(proc_lines))
+        return dict(root=str(root), proc_cgroup=str(proc_cgroup))
+
+    v2 = fake_cgroup('cgroup_v2', ['0::/'], {'cpu.max': '400000 100000',
+                                             'memory.max': str(4 * 2 ** 30),
+                                             'memory.current': str(2 ** 30)})
+    v2_nested = fake_cgroup('cgroup_v2_nested', ['0::/kubepods/pod1'],
+                            {'kubepods/pod1/cpu.max': '150000 100000',
+                             'cpu.max': 'max 100000'})
+    # quota of a parent slice applies to all the cgroups within it
+    v2_parent = fake_cgroup('cgroup_v2_parent', ['0::/user.slice/job/task'],
+                            {'user.slice/job/task/cpu.max': 'max 100000',
+                             'user.slice/job/cpu.max': '300000 100000',
+                             'user.slice/cpu.max': '100000 100000',
+                             'cpu.max': 'max 100000'})
+    v2_unlimited = fake_cgroup('cgroup_v2_max', ['0::/'], {'cpu.max': 'max 100000'})
+    v1 = fake_cgroup('cgroup_v1', ['4:cpu,cpuacct:/docker/abc'],
+                     {'cpu,cpuacct/docker/abc/cpu.cfs_quota_us': '200000',
+                      'cpu,cpuacct/docker/abc/cpu.cfs_period_us': '100000'})
+    v1_unlimited = fake_cgroup('cgroup_v1_unlimited', ['4:cpu:/'],
+                               {'cpu/cpu.cfs_quota_us': '-1',
+                                'cpu/cpu.cfs_period_us': '100000'})
+
+    for paths, expected in ((v2, 4.0), (v2_nested, 1.5), (v2_parent, 1.0),
+                            (v2_unlimited, None),
+                            (v1, 2.0), (v1_unlimited, None)):
+        if cgroup_cpu_limit(**paths) != expected:
+            raise ValueError('CPU quota of cgroup not detected properly')
+
+    meminfo = out_dir / 'meminfo'
+    meminfo.write_text('MemTotal: 67108864 kB\nMemAvailable: 33554432 kB\n')
+    if available_memory(meminfo=str(meminfo), **v2) != (3 * 2 ** 30,
+                                                       'cgroup memory.max') or \
+            available_memory(meminfo=str(meminfo), **v2_unlimited) != \
+            (32 * 2 ** 30, 'MemAvailable'):
+        raise ValueError('memory available under cgroup limit not detected '
+                         'properly')
+
+    num_cpus, source = available_cpu_count()
+    if not 1 <= num_cpus <= os.cpu_count() or not source:
+        raise ValueError('invalid number of available CPUs')
+
+    environ = dict(os.environ)
+    os.environ.update(SLURM_JOBID='1', SLURM_CPUS_PER_TASK='1')
+    try:
+        if available_cpu_count() != (1, 'SLURM job (SLURM_CPUS_PER_TASK)') or \
+                check_num_procs(4, avail_cpu_count=1) != 1:
+            raise ValueError('CPUs assigned to the SLURM job not respected')
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def _task_memory(num_bytes):
+    """Memory needed by a task in a worker, allocating the given number of bytes"""
+
+    baseline = reset_peak_memory()
+    data = np.ones(num_bytes // 8)
+
+    return peak_memory_usage(baseline), data.nbytes
+
+
+def test_task_memory_excludes_parent():
+
+    mib = 2 ** 20
+    # held by the main process, and inherited by the forked workers
+    parent_data = np.ones(200 * mib // 8)
+    with get_context('fork').Pool(processes=1) as pool:
+        (trivial, _), (allocating, num_bytes) = pool.map(_task_memory,
+                                                         (8, 100 * mib))
+    if trivial is None:
+        return  # not measurable on this platform
+
+    if trivial > 50 * mib or not num_bytes <= allocating < num_bytes + 50 * mib:
+        raise ValueError('memory of the task is not measured over its start: '
+                         '{:.0f} MiB and {:.0f} MiB, with {:.0f} MiB held by the '
+                         'parent'.format(trivial / mib, allocating / mib,
+                                         parent_data.nbytes / mib))
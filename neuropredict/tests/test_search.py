@@ -0,0 +1,265 @@
+from contextlib import contextmanager
+
+import numpy as np
+from sklearn.datasets import make_classification, make_regression
+from sklearn.model_selection import GridSearchCV, ParameterGrid, ShuffleSplit
+
+from neuropredict import config as cfg
+from neuropredict.algorithms import get_pipeline, make_pipeline
+from neuropredict.base import BaseWorkflow
+from neuropredict.parallel import SplitPlan
+from neuropredict.search import (BudgetedSearchCV, KernelSearchCV, OOBSearchCV,
+                                 PathSearchCV, TransformerCache, WarmStartSearchCV)
+
+data, targets = make_classification(n_samples=100, n_features=10, random_state=0)
+num_splits = 3
+
+
+@contextmanager
+def opted_in(flag):
+    """Enables one of the faster searches, which are off by default"""
+
+    default = getattr(cfg, flag)
+    setattr(cfg, flag, True)
+    try:
+        yield
+    finally:
+        setattr(cfg, flag, default)
+
+
+def test_fit_budget_respected():
+
+    pipeline, param_grid = make_pipeline('decisiontreeclassifier',
+                                         'variancethreshold', 5, len(targets),
+                                         gs_level='random')
+    for model_based in (False, True):
+        max_fits = 45
+        search = BudgetedSearchCV(pipeline, param_grid,
+                                  cv=ShuffleSplit(n_splits=num_splits,
+                                                  test_size=0.2, random_state=0),
+                                  max_fits=max_fits, model_based=model_based,
+                                  random_state=0)
+        search.fit(data, targets)
+        if search.n_fits_ > max_fits or \
+                search.n_candidates_ != max_fits // num_splits:
+            raise ValueError('budget of fits not respected!')
+        if not np.isfinite(search.best_score_) or \
+                set(search.best_params_) != set(param_grid):
+            raise ValueError('invalid best score or parameters')
+        search.best_estimator_.predict(data)
+
+
+def test_surrogate_used_under_default_budget():
+
+    pipeline, param_grid = make_pipeline('decisiontreeclassifier',
+                                         'variancethreshold', 5, len(targets),
+                                         gs_level='random')
+    search = BudgetedSearchCV(pipeline, param_grid,
+                              cv=ShuffleSplit(n_splits=cfg.INNER_CV_NUM_SPLITS,
+                                              test_size=0.2, random_state=0),
+                              model_based=True, random_state=0)
+    search.fit(data, targets)
+    if search.n_suggested_ < 1 or \
+            search.n_candidates_ > len(ParameterGrid(param_grid)):
+        raise ValueError('surrogate model is never used under the default budget!')
+
+
+def test_halving_search():
+
+    pipeline, _ = make_pipeline('randomforestclassifier', 'variancethreshold', 5,
+                                len(targets), gs_level='halving')
+    # 9 candidates and trees over a factor**2 range: 3 rounds at factor 3
+    param_grid = {'random_forest_clf__n_estimators': [10, 30, 90],
+                  'random_forest_clf__max_depth': [2, 4, None],
+                  'random_forest_clf__min_samples_leaf': [1, 5, 10]}
+    inner_cv = ShuffleSplit(n_splits=num_splits, test_size=0.2)
+    search = BaseWorkflow._halving_search(pipeline, param_grid, inner_cv)
+    if inner_cv.random_state is None:
+        raise ValueError('inner CV must yield the same splits in every round!')
+    search.fit(data, targets)
+    if search.resource != 'random_forest_clf__n_estimators' or \
+            list(search.n_resources_) != [10, 30, 90] or \
+            list(search.n_candidates_) != [9, 3, 1]:
+        raise ValueError('unexpected schedule of resources: {} for candidates {}'
+                         ''.format(search.n_resources_, search.n_candidates_))
+
+    # without trees in the grid, the number of samples is the resource
+    tree, tree_grid = make_pipeline('decisiontreeclassifier', 'variancethreshold',
+                                    5, len(targets), gs_level='halving')
+    search = BaseWorkflow._halving_search(tree, tree_grid, inner_cv)
+    if search.resource != 'n_samples':
+        raise ValueError('number of samples must be the resource without trees')
+
+    # gs_level='halving' must be dispatched onto the halving search
+    dispatched = list()
+    halving_search = BaseWorkflow._halving_search
+
+    def spy(*args):
+        dispatched.append(halving_search(*args))
+        return dispatched[-1]
+
+    BaseWorkflow._halving_search = staticmethod(spy)
+    try:
+        best_model, best_params = BaseWorkflow._optimize_pipeline(
+            pipeline, data, targets, param_grid, 0.8, gs_level='halving')
+    finally:
+        BaseWorkflow._halving_search = staticmethod(halving_search)
+    if len(dispatched) != 1 or best_model is not dispatched[0].best_estimator_ or \
+            best_params != dispatched[0].best_params_:
+        raise ValueError('halving search was not used for gs_level=halving')
+
+
+def test_seeded_search():
+
+    pipeline, param_grid = make_pipeline('logisticregression', 'variancethreshold',
+                                         5, len(targets), gs_level='exhaustive')
+    for gs_level in ('random', 'bayesian'):
+        best_params = [BaseWorkflow._optimize_pipeline(
+            pipeline, data, targets, param_grid, 0.8, gs_level=gs_level,
+            max_fits=3 * num_splits, random_state=seed)[1] for seed in (7, 7)]
+        if best_params[0] != best_params[1]:
+            raise ValueError('{} search is not reproducible with the same seed: {}'
+                             ''.format(gs_level, best_params))
+
+    class Workflow(object):
+        _split_plan = SplitPlan(len(targets), 80, 3, seed=0)
+
+    seeds = {(run, ds): BaseWorkflow._search_seed(Workflow, run, ds, 'svm')
+             for run in range(3) for ds in ('a', 'b')}
+    if len(set(seeds.values())) != len(seeds) or \
+            seeds[(1, 'b')] != BaseWorkflow._search_seed(Workflow, 1, 'b', 'svm'):
+        raise ValueError('seeds of the search must be distinct across runs and '
+                         'datasets, and stable within them')
+
+
+def test_transformer_cache_lru():
+
+    cache = TransformerCache(max_bytes=10 ** 9)
+    pipeline, _ = make_pipeline('decisiontreeclassifier', 'selectkbest_f_classif',
+                                5, len(targets), memory=cache)
+    for _ in range(3):
+        pipeline.fit(data[:50], targets[:50])
+    if cache.hits != 2 or cache.misses != 1:
+        raise ValueError('fitted transformer is not being reused!')
+
+    # room for only one entry: least recently used must be evicted
+    cache.max_bytes = cache._total_bytes
+    pipeline.fit(data[50:], targets[50:])
+    pipeline.fit(data[:50], targets[:50])
+    if cache.misses != 3 or len(cache._entries) != 1:
+        raise ValueError('least recently used entry was not evicted!')
+
+
+def test_get_pipeline():
+
+    class_sizes = np.bincount(targets)
+    for memory in (None, TransformerCache(max_bytes=10 ** 9)):
+        pipeline, param_grid = get_pipeline(class_sizes, 5, data.shape[1],
+                                            clfr_name='randomforestclassifier',
+                                            gs_level='light', memory=memory)
+        if pipeline.memory is not memory or not param_grid:
+            raise ValueError('pipeline not constructed properly')
+        pipeline.fit(data, targets)
+        pipeline.predict(data)
+
+
+def test_oob_search():
+
+    pipeline, param_grid = make_pipeline('extratreesclassifier', 'variancethreshold',
+                                         5, len(targets), gs_level='light')
+    search = OOBSearchCV(pipeline, param_grid).fit(data, targets)
+    if search.n_fits_ != len(ParameterGrid(param_grid)):
+        raise ValueError('more than one fit per point on the grid!')
+    if not 0.0 <= search.best_score_ <= 1.0:
+        raise ValueError('invalid OOB accuracy')
+    search.best_estimator_.predict(data)
+
+    svm, _ = make_pipeline('svm', 'variancethreshold', 5, len(targets))
+    if OOBSearchCV.supports(svm):
+        raise ValueError('SVM can not be optimized with OOB scores!')
+
+
+def test_faster_searches_opt_in():
+
+    for search, est_name in ((WarmStartSearchCV, 'randomforestclassifier'),
+                             (KernelSearchCV, 'svm'),
+                             (PathSearchCV, 'logisticregression')):
+        pipeline, param_grid = make_pipeline(est_name, 'variancethreshold', 5,
+                                             len(targets), gs_level='light')
+        if search.supports(pipeline, param_grid):
+            raise ValueError('{} must not be used by default'
+                             ''.format(search.__name__))
+
+
+@opted_in('warm_start_n_estimators')
+def test_warm_start_search():
+
+    pipeline, param_grid = make_pipeline('randomforestclassifier',
+                                         'variancethreshold', 5, len(targets),
+                                         gs_level='light')
+    if not WarmStartSearchCV.supports(pipeline, param_grid):
+        raise ValueError('random forest must be grown through n_estimators!')
+    search = WarmStartSearchCV(pipeline, param_grid,
+                               cv=ShuffleSplit(n_splits=num_splits, test_size=0.2,
+                                               random_state=0))
+    search.fit(data, targets)
+    best_num, = [val for name, val in search.best_params_.items()
+                 if name.endswith('n_estimators')]
+    if set(search.best_params_) != set(param_grid) or \
+            len(search.best_estimator_.steps[-1][1].estimators_) != best_num:
+        raise ValueError('best estimator does not match the best parameters!')
+    search.best_estimator_.predict(data)
+
+    svm, svm_grid = make_pipeline('svm', 'variancethreshold', 5, len(targets),
+                                  gs_level='light')
+    if WarmStartSearchCV.supports(svm, svm_grid):
+        raise ValueError('SVM has no ensemble to grow!')
+
+
+@opted_in('precomputed_kernel_search')
+def test_precomputed_kernel_search():
+
+    pipeline, param_grid = make_pipeline('svm', 'variancethreshold', 5,
+                                         len(targets), gs_level='light')
+    if not KernelSearchCV.supports(pipeline, param_grid):
+        raise ValueError('SVM grid must be searched on precomputed kernels!')
+    inner_cv = ShuffleSplit(n_splits=num_splits, test_size=0.2, random_state=0)
+    search = KernelSearchCV(pipeline, param_grid, cv=inner_cv).fit(data, targets)
+
+    # Platt scaling does not alter the accuracy
+    pipeline.set_params(svc__probability=False)
+    expected = GridSearchCV(pipeline, param_grid, cv=inner_cv).fit(data, targets)
+    if not np.isclose(search.best_score_, expected.best_score_) or \
+            search.best_params_ != expected.best_params_:
+        raise ValueError('search on precomputed kernels differs from GridSearchCV!')
+    # one Gram matrix per value of gamma, for each split
+    if search.n_gram_ != num_splits * len(param_grid['svc__gamma']):
+        raise ValueError('kernels are not being reused across the grid!')
+    search.best_estimator_.predict_proba(data)
+
+
+@opted_in('regularization_path_search')
+def test_regularization_path_search():
+
+    inner_cv = ShuffleSplit(n_splits=num_splits, test_size=0.2, random_state=0)
+    # wide data, as is typical of connectivity features
+    reg_data, reg_targets = make_regression(n_samples=60, n_features=200,
+                                            noise=1.0, random_state=0)
+    ridge, ridge_grid = make_pipeline('ridge', 'variancethreshold', 5,
+                                      len(reg_targets), gs_level='light')
+    search = PathSearchCV(ridge, ridge_grid, cv=inner_cv).fit(reg_data, reg_targets)
+    expected = GridSearchCV(ridge, ridge_grid, cv=inner_cv).fit(reg_data,
+                                                                reg_targets)
+    if not np.isclose(search.best_score_, expected.best_score_) or \
+            search.best_params_ != expected.best_params_:
+        raise ValueError('ridge path differs from GridSearchCV!')
+
+    logistic, logistic_grid = make_pipeline('logisticregression', 'variancethreshold',
+                                            5, len(targets), gs_level='light')
+    if not PathSearchCV.supports(logistic, logistic_grid):
+        raise ValueError('logistic regression must be fit along the path!')
+    search = PathSearchCV(logistic, logistic_grid, cv=inner_cv).fit(data, targets)
+    if set(search.best_params_) != set(logistic_grid) or \
+            not 0.0 <= search.best_score_ <= 1.0:
+        raise ValueError('invalid best score or parameters')
+    search.best_estimator_.predict_proba(data)
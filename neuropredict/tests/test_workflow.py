@@ -0,0 +1,290 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+from pytest import warns
+
+from neuropredict import config as cfg
+from neuropredict.base import get_workflow_options
+from neuropredict.classify import ClassificationWorkflow, get_parser_classify
+from neuropredict.results import open_results
+from neuropredict.tests._test_utils import make_multi_dataset
+
+test_dir = Path(__file__).resolve().parent
+out_dir = test_dir / 'scratch_workflow'
+
+
+class CountingWorkflow(ClassificationWorkflow):
+    """Keeps track of the (run, dataset) pairs actually evaluated"""
+
+    def _single_run_dataset(self, run_id, ds_id, *args, **kwargs):
+        self.tasks_run.append((run_id, ds_id))
+        return super()._single_run_dataset(run_id, ds_id, *args, **kwargs)
+
+
+class Interrupted(Exception):
+    """Stands in for a crash or a kill of a long run"""
+
+
+class InterruptedWorkflow(CountingWorkflow):
+    """Stops abruptly after completing a given number of repetitions"""
+
+    num_rep_before_crash = 2
+
+    def _single_run_cv(self, run_id=None):
+        if len(self._runs_done) >= self.num_rep_before_crash:
+            raise Interrupted()
+        return super()._single_run_cv(run_id)
+
+
+def make_workflow(out_path, num_rep=4, num_modalities=2, fresh=True,
+                  workflow=CountingWorkflow, **options):
+    """Quick workflow on copies of iris, to be run sequentially"""
+
+    if fresh:
+        shutil.rmtree(out_path, ignore_errors=True)
+    options.setdefault('pred_model', 'decisiontreeclassifier')
+    wf = workflow(make_multi_dataset(num_modalities),
+                  covariates=(),
+                  dim_red_method='variancethreshold',
+                  reduced_dim='all',
+                  num_rep_cv=num_rep,
+                  num_procs=1,
+                  out_dir=out_path,
+                  **options)
+    wf.tasks_run = list()
+
+    return wf
+
+
+def run_workflow(out_path, **kwargs):
+
+    wf = make_workflow(out_path, **kwargs)
+    wf.run()
+
+    return wf
+
+
+def copy_metrics(results):
+    """Copies of all the metric values, which may otherwise be changed in place"""
+
+    return {metric: {res_id: np.array(values) for res_id, values in per_ds.items()}
+            for metric, per_ds in results.metric_val.items()}
+
+
+def test_extend_repetitions():
+
+    out_path = out_dir / 'extend_reps'
+    first = run_workflow(out_path, num_rep=4)
+    before = copy_metrics(first.results)
+    split_plan = np.array(first.results.meta[cfg.split_plan_name])
+    # as if saved by a run on a much larger machine
+    first.num_procs = 64
+    first.save()
+
+    extended = run_workflow(out_path, num_rep=8, fresh=False, extend=True)
+    if sorted({run for run, _ in extended.tasks_run}) != [4, 5, 6, 7]:
+        raise ValueError('only the 4 new repetitions must be run: {}'
+                         ''.format(extended.tasks_run))
+    cpu_budget = extended.results.meta[cfg.cpu_budget_name]
+    if extended.num_procs != 1 or cpu_budget['num_procs'] != 1 or \
+            cpu_budget['num_processes'] != 1:
+        raise ValueError('CPUs of the earlier run were used, instead of those '
+                         'requested now: {}'.format(cpu_budget))
+
+    for results in (extended.results, open_results(out_path)):
+        if results.num_rep != 8 or not np.array_equal(
+                np.asarray(results.meta[cfg.split_plan_name])[:4], split_plan):
+            raise ValueError('splits of the first 4 repetitions changed!')
+        for metric, per_ds in before.items():
+            for res_id, values in per_ds.items():
+                if not np.array_equal(results.metric_val[metric][res_id][:4],
+                                      values) or \
+                        not np.all(np.isfinite(results.metric_val[metric][res_id])):
+                    raise ValueError('first 4 repetitions of {} for {} changed, '
+                                     'or new ones are missing!'
+                                     ''.format(metric, res_id))
+
+
+def test_add_modality():
+
+    out_path = out_dir / 'add_modality'
+    first = run_workflow(out_path, num_rep=3, num_modalities=2)
+    before = copy_metrics(first.results)
+    split_plan = np.array(first.results.meta[cfg.split_plan_name])
+
+    extended = run_workflow(out_path, num_rep=3, num_modalities=3, fresh=False,
+                            extend=True)
+    new_id = extended.datasets.modality_ids[-1]
+    if sorted(extended.tasks_run) != [(run, new_id) for run in range(3)]:
+        raise ValueError('only the new modality must be run, for every repetition:'
+                         ' {}'.format(extended.tasks_run))
+
+    for results in (extended.results, open_results(out_path)):
+        if results.num_rep != 3 or not np.array_equal(
+                np.asarray(results.meta[cfg.split_plan_name]), split_plan):
+            raise ValueError('new modality must be run on the same splits!')
+        for metric, per_ds in before.items():
+            if set(results.metric_val[metric]) != set(per_ds) | {new_id}:
+                raise ValueError('new modality is missing from the results')
+            if not np.all(np.isfinite(results.metric_val[metric][new_id])):
+                raise ValueError('new modality was not run on every split')
+            for res_id, values in per_ds.items():
+                if not np.array_equal(results.metric_val[metric][res_id], values):
+                    raise ValueError('results of modality {} changed!'.format(res_id))
+
+
+def interrupt_workflow(out_path, **options):
+    """Runs a workflow until it is interrupted, leaving only its journal behind"""
+
+    interrupted = make_workflow(out_path, num_rep=4, workflow=InterruptedWorkflow,
+                                checkpointing=True, **options)
+    try:
+        interrupted.run()
+    except Interrupted:
+        pass
+    else:
+        raise ValueError('workflow was expected to be interrupted!')
+    if not (out_path / 'temp_dump' / cfg.journal_file_name).exists() or \
+            (out_path / cfg.results_file_name).exists():
+        raise ValueError('interrupted run must leave only a journal behind')
+
+    return interrupted
+
+
+def test_resume_interrupted_run():
+
+    out_path = out_dir / 'resume'
+    # fresh entropy of an unseeded run is recorded in the journal
+    for seed in (cfg.SEED_RANDOM, None):
+        interrupted = interrupt_workflow(out_path, seed=seed)
+        journaled = copy_metrics(interrupted.results)
+        split_plan = np.array(interrupted.results.meta[cfg.split_plan_name])
+
+        resumed = run_workflow(out_path, num_rep=4, fresh=False, checkpointing=True,
+                               seed=seed)
+        if sorted({run for run, _ in resumed.tasks_run}) != [2, 3]:
+            raise ValueError('only the 2 repetitions not in the journal must be '
+                             'run: {}'.format(resumed.tasks_run))
+
+        for results in (resumed.results, open_results(out_path)):
+            if not np.array_equal(results.meta[cfg.split_plan_name], split_plan):
+                raise ValueError('splits of the interrupted run were not resumed')
+            for metric, per_ds in journaled.items():
+                for res_id, values in per_ds.items():
+                    if not np.array_equal(results.metric_val[metric][res_id][:2],
+                                          values[:2]) or \
+                            not np.all(np.isfinite(
+                                    results.metric_val[metric][res_id])):
+                        raise ValueError('repetitions of {} for {} in the journal '
+                                         'were not resumed as they were'
+                                         ''.format(metric, res_id))
+
+    # a journal from different splits must not be silently ignored
+    interrupt_workflow(out_path, seed=None)
+    with warns(UserWarning, match='different'):
+        restarted = run_workflow(out_path, num_rep=4, fresh=False,
+                                 checkpointing=True, seed=cfg.SEED_RANDOM + 1)
+    if sorted({run for run, _ in restarted.tasks_run}) != [0, 1, 2, 3]:
+        raise ValueError('all repetitions must be run again, when the journal is '
+                         'from different splits')
+
+
+def test_early_stopping():
+
+    out_path = out_dir / 'early_stop'
+    min_rep = 3
+    # CI of the median of accuracies is never wider than 1: stops at the minimum
+    wf = run_workflow(out_path, num_rep=8, early_stop_tol=1.0,
+                      early_stop_min_rep=min_rep)
+    if sorted({run for run, _ in wf.tasks_run}) != list(range(min_rep)):
+        raise ValueError('repetitions beyond the minimum were run: {}'
+                         ''.format(wf.tasks_run))
+
+    with open(out_path / cfg.progress_file_name) as pf:
+        progress = json.load(pf)
+    if progress['num_rep_done'] != min_rep:
+        raise ValueError('progress reports {} repetitions, instead of {}'
+                         ''.format(progress['num_rep_done'], min_rep))
+
+    for results in (wf.results, open_results(out_path)):
+        if results.num_rep != min_rep or \
+                results.meta[cfg.num_rep_run_name] != min_rep or \
+                len(results.meta[cfg.split_plan_name]) != min_rep:
+            raise ValueError('results must keep only the repetitions run')
+        for metric, per_ds in results.metric_val.items():
+            for res_id, values in per_ds.items():
+                summary = progress['summary'][metric][str(res_id)]
+                if len(values) != min_rep or not np.all(np.isfinite(values)) or \
+                        summary['num_runs'] != min_rep or \
+                        not np.isclose(summary['median'], np.median(values)):
+                    raise ValueError('{} for {} does not match the repetitions kept'
+                                     ''.format(metric, res_id))
+
+
+def test_multiple_models():
+
+    out_path = out_dir / 'multiple_models'
+    models = ('decisiontreeclassifier', 'logisticregression')
+    wf = run_workflow(out_path, num_rep=3, pred_model=list(models))
+    # preprocessing is shared: each (run, dataset) is evaluated once for all models
+    ds_ids = wf.datasets.modality_ids
+    if sorted(wf.tasks_run) != sorted((run, ds) for run in range(3)
+                                      for ds in ds_ids):
+        raise ValueError('each (run, dataset) must be evaluated exactly once: {}'
+                         ''.format(wf.tasks_run))
+
+    expected_ids = {'{}{}{}'.format(ds, cfg.model_id_separator, model)
+                    for ds in ds_ids for model in models}
+    for results in (wf.results, open_results(out_path)):
+        if tuple(results.model_ids) != models or \
+                set(results.result_ids) != expected_ids:
+            raise ValueError('unexpected result ids: {}'
+                             ''.format(results.result_ids))
+        for metric, per_ds in results.metric_val.items():
+            if set(per_ds) != expected_ids or \
+                    not all(np.all(np.isfinite(values))
+                            for values in per_ds.values()):
+                raise ValueError('{} is missing for some dataset and model'
+                                 ''.format(metric))
+            by_model, array_ds_ids, array_models = results.to_model_array(metric)
+            if by_model.shape != (3, len(ds_ids), len(models)) or \
+                    tuple(array_models) != models:
+                raise ValueError('unexpected shape of {} by model: {}'
+                                 ''.format(metric, by_model.shape))
+            for ds_index, ds in enumerate(array_ds_ids):
+                for model_index, model in enumerate(models):
+                    if not np.array_equal(by_model[:, ds_index, model_index],
+                                          per_ds[results.result_id(ds, model)]):
+                        raise ValueError('{} of {} for {} is mixed up with another'
+                                         ''.format(metric, model, ds))
+
+
+def test_workflow_options_from_cli():
+
+    parser = get_parser_classify()
+    defaults = get_workflow_options(parser.parse_args(['-y', 'dummy']))
+    if defaults['seed'] != cfg.SEED_RANDOM or defaults['extend'] or \
+            defaults['checkpointing'] != cfg.default_checkpointing:
+        raise ValueError('unexpected defaults for the workflow: {}'.format(defaults))
+
+    options = get_workflow_options(parser.parse_args(
+            ['-y', 'dummy', '--seed', 'none', '--early_stop_tol', '0.05',
+             '--early_stop_min_rep', '4', '--max_search_fits', '20', '--extend',
+             '--oob_search', '--num_threads', '1', '--no_checkpointing']))
+    expected = dict(seed=None, early_stop_tol=0.05, early_stop_min_rep=4,
+                    max_search_fits=20, max_search_time=None, oob_search=True,
+                    num_threads=1, checkpointing=False, extend=True)
+    if options != expected:
+        raise ValueError('options were not parsed as given: {}'.format(options))
+    # must be accepted as is by the workflow
+    make_workflow(out_dir / 'cli_options', **options)
+
+    for invalid in (['--seed', 'abc'], ['--max_search_fits', '0']):
+        try:
+            get_workflow_options(parser.parse_args(['-y', 'dummy'] + invalid))
+        except ValueError:
+            pass
+        else:
+            raise ValueError('invalid option {} was accepted'.format(invalid))
@@ -1,5 +1,6 @@
 import pickle
 import re
+import sys
 from collections.abc import Iterable
 from multiprocessing import cpu_count
 from os.path import exists as pexists, join as pjoin, realpath
@@ -200,32 +201,219 @@ def balanced_accuracy(confmat):
     return np.mean(indiv_class_acc)
 
 
-def check_num_procs(requested_num_procs=cfg.DEFAULT_NUM_PROCS):
-    "Ensures num_procs is finite and <= available cpu count."
+def _read_text(path):
+    """Contents of a small text file e.g. from /proc or /sys, or None if unreadable"""
 
-    num_procs = int(requested_num_procs)
-    avail_cpu_count = int(cpu_count())
+    try:
+        with open(path) as text_file:
+            return text_file.read().strip()
+    except (OSError, IOError, UnicodeDecodeError):
+        return None
+
+
+def _cgroup_paths(controller, proc_cgroup='/proc/self/cgroup'):
+    """
+    Candidate paths, relative to the cgroup mount, of the cgroup of this process
+    for a given v1 controller (or of the unified v2 hierarchy, if controller is
+    empty), from the most to the least specific.
+    """
 
+    paths = list()
+    for line in (_read_text(proc_cgroup) or '').splitlines():
+        parts = line.split(':', 2)
+        if len(parts) == 3 and controller in parts[1].split(','):
+            paths.append(parts[2].lstrip('/'))
+    # inside containers, the cgroup of the process is usually at the root
+    paths.append('')
 
-    def get_avail_slot_count(avail_cpu_count=avail_cpu_count):
-        "Method to query HPC-specific number of slots available."
+    return paths
 
-        from os import getenv
 
-        hpc_num_procs_spec = [('SGE',   'JOB_ID',      'NSLOTS',        'slots'),
-                              ('SLURM', 'SLURM_JOBID', 'SLURM_CPUS_PER_TASK',  'processors'),
-                              ('PBS',   'PBS_JOBID',   'PBS_NUM_PPN',   'processors per node')]
+def cgroup_cpu_limit(root='/sys/fs/cgroup', proc_cgroup='/proc/self/cgroup'):
+    """
+    Number of CPUs available under the CPU quota of the cgroup (v2 or v1) of this
+    process e.g. within docker or kubernetes, or None if not limited.
+    """
+
+    # cgroup v2: "<quota> <period>", with quota being "max" if not limited. Quota
+    #   of every ancestor (e.g. a parent slice) applies too: the least one holds
+    for rel_path in _cgroup_paths('', proc_cgroup):
+        parts = rel_path.split('/') if rel_path else []
+        found, limits = False, list()
+        for depth in range(len(parts), -1, -1):
+            cpu_max = _read_text(pjoin(root, *parts[:depth], 'cpu.max'))
+            if cpu_max is None:
+                continue
+            found = True
+            quota, period = (cpu_max.split() + ['100000'])[:2]
+            if quota != 'max' and float(period) > 0:
+                limits.append(float(quota) / float(period))
+        if found:
+            return min(limits) if len(limits) > 0 else None
+
+    # cgroup v1: quota of -1 implies no limit
+    for v1_dir in ('cpu', 'cpu,cpuacct', 'cpuacct,cpu'):
+        for rel_path in _cgroup_paths('cpu', proc_cgroup):
+            quota = _read_text(pjoin(root, v1_dir, rel_path, 'cpu.cfs_quota_us'))
+            period = _read_text(pjoin(root, v1_dir, rel_path, 'cpu.cfs_period_us'))
+            if quota is not None and period is not None:
+                if int(quota) <= 0 or int(period) <= 0:
+                    return None
+                return int(quota) / int(period)
+
+    return None
+
+
+def available_cpu_count():
+    """
+    Number of CPUs actually available to this process, and its source.
 
-        for hpc_env, id_jobid, var_slot_count, var_descr in hpc_num_procs_spec:
-            if getenv(id_jobid):
-                avail_cpu_count = int(getenv(var_slot_count, cpu_count()))
-                print('{} recognized, job set up with {} {}.'
-                      ''.format(hpc_env, avail_cpu_count, var_descr))
+    Least of the CPU count of the machine, the CPUs this process is allowed to run
+    on (affinity), the CPU quota of its cgroup (containers), and the slots assigned
+    to the job by the HPC scheduler (SGE, SLURM or PBS).
+    """
 
-        return avail_cpu_count
+    import os
 
+    limits = [(int(cpu_count()), 'cpu_count')]
+    try:
+        limits.append((len(os.sched_getaffinity(0)), 'sched_getaffinity'))
+    except (AttributeError, NotImplementedError, OSError):
+        # not available on all platforms e.g. macOS
+        pass
+
+    cgroup_limit = cgroup_cpu_limit()
+    if cgroup_limit is not None:
+        # fractional quota allows some use of an extra CPU
+        limits.append((max(1, int(np.ceil(cgroup_limit))), 'cgroup cpu quota'))
+
+    # source is reported once by the caller e.g. in the summary of the experiment
+    hpc_num_procs_spec = [('SGE', 'JOB_ID', ('NSLOTS',)),
+                          ('SLURM', 'SLURM_JOBID',
+                           ('SLURM_CPUS_PER_TASK', 'SLURM_CPUS_ON_NODE')),
+                          ('PBS', 'PBS_JOBID', ('PBS_NUM_PPN',))]
+    for hpc_env, id_jobid, vars_slot_count in hpc_num_procs_spec:
+        if os.getenv(id_jobid):
+            for var_slot_count in vars_slot_count:
+                if os.getenv(var_slot_count):
+                    slot_count = int(os.getenv(var_slot_count))
+                    limits.append((slot_count, '{} job ({})'.format(
+                            hpc_env, var_slot_count)))
+                    break
+
+    # ties go to the most specific source
+    return min(reversed(limits), key=lambda limit: limit[0])
+
+
+def available_memory(root='/sys/fs/cgroup', proc_cgroup='/proc/self/cgroup',
+                     meminfo='/proc/meminfo'):
+    """
+    Memory (in bytes) available to this process, and its source: least of the
+    memory available on the machine and the room left under the memory limit of
+    its cgroup (v2 or v1, e.g. within docker or kubernetes).
+
+    Returns (None, None) when neither can be determined, e.g. on macOS.
+    """
+
+    limits = list()
+    for line in (_read_text(meminfo) or '').splitlines():
+        if line.startswith('MemAvailable:'):
+            limits.append((int(line.split()[1]) * 1024, 'MemAvailable'))
+
+    for rel_path in _cgroup_paths('', proc_cgroup):
+        mem_max = _read_text(pjoin(root, rel_path, 'memory.max'))
+        if mem_max is not None:
+            if mem_max != 'max':
+                usage = _read_text(pjoin(root, rel_path, 'memory.current')) or 0
+                limits.append((int(mem_max) - int(usage), 'cgroup memory.max'))
+            break
+    else:
+        for rel_path in _cgroup_paths('memory', proc_cgroup):
+            mem_max = _read_text(pjoin(root, 'memory', rel_path,
+                                       'memory.limit_in_bytes'))
+            if mem_max is not None:
+                # no limit is reported as a huge number, close to 2^63
+                if int(mem_max) < 2 ** 60:
+                    usage = _read_text(pjoin(root, 'memory', rel_path,
+                                             'memory.usage_in_bytes')) or 0
+                    limits.append((int(mem_max) - int(usage),
+                                   'cgroup memory.limit_in_bytes'))
+                break
+
+    if len(limits) < 1:
+        return None, None
+
+    return min(limits, key=lambda limit: limit[0])
+
+
+def _proc_status_bytes(field, status='/proc/self/status'):
+    """Memory field (e.g. VmRSS) of the current process in bytes, if available"""
+
+    try:
+        with open(status) as sf:
+            for line in sf:
+                name, _, value = line.partition(':')
+                if name == field:
+                    # reported in kB
+                    return int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
 
-    avail_cpu_count = get_avail_slot_count()
+    return None
+
+
+def reset_peak_memory(clear_refs='/proc/self/clear_refs'):
+    """
+    Resets the peak resident memory of the current process where possible (Linux),
+    and returns its current resident memory in bytes (None if unknown), as the
+    baseline for peak_memory_usage() to measure the increase e.g. during a task.
+    """
+
+    try:
+        with open(clear_refs, 'w') as cf:
+            cf.write('5')
+    except OSError:
+        # peak so far can not be reset: stays the peak over the process lifetime
+        pass
+
+    return _proc_status_bytes('VmRSS')
+
+
+def peak_memory_usage(baseline=None):
+    """
+    Peak resident memory (in bytes) of the current process so far, if known.
+
+    Given a baseline from reset_peak_memory(), returns the increase over it
+    instead. A worker forked from the main process starts off with all the
+    memory of the latter in its resident memory, which would otherwise be counted
+    as if the worker needed it.
+    """
+
+    peak = _proc_status_bytes('VmHWM')
+    if peak is None:
+        try:
+            import resource
+        except ImportError:
+            # not available on Windows
+            return None
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # reported in bytes on macOS, and in kilobytes elsewhere
+        peak = int(peak) if sys.platform == 'darwin' else int(peak) * 1024
+
+    if baseline is not None:
+        return max(0, peak - baseline)
+
+    return peak
+
+
+def check_num_procs(requested_num_procs=cfg.DEFAULT_NUM_PROCS,
+                    avail_cpu_count=None):
+    "Ensures num_procs is finite and <= available cpu count (found if not given)."
+
+    num_procs = int(requested_num_procs)
+    if avail_cpu_count is None:
+        avail_cpu_count, _ = available_cpu_count()
 
     if num_procs < 1 or not np.isfinite(num_procs) or num_procs is None:
         num_procs = avail_cpu_count